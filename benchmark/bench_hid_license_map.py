@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+HID_License_Map 加载耗时对比：逐HID过滤(旧实现) vs 流式单次遍历(HID_License_Map._load)
+--load时对比导入license文件的耗时和内存峰值：pandas整体读取 vs 流式逐行读取 vs HID_License_Map(内存/磁盘索引)
+用法: python -m benchmark.bench_hid_license_map [--rows 1000 10000 100000] [--legacy-max 10000]
+      python -m benchmark.bench_hid_license_map --load --rows 20000 100000
+"""
+import argparse
+import base64
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from dao import HID_License_Map, HID_COLUMN_NAME, TIPS_COLUMNS_NAME, LICENSE_FILE_SHEET_NAME, STORAGE_MEMORY, \
+    STORAGE_DISK, FRAME_CACHE_LAZY, iter_license_rows
+
+COMPONENTS_COLUMNS = ['RTC/03E8', 'POS/03E9', 'NFC/03EA']
+
+
+def make_license_df(rows: int, components_columns=COMPONENTS_COLUMNS) -> pd.DataFrame:
+    """生成rows行的模拟license表，每5行留一个空license"""
+    data = {HID_COLUMN_NAME: [f'{i:016X}' for i in range(rows)],
+            TIPS_COLUMNS_NAME: [''] * rows}
+    for col_idx, column in enumerate(components_columns):
+        data[column] = [None if (i + col_idx) % 5 == 0 else base64.b64encode(os.urandom(96)).decode('utf-8')
+                        for i in range(rows)]
+    return pd.DataFrame(data, dtype=str)
+
+
+def legacy_build_map(df, components_columns) -> dict:
+    """旧实现：每个HID的每个组件列都对整个DataFrame做一次过滤"""
+    hid_license_map = dict()
+    for hid in df[HID_COLUMN_NAME].tolist():
+        component_license_map = dict()
+        for component_name in components_columns:
+            if component_name.find('/') == -1:
+                raise ValueError('license文件中组件列中组件名和组件id需要用斜杠/分隔')
+            component_id = component_name.split('/')[-1]
+            license = df[df[HID_COLUMN_NAME] == hid].iloc[0, ][component_name]
+            if pd.notnull(license):
+                component_license_map.update({component_id: license})
+        hid_license_map.update({hid: component_license_map})
+    return hid_license_map
+
+
+def legacy_load(file_path) -> dict:
+    """旧实现：pandas整体读取后逐HID过滤"""
+    return legacy_build_map(pd.read_csv(file_path, dtype=str), COMPONENTS_COLUMNS)
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    return time.perf_counter() - start, ret
+
+
+def read_excel(file_path):
+    """pandas整体读取，旧实现导入时内存中保留的DataFrame"""
+    return pd.read_excel(file_path, sheet_name=LICENSE_FILE_SHEET_NAME, dtype=str)
+
+
+def iter_rows(file_path) -> int:
+    """只流式读取，不保存数据"""
+    return sum(1 for _ in iter_license_rows(file_path))
+
+
+def measure(func, *args):
+    """返回(耗时, 内存峰值MB, 返回值)，返回值在统计内存峰值时保持引用"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    ret = func(*args)
+    cost = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cost, peak / 2 ** 20, ret
+
+
+def bench_load(rows_list):
+    print(f'{"rows":>8} {"loader":>17} {"seconds":>10} {"peak(MB)":>10}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in rows_list:
+            file_path = Path(tmp_dir, f'hid-license-{rows}.xlsx')
+            make_license_df(rows).to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+            loaders = [('read_excel', read_excel, str(file_path)),
+                       ('iter_license_rows', iter_rows, str(file_path)),
+                       (STORAGE_MEMORY, HID_License_Map, str(file_path), FRAME_CACHE_LAZY, 4096, STORAGE_MEMORY),
+                       (STORAGE_DISK, HID_License_Map, str(file_path), FRAME_CACHE_LAZY, 4096, STORAGE_DISK)]
+            for name, func, *args in loaders:
+                cost, peak, ret = measure(func, *args)
+                print(f'{rows:>8} {name:>17} {cost:>10.2f} {peak:>10.1f}')
+                if isinstance(ret, HID_License_Map):
+                    ret.close()
+                del ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max', type=int, default=10000, help='超过该行数不再运行旧实现(耗时过长)')
+    parser.add_argument('--load', action='store_true', help='对比导入license文件的耗时和内存峰值')
+    args = parser.parse_args()
+
+    if args.load:
+        bench_load(args.rows)
+        return
+    print(f'{"rows":>8} {"legacy(s)":>12} {"stream(s)":>12} {"speedup":>10}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in args.rows:
+            file_path = str(Path(tmp_dir, f'hid-license-{rows}.csv'))
+            make_license_df(rows).to_csv(file_path, index=False)
+            stream_cost, stream_map = timeit(HID_License_Map, file_path)
+            if rows <= args.legacy_max:
+                legacy_cost, legacy_map = timeit(legacy_load, file_path)
+                assert legacy_map == {hid: stream_map.get_license(hid) for hid in stream_map.iter_hids()}
+                print(f'{rows:>8} {legacy_cost:>12.3f} {stream_cost:>12.3f} {legacy_cost / stream_cost:>9.1f}x')
+            else:
+                print(f'{rows:>8} {"skipped":>12} {stream_cost:>12.3f} {"-":>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时：基于 python -X importtime 统计导入耗时，并测量从启动进程到窗口绘制完成的时间
+用法: python -m benchmark.bench_import_time [--module main] [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+IMPORT_TIME_BUDGET = 1.0  # 导入main的耗时上限(秒)
+FIRST_WINDOW_BUDGET = 3.0  # 启动进程到窗口绘制完成的耗时上限(秒)
+FIRST_WINDOW_SCRIPT = '''
+from main import OneOsGui
+gui = OneOsGui()
+gui.window_.update()
+print('window ready', flush=True)
+gui.window_.destroy()
+'''
+
+
+def measure_import_time(module='main') -> dict:
+    """
+    导入module，返回各模块累计导入耗时
+    Returns:
+        {模块名: 累计耗时(秒)}，按 python -X importtime 的输出统计
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    cumulative = dict()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        cumulative[name.strip()] = int(cumulative_us) / 1e6
+    return cumulative
+
+
+def imported_modules(module='main', candidates=('pandas', 'openpyxl', 'serial.tools.list_ports')) -> list:
+    """导入module后，candidates中已经被导入的模块"""
+    code = f'import sys, {module}; print(",".join(m for m in {candidates!r} if m in sys.modules))'
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return [i for i in proc.stdout.strip().split(',') if i]
+
+
+def measure_first_window() -> float:
+    """启动一个新进程创建主窗口，返回从启动进程到窗口绘制完成的耗时(秒)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', FIRST_WINDOW_SCRIPT], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    cost = time.perf_counter() - start
+    proc.wait()
+    if 'window ready' not in line:
+        raise RuntimeError(proc.stderr.read())
+    return cost
+
+
+def has_display() -> bool:
+    return sys.platform == 'win32' or bool(os.environ.get('DISPLAY'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--module', default='main')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    cumulative = measure_import_time(args.module)
+    print(f'import {args.module}: {cumulative.get(args.module, 0):.3f}s (budget {IMPORT_TIME_BUDGET}s)')
+    for name, cost in sorted(cumulative.items(), key=lambda i: i[1], reverse=True)[:args.top]:
+        print(f'{cost:>10.4f}s  {name}')
+    print(f'heavy modules imported at startup: {imported_modules(args.module) or "none"}')
+    if has_display():
+        print(f'time to first window: {measure_first_window():.3f}s (budget {FIRST_WINDOW_BUDGET}s)')
+    else:
+        print('time to first window: skipped (no display)')
+
+
+if __name__ == '__main__':
+    main()
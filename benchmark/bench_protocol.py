@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+协议组装/解析耗时对比：十六进制字符串实现(旧) vs 字节实现(新)，payload为license大小
+用法: python -m benchmark.bench_protocol [--sizes 96 256 1024] [--number 2000]
+"""
+import argparse
+import os
+import timeit
+
+from utils.entities import HEAD, PAYLOAD_LENGTH, PAYLOAD_DATA_, COMMAND, DATA_LENGTH, COMPONENT_ID, DATA, CHECK_SUM
+from utils.convert_utils import strhextobytes, bytestostrhex
+from utils.protocol_utils import encode_frame, decode_frame
+
+
+def legacy_assemble_fixedlength_data(data, length, padding='0'):
+    data = data.lstrip('0x')
+    while len(data) < length:
+        data = padding + data
+    return data
+
+
+def legacy_calc_check_sum(data: str) -> str:
+    res = 0
+    start_idx = 0
+    for i in range(2, len(data) + 1, 2):
+        res += int(data[start_idx:i], 16)
+        start_idx = i
+    return hex(res)[-2:].replace('x', '0').upper()
+
+
+def legacy_build_protocol(data, component_id='0000', command='0002', head='5a'):
+    data_length = legacy_assemble_fixedlength_data(hex(len(component_id + data) // 2), 4)
+    payload_data = command + data_length + component_id + data
+    payload_data_length = legacy_assemble_fixedlength_data(hex(len(payload_data) // 2), 4)
+    check_num = legacy_calc_check_sum(payload_data)
+    return head + payload_data_length + command + data_length + component_id + data + check_num
+
+
+def legacy_parse_protocol(protocol_value: str):
+    protocol_value = protocol_value.lower()
+    fields = [protocol_value[i].upper() for i in (HEAD, PAYLOAD_LENGTH, PAYLOAD_DATA_, COMMAND,
+                                                  DATA_LENGTH, COMPONENT_ID, DATA, CHECK_SUM)]
+    if legacy_calc_check_sum(fields[2]) != fields[7]:
+        raise ValueError('校验和校验不通过')
+    return fields
+
+
+def legacy_round_trip(license_hex):
+    """旧流程：组装十六进制字符串 -> 转bytes发送 -> 收到bytes转十六进制字符串 -> 解析"""
+    frame = strhextobytes(legacy_build_protocol(license_hex, component_id='03E8'))
+    return legacy_parse_protocol(bytestostrhex(frame))
+
+
+def bytes_round_trip(license_bytes):
+    """新流程：直接组装bytes -> 直接解析bytes"""
+    return decode_frame(encode_frame(license_bytes, 0x03E8, 0x0002))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[96, 256, 1024], help='license字节数')
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f'{"bytes":>8} {"hex(us)":>10} {"bytes(us)":>10} {"speedup":>10}')
+    for size in args.sizes:
+        license_bytes = os.urandom(size)
+        license_hex = license_bytes.hex()
+        legacy_cost = timeit.timeit(lambda: legacy_round_trip(license_hex), number=args.number) / args.number
+        bytes_cost = timeit.timeit(lambda: bytes_round_trip(license_bytes), number=args.number) / args.number
+        print(f'{size:>8} {legacy_cost * 1e6:>10.1f} {bytes_cost * 1e6:>10.1f} {legacy_cost / bytes_cost:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
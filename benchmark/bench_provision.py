@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+端到端写license压测：基于虚拟开发板(pty)统计每台设备各阶段耗时的p50/p95/p99、每小时设备数和内存
+结果输出为JSON，可与之前提交的结果对比
+用法:
+    python -m benchmark.bench_provision --devices 200 --components 3 --out bench.json
+    python -m benchmark.bench_provision --ports 4 --compare old.json
+    python -m benchmark.bench_provision --window 4 --transit-delay 0.02  # 流水线写入与停等方式对比
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from threading import Event
+
+from benchmark.bench_hid_license_map import make_license_df
+from dao import HID_License_Map, LICENSE_FILE_SHEET_NAME, FRAME_CACHE_EAGER, FRAME_CACHE_LAZY
+from serial_.pyboard import PyBoard
+from serial_.simulator import BoardSimulator
+from service_.provision import ProvisionEngine
+from utils.file_utils import record_HID_activated, export_HID
+from utils.protocol_utils import parse_protocol, build_protocol, decode_frame, check_frame
+
+ROOT = Path(__file__).parent.parent
+
+
+def percentiles(values) -> dict:
+    """返回 count/mean/p50/p95/p99/max，单位毫秒"""
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    if len(values) > 1:
+        cuts = statistics.quantiles(values, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = values[0]
+    return {'count': len(values), 'mean': statistics.fmean(values) * 1e3, 'p50': p50 * 1e3,
+            'p95': p95 * 1e3, 'p99': p99 * 1e3, 'max': values[-1] * 1e3}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def make_license_map(tmp_dir, devices, components, frame_cache=FRAME_CACHE_EAGER) -> HID_License_Map:
+    """生成license文件并加载"""
+    columns = [f'C{i}/{0x03E8 + i:04X}' for i in range(components)]
+    df = make_license_df(devices, columns)
+    df[columns] = df[columns].fillna(base64.b64encode(os.urandom(96)).decode('utf-8'))  # 每台设备所有组件都有license
+    file_path = Path(tmp_dir, 'hid-license.xlsx')
+    df.to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+    return HID_License_Map(str(file_path), frame_cache)
+
+
+def bench_phases(hid_license_map, hids, hid_filepath, simulator_options) -> dict:
+    """单串口顺序执行完整流程，记录每个阶段耗时"""
+    phases = defaultdict(list)
+
+    def timed(phase, func, *args):
+        start = time.perf_counter()
+        ret = func(*args)
+        phases[phase].append(time.perf_counter() - start)
+        return ret
+
+    with BoardSimulator(hids, **simulator_options) as simulator:
+        start = time.perf_counter()
+        board = timed('open', PyBoard, simulator.port, 115200)
+        devices = 0
+        try:
+            for _ in hids:
+                device_start = time.perf_counter()
+                hid_response = timed('get_hid', board.get_HID)
+                hid = timed('parse_hid', parse_protocol, hid_response).payload_data.data
+                licenses = timed('lookup', hid_license_map.get_license, hid)
+                if_success = True
+                for component_id, license_ in licenses.items():
+                    frame = timed('build_frame', hid_license_map.get_frame, hid, component_id)
+                    timed('build_protocol_hex', build_protocol, frame[9:-1].hex(), component_id, '0002')
+                    timed('send_license', board.send_license, frame)
+                    response = timed('read_response', board.read_frame)
+                    if response is None or not check_frame(timed('parse_response', decode_frame, response),
+                                                           'license_put_response'):
+                        if_success = False
+                if if_success:
+                    timed('record_hid', record_HID_activated, hid, hid_filepath)
+                    devices += 1
+                phases['device'].append(time.perf_counter() - device_start)
+        finally:
+            board.close()
+        cost = time.perf_counter() - start
+    timed('export_hid', export_HID, hid_filepath)
+    return {'devices': devices, 'seconds': cost, 'devices_per_hour': devices / cost * 3600,
+            'phases': {phase: percentiles(values) for phase, values in phases.items()}}
+
+
+def bench_ports(hid_license_map, hids, ports, simulator_options, pipeline_window=1) -> dict:
+    """多串口并行(ProvisionEngine)吞吐量，设备间不等待"""
+    pools = [hids[i::ports] for i in range(ports)]
+    simulators = [BoardSimulator(pool, **simulator_options).start() for pool in pools]
+    done = Event()
+
+    def on_statistics():
+        if len(engine.state.activated_hids) >= len(hids):
+            done.set()
+
+    engine = ProvisionEngine([i.port for i in simulators], 115200, hid_license_map, interval=0,
+                             on_statistics=on_statistics, pipeline_window=pipeline_window)
+    start = time.perf_counter()
+    engine.start()
+    done.wait(timeout=600)
+    cost = time.perf_counter() - start
+    engine.stop()
+    for simulator in simulators:
+        simulator.stop()
+    devices = len(engine.state.activated_hids)
+    return {'ports': ports, 'window': pipeline_window, 'devices': devices, 'seconds': cost,
+            'devices_per_hour': devices / cost * 3600}
+
+
+def bench_pipeline(hid_license_map, hids, window, simulator_options) -> dict:
+    """单串口流水线写入(window帧)与停等方式的吞吐量对比"""
+    stop_and_wait = bench_ports(hid_license_map, hids, 1, simulator_options)
+    pipelined = bench_ports(hid_license_map, hids, 1, simulator_options, pipeline_window=window)
+    return {'stop_and_wait': stop_and_wait, 'pipelined': pipelined,
+            'speedup': pipelined['devices_per_hour'] / stop_and_wait['devices_per_hour']}
+
+
+def compare(result, baseline_path):
+    """与之前的结果对比p50/p95和每小时设备数"""
+    baseline = json.loads(Path(baseline_path).read_text(encoding='utf-8'))
+    print(f'\ncompare with {baseline_path} ({baseline.get("commit")})')
+    for phase, current in result['single_port']['phases'].items():
+        old = baseline.get('single_port', {}).get('phases', {}).get(phase)
+        if not old or not old.get('count') or not current.get('count'):
+            continue
+        print(f'{phase:>20} p50 {old["p50"]:>9.3f} -> {current["p50"]:>9.3f}ms  '
+              f'p95 {old["p95"]:>9.3f} -> {current["p95"]:>9.3f}ms')
+    old_rate = baseline.get('single_port', {}).get('devices_per_hour')
+    if old_rate:
+        print(f'{"devices/hour":>20} {old_rate:>13.0f} -> {result["single_port"]["devices_per_hour"]:.0f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--components', type=int, default=3)
+    parser.add_argument('--ports', type=int, default=0, help='>0时额外测试多串口并行吞吐量')
+    parser.add_argument('--latency', type=float, default=0.0, help='虚拟开发板响应延迟(秒)')
+    parser.add_argument('--chunk-size', type=int, default=0, help='虚拟开发板响应分段字节数')
+    parser.add_argument('--transit-delay', type=float, default=0.0, help='虚拟开发板响应传输延迟(秒)')
+    parser.add_argument('--window', type=int, default=1, help='>1时额外测试流水线写入，最多连续发送的license帧数')
+    parser.add_argument('--frame-cache', choices=(FRAME_CACHE_EAGER, FRAME_CACHE_LAZY), default=FRAME_CACHE_EAGER,
+                        help='license帧在导入时生成(eager)或第一次使用时生成(lazy)')
+    parser.add_argument('--out', help='结果JSON文件')
+    parser.add_argument('--compare', help='对比的历史结果JSON文件')
+    args = parser.parse_args()
+
+    simulator_options = {'latency': args.latency, 'chunk_size': args.chunk_size,
+                         'transit_delay': args.transit_delay}
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        hid_license_map = make_license_map(tmp_dir, args.devices, args.components, args.frame_cache)
+        map_load = time.perf_counter() - start
+        hids = hid_license_map.hids
+        hid_filepath = Path(tmp_dir, 'hids.xlsx')
+        result = {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'args': vars(args),
+            'map_write_and_load_seconds': map_load,
+            'single_port': bench_phases(hid_license_map, hids, hid_filepath, simulator_options),
+        }
+        if args.ports > 0:
+            result['multi_port'] = bench_ports(hid_license_map, hids, args.ports, simulator_options)
+        if args.window > 1:
+            result['pipeline'] = bench_pipeline(hid_license_map, hids, args.window, simulator_options)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['memory'] = {'current_mb': current / 2 ** 20, 'peak_mb': peak / 2 ** 20}
+
+    single_port = result['single_port']
+    print(f'devices {single_port["devices"]}, {single_port["devices_per_hour"]:.0f} devices/hour (single port)')
+    print(f'{"phase":>20} {"count":>7} {"p50(ms)":>10} {"p95(ms)":>10} {"p99(ms)":>10}')
+    for phase, stats in single_port['phases'].items():
+        print(f'{phase:>20} {stats["count"]:>7} {stats["p50"]:>10.3f} {stats["p95"]:>10.3f} {stats["p99"]:>10.3f}')
+    if 'multi_port' in result:
+        multi_port = result['multi_port']
+        print(f'{multi_port["ports"]} ports: {multi_port["devices"]} devices, '
+              f'{multi_port["devices_per_hour"]:.0f} devices/hour')
+    if 'pipeline' in result:
+        pipeline = result['pipeline']
+        print(f'pipeline window {args.window}: {pipeline["stop_and_wait"]["devices_per_hour"]:.0f} -> '
+              f'{pipeline["pipelined"]["devices_per_hour"]:.0f} devices/hour, speedup {pipeline["speedup"]:.2f}x')
+    print(f'memory peak {result["memory"]["peak_mb"]:.1f}MB')
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding='utf-8')
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == '__main__':
+    main()
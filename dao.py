@@ -1,64 +1,284 @@
 # -*- coding: utf-8 -*-
+import csv
+import json
 import os
-import pandas as pd
+import sqlite3
+import tempfile
+import weakref
+from functools import lru_cache
+from itertools import islice
+from pathlib import Path
+from threading import Lock
 
+from utils.convert_utils import b64tobytes
+from utils.entities import ProtocolCommand
 from utils.file_utils import store_HID
+from utils.protocol_utils import encode_frame
 
 
 HID_COLUMN_NAME = '设备HID'
 TIPS_COLUMNS_NAME = '提示'
 LICENSE_FILE_SHEET_NAME = '设备license.xls'
+LICENSE_PUT_REQUEST = int(ProtocolCommand.license_put_request.value, 16)
+# license帧缓存方式
+FRAME_CACHE_EAGER = 'eager'  # 导入时生成所有license帧，license转码错误在导入时即可发现
+FRAME_CACHE_LAZY = 'lazy'  # 第一次使用时生成，LRU缓存最近使用的FRAME_CACHE_SIZE个
+FRAME_CACHE_SIZE = 4096
+# license存储方式
+STORAGE_MEMORY = 'memory'  # 全部license保存在内存中
+STORAGE_DISK = 'disk'  # license保存在磁盘索引(SQLite)中，按HID查询，内存占用不随文件大小增长
+LOAD_CHUNK_SIZE = 10000  # 流式读取license文件时每批处理的行数
+STREAM_SUFFIXES = ('.xlsx', '.xlsm', '.csv')  # 可以流式读取的文件类型，其它类型(.xls)整体读取
+DISK_STORAGE_MIN_SIZE = 50 * 2 ** 20  # license文件达到该大小(字节)时默认使用STORAGE_DISK
 
 
 class DaoException(Exception):
     pass
 
 
+def _cell(value):
+    """单元格值统一为str，空单元格为None(与pandas dtype=str一致)"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value = str(value)
+    return value if value != '' else None
+
+
+def iter_license_rows(file_path, sheet_name=LICENSE_FILE_SHEET_NAME):
+    """
+    逐行读取license文件，第一行为表头，内存中只保留当前行
+    .xlsx使用openpyxl只读模式，.csv使用csv模块，其它格式(.xls)通过pandas整体读取后逐行返回
+    Args:
+        file_path: license文件路径
+        sheet_name: excel中license所在的sheet
+
+    Yields:
+        (单元格值, ...)，空单元格为None，其它值均为str
+    """
+    suffix = Path(file_path).suffix.lower()
+    if suffix == '.csv':
+        with open(file_path, mode='r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.reader(f):
+                yield tuple(_cell(value) for value in row)
+    elif suffix in STREAM_SUFFIXES:
+        from openpyxl import load_workbook  # 延迟导入，加快程序启动
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            if sheet_name not in workbook.sheetnames:
+                raise DaoException(f'Worksheet named \'{sheet_name}\' not found')
+            for row in workbook[sheet_name].iter_rows(values_only=True):
+                yield tuple(_cell(value) for value in row)
+        finally:
+            workbook.close()
+    else:
+        import pandas as pd  # 延迟导入，加快程序启动
+
+        df = pd.read_excel(file_path, sheet_name=sheet_name, dtype=str, header=None)
+        for row in df.itertuples(index=False, name=None):
+            yield tuple(value if pd.notnull(value) else None for value in row)
+
+
+def choose_storage(file_path) -> str:
+    """根据license文件大小选择存储方式"""
+    try:
+        return STORAGE_DISK if os.path.getsize(file_path) >= DISK_STORAGE_MIN_SIZE else STORAGE_MEMORY
+    except OSError:
+        return STORAGE_MEMORY
+
+
+class LicenseIndex:
+    """
+    磁盘上的HID-license索引(SQLite)，按HID查询，线程安全
+    index_path为None时使用临时文件，对象释放时删除；指定index_path且索引与license文件一致时直接复用，不再重新读取
+    """
+
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS licenses (hid TEXT PRIMARY KEY, licenses TEXT NOT NULL) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+    '''
+
+    def __init__(self, index_path=None):
+        self.if_temporary = index_path is None
+        if index_path is None:
+            fd, index_path = tempfile.mkstemp(prefix='license-index-', suffix='.db')
+            os.close(fd)
+        self.index_path = str(index_path)
+        self.__lock = Lock()
+        self.__conn = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.__conn.executescript(self.SCHEMA)
+        self.__finalizer = weakref.finalize(self, self._cleanup, self.__conn, self.index_path, self.if_temporary)
+
+    @staticmethod
+    def _cleanup(conn, index_path, if_temporary):
+        conn.close()
+        if if_temporary:
+            try:
+                os.remove(index_path)
+            except OSError:
+                pass
+
+    def close(self):
+        self.__finalizer()
+
+    def get_meta(self) -> dict:
+        with self.__lock:
+            return dict(self.__conn.execute('SELECT key, value FROM meta').fetchall())
+
+    def reset(self):
+        with self.__lock, self.__conn:
+            self.__conn.execute('DELETE FROM licenses')
+            self.__conn.execute('DELETE FROM meta')
+
+    def add(self, rows) -> None:
+        """添加一批 [(HID, {组件标志: license}), ...]，重复的HID以第一次添加的为准"""
+        with self.__lock, self.__conn:
+            self.__conn.executemany('INSERT OR IGNORE INTO licenses (hid, licenses) VALUES (?, ?)',
+                                    [(hid, json.dumps(licenses, separators=(',', ':'))) for hid, licenses in rows])
+
+    def set_meta(self, meta: dict) -> None:
+        with self.__lock, self.__conn:
+            self.__conn.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                    [(key, str(value)) for key, value in meta.items()])
+
+    def get(self, hid: str) -> dict:
+        with self.__lock:
+            row = self.__conn.execute('SELECT licenses FROM licenses WHERE hid = ?', (hid,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def __len__(self):
+        with self.__lock:
+            return self.__conn.execute('SELECT COUNT(*) FROM licenses').fetchone()[0]
+
+    def iter_hids(self):
+        """按HID顺序分批读取所有HID"""
+        last = ''
+        while True:
+            with self.__lock:
+                chunk = self.__conn.execute('SELECT hid FROM licenses WHERE hid > ? ORDER BY hid LIMIT ?',
+                                            (last, LOAD_CHUNK_SIZE)).fetchall()
+            if not chunk:
+                return
+            yield from (hid for hid, in chunk)
+            last = chunk[-1][0]
+
+
 class HID_License_Map:
 
     __instance = None
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, frame_cache=FRAME_CACHE_LAZY, frame_cache_size=FRAME_CACHE_SIZE,
+                 storage=STORAGE_MEMORY, index_path=None, chunk_size=LOAD_CHUNK_SIZE, on_rows=None):
         self.file_path = file_path  # 映射文件地址
-        self.hids = []
+        self.hids = []  # 文件中的HID(按行，包括重复的)，STORAGE_DISK时为空，使用iter_hids
+        self.hids_counts = 0  # 去重后的HID个数
         self.licenses_counts = 0
-        self.hid_license_map = dict()
+        self.hid_license_map = dict()  # STORAGE_MEMORY时有效
+        self.frame_cache = frame_cache
+        self.storage = storage
+        self.index_path = index_path  # STORAGE_DISK时的索引文件，None为临时文件
+        self.chunk_size = chunk_size
+        self.on_rows = on_rows  # 每读取一批数据行后调用 on_rows(表头, 数据行, 该批第一行的序号)，用于导入时同时校验
+        self.license_index = None  # LicenseIndex，STORAGE_DISK时有效
+        self.frames = dict()  # 预先生成的license帧 {(HID, 组件标志): bytes}，FRAME_CACHE_EAGER且STORAGE_MEMORY时有效
+        self.invalid_licenses = dict()  # 转码失败的license {(HID, 组件标志): 错误信息}，FRAME_CACHE_EAGER时有效
         self._load()
+        if frame_cache == FRAME_CACHE_EAGER:
+            self._build_frames()
+        if frame_cache != FRAME_CACHE_EAGER or storage == STORAGE_DISK:  # 磁盘模式只校验不保存license帧
+            self._build_frame_cached = lru_cache(maxsize=frame_cache_size)(self._build_frame)
 
     def _load(self):
         """
-        读取HID-LICENSE映射文件，以{HID1: {组件标志1: license1,组件标志2: license2, ...},
-                                 HID2: {组件标志1: license1,组件标志2: license2, ...},
-                                 ...}方式存储
+        流式读取HID-LICENSE映射文件，每次处理chunk_size行
+        STORAGE_MEMORY时以{HID1: {组件标志1: license1,组件标志2: license2, ...},
+                          HID2: {组件标志1: license1,组件标志2: license2, ...},
+                          ...}方式存储
+        STORAGE_DISK时写入磁盘索引，索引与文件一致时直接复用
         Returns:
             None
 
         """
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f'{self.file_path} not exists')
+        stat = os.stat(self.file_path)
+        source = {'source': os.path.abspath(self.file_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+        if self.storage == STORAGE_DISK:
+            self.license_index = LicenseIndex(self.index_path)
+            meta = self.license_index.get_meta()
+            if all(meta.get(key) == str(value) for key, value in source.items()):  # 索引与文件一致
+                self.licenses_counts = int(meta['licenses_counts'])
+                self.hids_counts = len(self.license_index)
+                return
+            self.license_index.reset()
         try:
-            df = pd.read_excel(self.file_path, sheet_name=LICENSE_FILE_SHEET_NAME, dtype=str)
+            rows = iter_license_rows(self.file_path)
+            columns = next(rows, None) or ()
+            if HID_COLUMN_NAME not in columns:
+                raise DaoException(f'license文件中缺少{HID_COLUMN_NAME}列')
+            hid_idx = columns.index(HID_COLUMN_NAME)
+            components_columns = [column for column in columns if column is not None and
+                                  column not in (HID_COLUMN_NAME, TIPS_COLUMNS_NAME)]
+            components = list(zip([columns.index(column) for column in components_columns],
+                                  self._parse_component_ids(components_columns)))
+            offset = 0
+            for chunk in iter(lambda: list(islice(rows, self.chunk_size)), []):
+                self._load_chunk(chunk, hid_idx, components)
+                if self.on_rows is not None:
+                    self.on_rows(columns, chunk, offset)
+                offset += len(chunk)
+        except DaoException:
+            raise
         except Exception as e:
             raise DaoException(str(e))
-        self.hids = df[HID_COLUMN_NAME].tolist()
-        components_columns = self._get_components_columns(df)
-        self.licenses_counts = self._calc_license_counts(df, components_columns)
-        for hid in self.hids:
-            component_license_map = dict()
-            for component_name in components_columns:
-                if component_name.find('/') == -1:
-                    raise DaoException('license文件中组件列中组件名和组件id需要用斜杠/分隔')
-                component_id = component_name.split('/')[-1]
-                license = df[df[HID_COLUMN_NAME] == hid].iloc[0,][component_name]
-                if pd.notnull(license):
-                    component_license_map.update({component_id: license})
-            self.hid_license_map.update({hid: component_license_map})
-
-    def _get_components_columns(self, df):
-        """获取组件标识列名称"""
-        columns = df.columns.tolist()
-        components_columns = set(columns) - set([HID_COLUMN_NAME, TIPS_COLUMNS_NAME])
-        return components_columns
+        if self.storage == STORAGE_DISK:
+            self.license_index.set_meta(dict(source, licenses_counts=self.licenses_counts))
+            self.hids_counts = len(self.license_index)
+        else:
+            self.hids_counts = len(self.hid_license_map)
+
+    def _load_chunk(self, chunk, hid_idx, components):
+        """处理一批数据行，重复的HID以第一次出现的行为准"""
+        entries = []
+        for row in chunk:
+            if not any(row):  # 空行
+                continue
+            hid = row[hid_idx] if hid_idx < len(row) else None
+            licenses = {component_id: row[idx] for idx, component_id in components
+                        if idx < len(row) and row[idx] is not None}
+            self.licenses_counts += len(licenses)
+            if self.storage != STORAGE_DISK:
+                self.hids.append(hid)
+            if hid is not None:
+                entries.append((hid, licenses))
+        if self.storage == STORAGE_DISK:
+            self.license_index.add(entries)
+        else:
+            for hid, licenses in entries:
+                self.hid_license_map.setdefault(hid, licenses)
+
+    def iter_hids(self):
+        """所有HID(去重)"""
+        if self.storage == STORAGE_DISK:
+            return self.license_index.iter_hids()
+        return iter(self.hid_license_map)
+
+    def close(self):
+        """STORAGE_DISK时关闭索引，临时索引文件会被删除"""
+        if self.license_index is not None:
+            self.license_index.close()
+
+    @staticmethod
+    def _parse_component_ids(components_columns) -> list:
+        """每个组件列只解析一次组件id，列名格式为 组件名/组件id"""
+        component_ids = []
+        for component_name in components_columns:
+            if component_name.find('/') == -1:
+                raise DaoException('license文件中组件列中组件名和组件id需要用斜杠/分隔')
+            component_ids.append(component_name.split('/')[-1])
+        return component_ids
 
     def get_license(self, hid: str) -> dict:
         """
@@ -70,12 +290,56 @@ class HID_License_Map:
             {组件标志1: license1, 组件标志2: license2, ...}
 
         """
+        if self.storage == STORAGE_DISK:
+            return self.license_index.get(hid)
         licenses = self.hid_license_map.get(hid)
         if licenses:
             return licenses
         else:
             return {}
 
-    def _calc_license_counts(self, df, components_columns):
-        """计算components_columns列非空值个数，即为license个数"""
-        return sum(df[list(components_columns)].notnull().sum())
+    @staticmethod
+    def _build_frame(license_: str, component_id: str) -> bytes:
+        """生成写入license的协议帧"""
+        return encode_frame(b64tobytes(license_), int(component_id, 16), LICENSE_PUT_REQUEST)
+
+    def _build_frames(self):
+        """生成所有license帧，记录转码失败的license；STORAGE_DISK时只校验，不保存license帧"""
+        if_keep = self.storage != STORAGE_DISK
+        for hid in self.iter_hids():
+            for component_id, license_ in self.get_license(hid).items():
+                try:
+                    frame = self._build_frame(license_, component_id)
+                except Exception as e:
+                    self.invalid_licenses[(hid, component_id)] = str(e)
+                    continue
+                if if_keep:
+                    self.frames[(hid, component_id)] = frame
+
+    def get_frame(self, hid: str, component_id: str) -> bytes:
+        """
+        获取hid的组件component_id对应的license帧，可直接写入串口
+        Args:
+            hid: 设备HID
+            component_id: 组件标志
+
+        Returns:
+            bytes, 协议帧
+
+        Raises:
+            DaoException: 没有对应的license或license转码失败
+        """
+        if (hid, component_id) in self.invalid_licenses:
+            raise DaoException(f'{hid} {component_id} license转码错误: {self.invalid_licenses[(hid, component_id)]}')
+        if self.frame_cache == FRAME_CACHE_EAGER and self.storage != STORAGE_DISK:
+            frame = self.frames.get((hid, component_id))
+            if frame is not None:
+                return frame
+            raise DaoException(f'{hid} {component_id} 没有对应的license')
+        license_ = self.get_license(hid).get(component_id)
+        if license_ is None:
+            raise DaoException(f'{hid} {component_id} 没有对应的license')
+        try:
+            return self._build_frame_cached(license_, component_id)
+        except Exception as e:
+            raise DaoException(f'{hid} {component_id} license转码错误: {e}')
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""日志显示：环形缓冲区保存最近的日志行，Text控件中只保留缓冲区内的内容，完整历史记录通过日志文件查找"""
+import tkinter as tk
+from collections import deque
+
+LOG_MAX_LINES = 5000  # 日志显示最多保留的行数
+LOG_TRIM_BATCH = 500  # 超出上限该行数后，批量删除最早的日志
+
+
+class LogBuffer:
+    """
+    日志行环形缓冲区，行数超过 max_lines + trim_batch 时一次删除最早的行，保留max_lines行
+    最后一行为尚未换行的当前行
+    """
+
+    def __init__(self, max_lines=LOG_MAX_LINES, trim_batch=LOG_TRIM_BATCH):
+        self.max_lines = max_lines
+        self.trim_batch = trim_batch
+        self.__lines = deque([''])
+        self.dropped_lines = 0  # 累计删除的行数
+
+    def __len__(self):
+        return len(self.__lines)
+
+    def append(self, content: str) -> int:
+        """
+        追加文本
+        Returns:
+            本次删除的最早的行数，为0时未删除
+        """
+        parts = content.split('\n')
+        self.__lines[-1] += parts[0]
+        self.__lines.extend(parts[1:])
+        if len(self.__lines) <= self.max_lines + self.trim_batch:
+            return 0
+        dropped = len(self.__lines) - self.max_lines
+        for _ in range(dropped):
+            self.__lines.popleft()
+        self.dropped_lines += dropped
+        return dropped
+
+    def clear(self):
+        self.__lines = deque([''])
+
+    def lines(self) -> list:
+        return list(self.__lines)
+
+    def search(self, keyword: str) -> list:
+        """在缓冲区中查找包含keyword的行"""
+        return [line for line in self.__lines if keyword in line]
+
+
+class LogView:
+    """
+    有行数上限的日志显示控件，与 tk.Text.insert 接口一致，可直接作为UiQueue.post_insert的目标
+    只在Tk主线程中调用
+    """
+
+    def __init__(self, text_widget, max_lines=LOG_MAX_LINES, trim_batch=LOG_TRIM_BATCH):
+        self.text = text_widget
+        self.buffer = LogBuffer(max_lines, trim_batch)
+
+    def insert(self, index, *chars):
+        """
+        插入文本，chars为 文本, 标签, 文本, 标签, ... 与tk.Text.insert相同
+        只支持追加到末尾(index为tk.END)，缓冲区与Text中的行保持一致；超出上限时批量删除Text中最早的行
+        """
+        if index != tk.END:
+            raise ValueError(f'LogView只支持在末尾插入，index={index!r}')
+        self.text.insert(index, *chars)
+        dropped = self.buffer.append(''.join(chars[::2]))
+        if dropped:
+            self.text.delete('1.0', f'{dropped + 1}.0')
+
+    def clear(self):
+        self.text.delete('1.0', tk.END)
+        self.buffer.clear()
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 """GUI操作界面"""
+import importlib
 from threading import Thread
-import time
 import tkinter as tk
 import tkinter.messagebox
 from collections import namedtuple
@@ -9,15 +9,21 @@ from enum import Enum
 from pathlib import Path
 from tkinter import ttk
 from tkinter import filedialog
-from serial.serialutil import SerialException
-
-from dao import HID_License_Map, DaoException
-from log import logger, OperateLogger
-from serial_.pyboard import PyBoard, PyBoardException
-from utils.convert_utils import b64tostrhex
-from utils.entities import BoardProtocol, PayloadData, ProtocolCommand, DataError, Error_Data_Map
-from utils.file_utils import check_file_suffix, record_HID_activated, read_HID
-from utils.protocol_utils import parse_protocol, build_protocol, check_payload
+from tkinter import simpledialog
+
+from dao import DaoException
+from gui_.log_view import LogView
+from gui_.ui_queue import UiQueue
+from log import logger, OperateLogger, search_log, init_log
+from serial_.connection import BoardConnection
+from serial_.watcher import PortWatcher, list_ports
+from utils.file_utils import check_file_suffix, read_HID, export_HID
+from utils.metrics import metrics, MetricsExporter
+from service_.collect import HIDCollectEngine
+from service_.ledger import Ledger, LEDGER_FILE_NAME
+from service_.provision import ProvisionEngine, ProvisionState, split_ports
+from service_.statistics import HIDStatistics
+from service_.validation import load_license_map
 
 # 字体
 _FONT_S = ('微软雅黑', 8)  # 小号字体
@@ -27,11 +33,29 @@ _FONT_B = ('宋体', 10, 'bold')
 TITLE_MAIN = 'OneOS License管理工具 -1.0.0'
 TITLE_PORT_CONFIG = '串口配置'
 TITLE_LOG_CONFIG = '日志配置'
+TITLE_LOG_SEARCH = '搜索日志'
 # 窗体大小
 SIZE_MAIN = (800, 450)
 SIZE_POPUPS = (400, 250)
+SIZE_LOG_SEARCH = (700, 400)
+# 写license时各串口状态的显示文字
+PORT_STATUS_DESC = {'reset': '工作中', 'success': '成功', 'fail': '失败', 'confirm': '已完成', 'stop': '停止'}
 # 串口配置项
 Port_Config_Item = namedtuple('Port_Config_Item', ['name', 'value'])
+# 启动时不导入，窗口显示后在后台预先导入的模块
+LAZY_MODULES = ('pandas', 'openpyxl', 'serial.tools.list_ports')
+PRELOAD_DELAY = 500  # 窗口显示后多久开始预导入(毫秒)
+LOG_SEARCH_LIMIT = 2000  # 搜索日志最多显示的条数
+METRICS_FILE_NAME = 'metrics.prom'  # 耗时统计导出文件(Prometheus textfile格式，.json后缀时为JSON)，位于日志目录
+
+
+def preload_modules(modules=LAZY_MODULES):
+    """后台导入较慢的模块，避免首次打开文件、刷新串口时卡顿"""
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logger.warning(f'预导入{module}失败 {e}')
 
 
 def center_window(win, width=None, height=None):
@@ -68,6 +92,7 @@ class OneOsGui:
 
     def __init__(self):
         self.window_ = tk.Tk()
+        self.ui_queue = UiQueue(self.window_)  # 工作线程通过该队列更新界面
         center_window(self.window_, *SIZE_MAIN)
         self.window_.title(TITLE_MAIN)
         self.window_.grab_set()  # 窗口显示在最前方
@@ -76,7 +101,9 @@ class OneOsGui:
         self.refresh_var()  # 刷新变量值
         self.body()
         self.window_.pack_propagate(True)
+        self.ui_queue.start()
         self.conn = None  # 串口连接对象
+        self.board_connection = None  # 串口连接管理，读HID流程中保持串口打开
         self.wait_time = 0  # 等待时间。
 
     def init_var(self):
@@ -97,15 +124,16 @@ class OneOsGui:
         self.check_digit = None  # 校验位
         self.stop_digit = 1  # 停止位
         self.stream_controller = None  # 流控
-        self.record_hids = []  # 已经存储过的HID
-        self.new_add_hids = []  # 一次开始流程中，新增的HID。停止按钮时清零
-        self.new_success_hids = []  # 一次开始流程中，成功记录HID的数量(包括重复的)。停止按钮时清零
-        self.new_failed_hids = []  # 一次HID开始流程中，失败的数量。停止按钮时清零
+        self.hid_statistics = HIDStatistics()  # 读HID统计：已存储过的HID，以及本轮新增/成功/失败的HID，停止按钮时清零本轮统计
         self.hid_license_map = None  # HID_License_Map
         self.if_keep_reading = False  # 是否一直读取HID
-        self.activated_hids = []  # 发送过license的HID
-        self.success_license = []  # 成功激活的license
-        self.failed_license = []  # 激活失败的license
+        self.ledger = self.open_ledger()  # 写license台账，启动时只读取统计数
+        self.provision_state = ProvisionState(self.ledger)  # 写license的HID/license统计，多串口共享
+        self.provision_engine = None  # 多串口写license引擎
+        self.hid_engine = None  # 多串口读HID引擎
+        self.port_status = dict()  # 写license时各串口的状态 {串口号: 状态}
+        self.port_watcher = PortWatcher(on_added=self.__on_port_added, on_removed=self.__on_port_removed,
+                                        notify_initial=False)  # 串口热插拔，启动时已有的串口不提示接入
 
         self.port_cb = ttk.Combobox()  # 串口下拉菜单
         self.log_path_entry = tk.Entry()  # 菜单栏日志配置弹窗的日志文件路径
@@ -118,6 +146,7 @@ class OneOsGui:
         self.stream_controller_port_config = ttk.Combobox()  # 菜单栏串口配置弹窗的流控下拉菜单
         self.filepath_entry = tk.Entry()  # main_top的文件选择控件
         self.log_shower = tk.Text()  # main_text左边的操作关键信息打印控件
+        self.log_view = None  # log_shower的显示控制，限制保留的行数
         self.operate_shower = tk.Text()  # main_text右边的操作统计信息打印控件
         self.port_test_desc = tk.StringVar()  # main_top开始测试按钮的显示文字(开始测试/停止测试)
         self.start_btn_desc = tk.StringVar()  # main_top开始按钮的文字信息
@@ -144,7 +173,8 @@ class OneOsGui:
         self.run_status.set('停  止')
         self.port_test_desc.set('开始测试')
         self.filepath_entry.delete(0, tk.END)  # 清空记录文件输入框内容
-        self.log_shower.delete(1.0, tk.END)
+        if self.log_view is not None:  # 启动时body()之前调用，日志控件尚未创建
+            self.log_view.clear()
         self.operate_shower.delete(1.0, tk.END)
         if status == 'HID':
             self._refresh_var_hid()
@@ -166,28 +196,49 @@ class OneOsGui:
         self.record_desc.set('license文件：')
 
     def __refresh_statistics_hid(self):
-        """读hid过程中，刷新统计栏信息"""
+        """读hid过程中，刷新统计栏信息(可在工作线程中调用，主线程中合并重绘)"""
+        self.ui_queue.post_latest('statistics', self.__draw_statistics_hid)
+
+    def __draw_statistics_hid(self):
+        counts = self.hid_statistics.counts()
         self.operate_shower.delete(1.0, tk.END)
         self.operate_shower.insert(tk.END, '本轮操作统计\n', 'head')
-        self.operate_shower.insert(tk.END, f'新增HID{len(self.new_add_hids)}个\n'
-                                           f'成功{len(self.new_success_hids)}个\n'
-                                           f'失败{len(set(self.new_failed_hids))}个\n', 'content')
-        self.operate_shower.insert(tk.END, f'文件记录HID总共{len(self.record_hids)}个\n', 'tail')
+        self.operate_shower.insert(tk.END, f'新增HID{counts["new_add"]}个\n'
+                                           f'成功{counts["new_success"]}个\n'
+                                           f'失败{counts["new_failed"]}个\n', 'content')
+        self.operate_shower.insert(tk.END, f'文件记录HID总共{counts["record"]}个\n', 'tail')
+        self.__draw_metrics_summary()
 
     def __refresh_statistics_license(self):
-        """写license过程中，刷新统计栏信息"""
+        """写license过程中，刷新统计栏信息(可在工作线程中调用，主线程中合并重绘)"""
+        self.ui_queue.post_latest('statistics', self.__draw_statistics_license)
+
+    def __draw_statistics_license(self):
         self.operate_shower.delete(1.0, tk.END)
         self.operate_shower.insert(tk.END, '本轮操作统计\n', 'head')
-        self.operate_shower.insert(tk.END, f'完成HID {len(set(self.activated_hids))} 个\n'
-                                           f'成功license {len(set(self.success_license))} 个\n'
-                                           f'失败license {len(set(self.failed_license))} 个\n',
+        counts = self.provision_state.counts()
+        self.operate_shower.insert(tk.END, f'完成HID {counts["activated"]} 个\n'
+                                           f'成功license {counts["success_license"]} 个\n'
+                                           f'失败license {counts["failed_license"]} 个\n',
                                    'content')
-        self.operate_shower.insert(tk.END, f'导入HID {len(set(self.hid_license_map.hids))} 个 '
-                                           f'license {self.hid_license_map.licenses_counts} 个',
+        self.operate_shower.insert(tk.END, f'导入HID {self.hid_license_map.hids_counts} 个 '
+                                           f'license {self.hid_license_map.licenses_counts} 个\n',
                                    'tail')
+        for port_, status_ in list(self.port_status.items()):
+            self.operate_shower.insert(tk.END, f'{port_}: {PORT_STATUS_DESC.get(status_, status_)}\n', 'content')
+        self.__draw_metrics_summary()
+
+    def __draw_metrics_summary(self):
+        """统计栏末尾显示各阶段耗时"""
+        lines = metrics.summary()
+        if lines:
+            self.operate_shower.insert(tk.END, '耗时统计\n' + '\n'.join(lines) + '\n', 'tail')
 
     def __refresh_statistic_log_shower(self, status):
-        """刷新结果栏信息"""
+        """刷新结果栏信息(可在工作线程中调用)"""
+        self.ui_queue.post_latest('statistic_log_shower', self.__draw_statistic_log_shower, status)
+
+    def __draw_statistic_log_shower(self, status):
         self.statistic_shower.delete(1.0, tk.END)
         if status == 'success':
             self.statistic_shower.insert(1.0, '成 功', 'success')
@@ -198,12 +249,12 @@ class OneOsGui:
         elif status == 'stop':
             self.statistic_shower.insert(1.0, '停 止', 'stop')
 
-    def __do_log_shower_insert(self, content, start=tk.END, tag=None):
+    def __do_log_shower_insert(self, content, tag=None):
+        """打印操作信息(可在工作线程中调用，由主线程批量追加到末尾)"""
+        self.ui_queue.post_insert(self.log_view, content, tag)
         if tag is None:
-            self.log_shower.insert(start, content)
             self.operate_logger.logger.info(content.strip())
         else:
-            self.log_shower.insert(start, content, tag)
             self.operate_logger.logger.info(f'{tag}-{content.strip()}')
 
     def change_status_to_hid(self):
@@ -286,7 +337,7 @@ class OneOsGui:
             '数据位': Port_Config_Item(name='data_digit_port_config', value=[8]),
             '校验位': Port_Config_Item(name='check_digit_port_config', value=['None',]),
             '停止位': Port_Config_Item(name='stop_digit_port_config', value=[1, ]),
-            '流控   ': Port_Config_Item(name='stream_controller', value=['None', ]),
+            '流控   ': Port_Config_Item(name='stream_controller_port_config', value=['None', 'RTS/CTS']),
         }
         for k, v in port_config_items.items():
             self.__build_top_config_combobox(parent, k, v).pack(pady=5)
@@ -313,6 +364,7 @@ class OneOsGui:
             print(f'校验位:', self.check_digit_port_config.get())
             print(f'停止位:', self.stop_digit_port_config.get())
             print(f'流控:', self.stream_controller_port_config.get())
+            self.stream_controller = self.stream_controller_port_config.get()
             parent.destroy()
 
         def cancel():
@@ -430,7 +482,7 @@ class OneOsGui:
                         max_bytes = operate_log_size * 1024 * 1024
                         self.operate_logger.add_hander(operate_log_file_path, max_bytes)
                         logger.info(f'开启日志记录：{operate_log_file_path}')
-                        self.log_shower.insert(tk.END, f'开启操作日志记录{operate_log_file_path}\n')
+                        self.ui_queue.post_insert(self.log_view, f'开启操作日志记录{operate_log_file_path}\n')
 
             parent.destroy()
 
@@ -465,14 +517,14 @@ class OneOsGui:
                         self.if_keep_reading = True
                         work_type = self.work_type.get()
                         if work_type == '读HID':
-                            t = Thread(target=self.do_hid_line, daemon=True)
-                            t.start()
+                            self.do_hid_line(self.split_ports(temp_port))
                         elif work_type == '写license':
-                            t = Thread(target=self.do_license_line, daemon=True)
-                            t.start()
+                            self.do_license_line(self.split_ports(temp_port))
                         else:
                             print(f'错误的工作状态: {work_type}')
                     except Exception as e:
+                        logger.exception(e)
+                        tkinter.messagebox.showwarning(title='Warning', message=str(e))
                         self.start_btn_desc.set('开  始')
                         self.start_btn.config(fg='green')
                         self.__turn_off()
@@ -482,9 +534,13 @@ class OneOsGui:
             elif self.start_btn_desc.get() == '停  止':
                 self.__reset_wait_time()
                 self.if_keep_reading = False
+                for engine in (self.hid_engine, self.provision_engine):
+                    if engine is not None:
+                        engine.stop()
                 self.start_btn_desc.set('开  始')
                 self.start_btn.config(fg='green')
                 self.__turn_off()
+                self.export_hid_record()
 
         self.start_btn = tk.Button(frame, textvariable=self.start_btn_desc, height=1, width=8,
                                    fg='green', bg='#918B8B', font=_FONT_L, command=start)
@@ -566,20 +622,12 @@ class OneOsGui:
                     print('work type:', self.work_type.get())
                     if self.work_type.get() == '读HID':
                         self.hid_filepath = file_path
-                        self.record_hids = read_HID(file_path)
+                        self.hid_statistics.load(read_HID(file_path))
                     elif self.work_type.get() == '写license':
                         self.license_filepath = file_path
-                        try:
-                            self.hid_license_map = HID_License_Map(file_path)  # hid_license映射对象
-                        except DaoException as e:
-                            tkinter.messagebox.showerror(title='Error',
-                                                         message=str(e))
-                            self.record_filepath.set('')
-                            return
-                        self.__do_log_shower_insert(f'导入license文件，'
-                                                    f'共导入HID{len(set(self.hid_license_map.hids))}个, '
-                                                    f'license{self.hid_license_map.licenses_counts}个\n')
-                        print('写license路径', self.hid_license_map)
+                        self.__do_log_shower_insert(f'开始导入license文件{file_path}...\n')
+                        Thread(target=self.load_license_file, args=(file_path,), name='license-load',
+                               daemon=True).start()  # 导入和校验在同一次读取中完成，文件很大时耗时较长，不阻塞界面
                 else:
                     tkinter.messagebox.showwarning(title='Warning',
                                                    message='请选择Excel类型文件')
@@ -603,12 +651,14 @@ class OneOsGui:
         frame_left = tk.Frame(parent)
         self.__main_text_left_1(frame_left).pack(expand=True, fill=tk.BOTH)  # 日志打印text控件
         self.__main_text_left_2(frame_left).pack(side=tk.RIGHT)
+        self.__main_text_left_3(frame_left).pack(side=tk.RIGHT, padx=5)
 
         return frame_left
 
     def __main_text_left_1(self, parent):  # 日志打印Text
         self.log_shower = tk.Text(parent, width=50, height=15)
-        self.log_shower.insert(tk.END, '默认关闭操作日志\n')
+        self.log_view = LogView(self.log_shower)
+        self.log_view.insert(tk.END, '默认关闭操作日志\n')
         self.log_shower.tag_config('error', foreground='red', font=_FONT_B)
         self.log_shower.tag_config('confirm', foreground='green', font=_FONT_B)
         self.log_shower.tag_config('warn', foreground='blue', font=_FONT_B)
@@ -617,12 +667,45 @@ class OneOsGui:
     def __main_text_left_2(self, parent):  # 清除日志按钮
 
         def clean_log():
-            self.log_shower.delete(1.0, tk.END)  # 清除text中文本
-            self.__do_log_shower_insert('清除日志...\n', start=1.0)
+            self.ui_queue.post(self.log_view.clear)  # 清除text中文本
+            self.__do_log_shower_insert('清除日志...\n')
         b = tk.Button(parent, text='清除日志', font=_FONT_S, height=1, width=8,
                       bg='#918B8B', padx=1, pady=1, command=clean_log)
         return b
 
+    def __main_text_left_3(self, parent):  # 搜索日志按钮，界面只保留最近的日志，在日志文件中搜索全部历史记录
+
+        def search():
+            keyword = simpledialog.askstring(TITLE_LOG_SEARCH, '关键字', parent=self.window_)
+            if not keyword:
+                return
+
+            def _search():
+                try:
+                    lines = search_log(keyword, limit=LOG_SEARCH_LIMIT)
+                except Exception as e:
+                    logger.exception(e)
+                    lines = [f'搜索日志失败 {e}']
+                self.ui_queue.post(self.__show_log_search, keyword, lines)
+            Thread(target=_search, name='log-search', daemon=True).start()  # 日志文件可能较大，不阻塞界面
+        b = tk.Button(parent, text='搜索日志', font=_FONT_S, height=1, width=8,
+                      bg='#918B8B', padx=1, pady=1, command=search)
+        return b
+
+    def __show_log_search(self, keyword, lines):
+        """弹窗显示日志搜索结果"""
+        top = tk.Toplevel(self.window_)
+        top.title(f'{TITLE_LOG_SEARCH}: {keyword}')
+        center_window(top, *SIZE_LOG_SEARCH)
+        scrollbar = tk.Scrollbar(top)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text = tk.Text(top, yscrollcommand=scrollbar.set)
+        text.pack(expand=True, fill=tk.BOTH)
+        scrollbar.config(command=text.yview)
+        text.insert(tk.END, f'共找到{len(lines)}条记录(最多显示{LOG_SEARCH_LIMIT}条)\n\n')
+        text.insert(tk.END, '\n'.join(lines))
+        text.see(tk.END)
+
     def __main_text_right(self, parent):  # 操作统计Text控件，清除统计按钮
         frame_right = tk.Frame(parent)
         self.__main_text_right_1(frame_right).pack(expand=True, fill=tk.BOTH)  # 日志打印text控件
@@ -707,8 +790,21 @@ class OneOsGui:
         return l
 
     def run(self):
+        self.window_.after(PRELOAD_DELAY, lambda: Thread(target=preload_modules, daemon=True).start())
+        metrics_exporter = MetricsExporter(metrics, Path(init_log().parent, METRICS_FILE_NAME))
+        metrics_exporter.start()
+        self.port_watcher.start()
         self.window_.mainloop()
         logger.info('----------------------Process Start-----------------------')
+        if self.hid_filepath:  # 窗口已关闭，只记录日志
+            try:
+                export_HID(Path(self.hid_filepath))
+            except Exception as e:
+                logger.exception(e)
+        metrics_exporter.stop()
+        self.port_watcher.stop()
+        if self.ledger is not None:
+            self.ledger.close()
 
     def __turn_on(self):  # 连接上串口时，更新属性
         self.if_connected.set(f'{self.curr_port.get()}已连接')
@@ -717,23 +813,31 @@ class OneOsGui:
         self.run_status_label.config(fg='green')
         self.__do_log_shower_insert(f'串口{self.curr_port.get()}连接成功\n')
 
+    def __reset_start_btn(self):  # 流程结束时，恢复开始按钮
+        self.start_btn_desc.set('开  始')
+        self.start_btn.config(fg='green')
+        self.__turn_off()
+
     def __turn_off(self):  # 断开串口连接时，更新属性
         self.if_connected.set(f'断开')
         self.run_status.set('停  止')
         self.port_status_label.config(fg='black')
         self.run_status_label.config(fg='black')
-        self.new_add_hids = []
-        self.new_success_hids = []
-        self.new_failed_hids = []
+        self.hid_statistics.reset_session()
 
     # 以上为界面代码，以下为逻辑代码
     def connect_to_board(self):
-        """连接串口"""
-        logger.info(f'连接串口 {self.curr_port.get()}')
+        """连接串口，串口已打开时直接复用"""
         if self.curr_port.get():
-            self.conn = PyBoard(self.curr_port.get(), self.curr_baudrate)
+            if self.board_connection is None or self.board_connection.port != self.curr_port.get():
+                self.board_connection = BoardConnection(self.curr_port.get(), self.curr_baudrate,
+                                                        rtscts=self.stream_controller == 'RTS/CTS')
+            if self.board_connection.is_open:
+                return True
+            logger.info(f'连接串口 {self.curr_port.get()}')
+            self.conn = self.board_connection.open()
             if self.conn.is_open:  # 已连接
-                self.__turn_on()
+                self.ui_queue.post(self.__turn_on)
                 return True
             else:
                 self.__do_log_shower_insert(f'串口{self.curr_port.get()}连接失败\n', tag='warn')
@@ -742,259 +846,170 @@ class OneOsGui:
     def disconnect_to_board(self, if_print=True):
         """断开串口连接"""
         logger.info(f'断开串口连接 {self.curr_port.get()}')
-        if self.conn.is_open:
-            self.conn.close()
+        if self.board_connection is not None and self.board_connection.is_open:
+            self.board_connection.close()
             if if_print:
                 self.__do_log_shower_insert(f'串口{self.curr_port.get()}断开连接\n\n')
 
-    def get_port_list(self, cb):
-        """获取当前可用的串口列表"""
-        def _get_port_list(*args):
-            self.port_list = PyBoard.get_list()
-            cb['value'] = self.port_list
-            if self.port_list:
-                self.__do_log_shower_insert('检测到串口')
-                for port_ in self.port_list:
-                    self.__do_log_shower_insert(f' {port_}')
-                self.log_shower.insert('end', '\n')
-            else:
-                self.__do_log_shower_insert('未检测到串口\n')
-        return _get_port_list
-
-    def do_hid_line(self):
-        """开始读HID流程"""
-        while self.if_keep_reading:
-            print(f'wait_time: {self.wait_time}')
-            if self.wait_time >= self.MAX_WAIT_TIME:
-                self.disconnect_to_board(if_print=False)
-                self.__do_log_shower_insert('连接未操作时间过长，自动断开连接\n\n', tag='warn')
-                self.__refresh_statistic_log_shower('stop')
-                self.if_keep_reading = False
-                self.start_btn_desc.set('开  始')
-                self.start_btn.config(fg='green')
-                self.__turn_off()
-                return
-
-            if_connected = self.connect_to_board()  # 同串口建立连接
-            if if_connected:
-                self.get_hid(self.conn)  # 串口通信获取HID
-
-    def get_hid(self, serial_obj):
-        """
-        同串口通信，获取设备HID
-        Args:
-            serial_obj: 串口连接对象
-
-        Returns:
+    def export_hid_record(self):
+        """将本轮追加记录的HID导出到HID记录文件，记录文件较大时耗时较长，在工作线程中导出，不阻塞界面"""
+        if not self.hid_filepath:
+            return
+        Thread(target=self.__export_hid_record, args=(self.hid_filepath,), name='hid-export', daemon=True).start()
 
-        """
-        logger.info('get hid start')
-        self.__refresh_statistic_log_shower('reset')
-        self.__do_log_shower_insert(f'开始读设备HID...\n')
+    def __export_hid_record(self, hid_filepath):
+        """导出HID(在工作线程中执行)，结果通过ui_queue显示"""
         try:
-            hid_response = serial_obj.get_HID()
-        except SerialException as e:
-            logger.warning('串口访问异常', e)
-            self.__do_log_shower_insert(f'设备HID读取失败，稍后将重试或更换设备\n', tag='error')
-            self.__refresh_statistic_log_shower('fail')
-            self.disconnect_to_board()
-            return
+            export_counts = export_HID(Path(hid_filepath))
         except Exception as e:
-            logger.warning('串口访问异常', e)
-            self.__do_log_shower_insert(f'设备HID读取失败，稍后将重试或更换设备\n', tag='error')
-            self.__refresh_statistic_log_shower('fail')
-            self.disconnect_to_board()
-            return
+            logger.exception(e)
+            self.__do_log_shower_insert(f'HID导出到{hid_filepath}失败，请关闭该文件后重试\n', tag='error')
         else:
-            if hid_response is None:
-                self.__do_log_shower_insert(f'设备HID读取失败，稍后将重试或更换设备\n', tag='error')
-                self.__refresh_statistic_log_shower('fail')
-                self.disconnect_to_board()
-                return
+            if export_counts:
+                self.__do_log_shower_insert(f'导出{export_counts}个HID到{hid_filepath}\n')
+
+    def load_license_file(self, file_path):
+        """导入并校验license文件(在工作线程中执行)，完成后在界面线程中替换当前的license映射"""
         try:
-            board_protocol = parse_protocol(hid_response)
-        except Exception as e:
-            self.__do_log_shower_insert(f'解析及校验HID response失败\n', tag='error')
-            self.__refresh_statistic_log_shower('fail')
-            self.disconnect_to_board()
+            hid_license_map, report = load_license_map(file_path)
+        except (DaoException, FileNotFoundError) as e:
+            logger.exception(e)
+            self.ui_queue.post(self.__on_license_load_failed, file_path, str(e))
             return
-        hid_value = board_protocol.payload_data.data
-        self.__do_log_shower_insert(f'设备HID读取成功, HID {hid_value}\n')
-        if hid_value not in self.record_hids:
-            self.__reset_wait_time()  # 重置等待时间
-            logger.info(f'添加hid：{hid_value}')
-            self.__do_log_shower_insert(f'记录设备{hid_value}到表格\n')
-            if Path(self.hid_filepath).exists():
-
-                try:
-                    record_HID_activated(hid_value, Path(self.hid_filepath))
-                except Exception as e:
-                    self.new_failed_hids.append(hid_value)
-                    self.__refresh_statistics_hid()
-                    logger.exception(e)
-                    self.__do_log_shower_insert(f'设备{hid_value}HID存储失败\n', tag='error')
-                    self.__refresh_statistic_log_shower('fail')
-                    self.disconnect_to_board()
-                else:
-                    self.record_hids.append(hid_value)
-                    self.new_success_hids.append(hid_value)
-                    self.new_add_hids.append(hid_value)
-                    self.__refresh_statistics_hid()
-                    self.__do_log_shower_insert(f'设备{hid_value}HID存储完成，请更换设备...\n', tag='confirm')
-                    self.__refresh_statistic_log_shower('success')
-                    self.disconnect_to_board()
-                    time.sleep(3)
-        else:
-            if hid_value not in self.new_success_hids:
-                self.new_success_hids.append(hid_value)
-            self.__refresh_statistics_hid()
-            self.wait_time += 1
-            self.__do_log_shower_insert(f'设备{hid_value}已完成，请更换设备...\n', tag='warn')
-            self.__refresh_statistic_log_shower('confirm')
-            self.disconnect_to_board()
-            time.sleep(3)
-
-    def do_license_line(self):
-        """开始写license流程"""
-        logger.info('write license start')
-        self.__do_log_shower_insert('开始写license流程\n')
-        self.__refresh_statistic_log_shower('reset')
-        while self.if_keep_reading:
-            print(f'wait time: {self.wait_time}')
-            if self.wait_time >= self.MAX_WAIT_TIME:
-                self.disconnect_to_board()
-                self.if_keep_reading = False
-                self.__refresh_statistic_log_shower('stop')
-                self.start_btn_desc.set('开  始')
-                self.start_btn.config(fg='green')
-                self.__turn_off()
-                return
+        self.ui_queue.post(self.__on_license_loaded, hid_license_map, report)
 
-            if_connected = self.connect_to_board()
-            logger.info(f'connected to {self.curr_port.get()}')
-            if_success = True
-            if if_connected:
-                try:
-                    hid_response = self.conn.get_HID()
-                except Exception as e:
-                    self.disconnect_to_board()
-                    time.sleep(1)  # 可能有板子的插拔动作
-                    continue
-                else:
-                    if hid_response is None:
-                        self.__do_log_shower_insert(f'获取设备HID失败\n', tag='error')
-                        self.__refresh_statistic_log_shower('fail')
-                        self.disconnect_to_board()
-                        time.sleep(1)
-                        continue
-                logger.info(f'get hid response')
+    def __on_license_load_failed(self, file_path, error):
+        if file_path != self.license_filepath:  # 导入期间又选择了其它文件
+            return
+        tkinter.messagebox.showerror(title='Error', message=error)
+        self.record_filepath.set('')
 
-                try:
-                    board_protocol = parse_protocol(hid_response)
-                except Exception as e:
-                    self.disconnect_to_board()
-                    time.sleep(1)  # 可能有板子的插拔动作
-                    continue
-                logger.info('parse hid success')
-                hid_value = board_protocol.payload_data.data
-                self.__do_log_shower_insert(f'获取设备HID成功，HID {hid_value}\n')
-                if hid_value not in self.activated_hids:
-                    self.__reset_wait_time()
-                    hid_licenses = self.hid_license_map.get_license(hid_value)
-                    if not hid_licenses:  # 该hid没有获取到相应的license
-                        logger.warning(f'{hid_value} 没有获取到license\n')
-                        self.__do_log_shower_insert('license写入失败: license文件中没有找到该hid\n')
-                        self.__refresh_statistics_license()
-                        self.__refresh_statistic_log_shower('fail')
-                        self.disconnect_to_board()
-                        time.sleep(1)
-                        continue
-                    self.__do_log_shower_insert(f'对设备{hid_value}，写入license\n')
-                    for component_id, license_ in hid_licenses.items():
-                        try:
-                            license_ = b64tostrhex(license_)
-                        except Exception as e:
-                            logger.error(f'license {license_}转码错误')
-                            self.__do_log_shower_insert(f'{component_id}写入license{str(license_)[:20]}...失败，'
-                                                        f'license转码错误\n', tag='warn')
-                            self.failed_license.append(license_)
-                            self.__refresh_statistics_license()
-                            time.sleep(1)
-                            continue
-                        protocol = build_protocol(license_, component_id=component_id,
-                                                  command=ProtocolCommand.license_put_request.value,
-                                                  )
-                        if not self.send_license(self.conn, protocol):
-                            self.__do_log_shower_insert(f'{component_id}写入license{license_[:20]}...失败\n', tag='warn')
-                            self.failed_license.append(license_)
-                            self.__refresh_statistics_license()
-                            if_success = False
-                        else:
-                            self.__do_log_shower_insert(f'{component_id}写入license{license_}成功\n', tag='warn')
-                            self.success_license.append(license_)
-                            self.__refresh_statistics_license()
-                    if if_success:
-                        self.__do_log_shower_insert(f'设备{hid_value}写入license成功\n', tag='confirm')
-                        self.__refresh_statistic_log_shower('success')
-                        self.activated_hids.append(hid_value)
-                        self.__refresh_statistics_license()
-                    else:
-                        self.__refresh_statistic_log_shower('fail')
-                        self.__do_log_shower_insert(f'设备{hid_value}写入license失败\n', tag='error')
-                else:
-                    self.wait_time += 1
-                    self.__refresh_statistic_log_shower('confirm')
-                    self.__do_log_shower_insert(f'设备{hid_value}已经写入过license，请更换设备...\n', tag='warn')
-            self.disconnect_to_board()
-            time.sleep(3)
-
-    def send_license(self, serial_obj, protocol):
-        logger.info('send license start')
-        try:
-            serial_obj.send_license(protocol)
-        except SerialException as e:
-            logger.warning('串口无法访问')
-            self.__do_log_shower_insert('串口无法通信\n')
+    def __on_license_loaded(self, hid_license_map, report):
+        if hid_license_map.file_path != self.license_filepath:  # 导入期间又选择了其它文件
+            hid_license_map.close()
             return
+        if self.hid_license_map is not None and \
+                (self.provision_engine is None or not self.provision_engine.is_running):
+            self.hid_license_map.close()  # 正在写license时由垃圾回收关闭
+        self.hid_license_map = hid_license_map
+        self.__do_log_shower_insert(f'导入license文件，'
+                                    f'共导入HID{hid_license_map.hids_counts}个, '
+                                    f'license{hid_license_map.licenses_counts}个\n')
+        tag = None if report.if_ok else 'warn'
+        for line in report.summary():
+            self.__do_log_shower_insert(f'{line}\n', tag=tag)
+        print('写license路径', hid_license_map)
+
+    @staticmethod
+    def open_ledger():
+        """打开日志目录下的台账，失败时不使用台账"""
+        try:
+            return Ledger(Path(init_log().parent, LEDGER_FILE_NAME))
         except Exception as e:
             logger.exception(e)
-            self.__do_log_shower_insert('写入license失败\n')
-            return
+            return None
 
-        try:
-            resp = serial_obj.read_response()
-        except SerialException as e:
-            logger.warning('未获取到license写入结果')
-            self.__do_log_shower_insert('未获取到license写入结果\n')
+    def get_port_list(self, cb):
+        """获取当前可用的串口列表"""
+        def _get_port_list(*args):
+            # 优先使用后台监听缓存的串口列表，监听尚未完成第一次枚举时直接枚举
+            self.port_list = self.port_watcher.ports if self.port_watcher.enumerations else list_ports()
+            if cb is self.port_cb and len(self.port_list) > 1:  # 写license时可同时选择全部串口
+                cb['value'] = self.port_list + [','.join(self.port_list)]
+            else:
+                cb['value'] = self.port_list
+            if self.port_list:
+                self.__do_log_shower_insert('检测到串口')
+                for port_ in self.port_list:
+                    self.__do_log_shower_insert(f' {port_}')
+                self.ui_queue.post_insert(self.log_view, '\n')
+            else:
+                self.__do_log_shower_insert('未检测到串口\n')
+        return _get_port_list
+
+    def __on_port_added(self, port):
+        """串口接入(监听线程中调用)，正在运行的流程包含该串口时重新开始该串口的流程"""
+        self.__do_log_shower_insert(f'串口{port}已接入\n')
+        for engine in (self.hid_engine, self.provision_engine):
+            if engine is not None and engine.is_running:
+                engine.add_port(port)
+
+    def __on_port_removed(self, port):
+        """串口移除(监听线程中调用)，停止正在运行的流程中该串口的流程，重新接入时由__on_port_added重新开始"""
+        self.__do_log_shower_insert(f'串口{port}已移除\n', tag='warn')
+        for engine in (self.hid_engine, self.provision_engine):
+            if engine is not None and engine.is_running:
+                engine.remove_port(port)
+
+    def do_hid_line(self, ports: list):
+        """开始读HID流程，每个串口一个工作线程，流程中保持串口打开"""
+        if not self.hid_filepath:
+            raise StatusEnumException('未选择HID记录文件')
+        logger.info(f'get hid start {ports}')
+        self.ui_queue.post(self.__turn_on)
+        self.__refresh_statistics_hid()
+        engine = HIDCollectEngine(ports, self.curr_baudrate, self.hid_filepath, self.hid_statistics,
+                                  on_log=self.__on_provision_log,
+                                  on_status=self.__on_hid_status,
+                                  on_statistics=self.__refresh_statistics_hid,
+                                  on_finished=lambda: self.__on_hid_finished(engine),
+                                  max_wait_time=self.MAX_WAIT_TIME,
+                                  board_options={'rtscts': self.stream_controller == 'RTS/CTS'},
+                                  ledger=self.ledger)
+        self.hid_engine = engine
+        engine.start()
+
+    def __on_hid_status(self, port, status):
+        self.__refresh_statistic_log_shower(status)
+
+    def __on_hid_finished(self, engine):
+        """所有串口均已停止读HID"""
+        if engine is not self.hid_engine:  # 已经开始了新一轮流程
             return
-        except Exception as e:
-            logger.exception(e)
-            self.__do_log_shower_insert('获取license写入结果失败\n')
+        self.if_keep_reading = False
+        self.ui_queue.post(self.__reset_start_btn)
+        self.export_hid_record()
+
+    @staticmethod
+    def split_ports(ports: str) -> list:
+        """解析串口下拉框内容，多个串口用逗号分隔"""
+        return split_ports(ports)
+
+    def do_license_line(self, ports: list):
+        """开始写license流程，每个串口一个工作线程"""
+        if self.hid_license_map is None:
+            raise StatusEnumException('未导入license文件')
+        logger.info(f'write license start {ports}')
+        self.port_status = {port_: 'reset' for port_ in ports}
+        self.if_connected.set(f'{",".join(ports)}')
+        self.run_status.set('工作中')
+        self.port_status_label.config(fg='green')
+        self.run_status_label.config(fg='green')
+        self.__refresh_statistics_license()
+        engine = ProvisionEngine(ports, self.curr_baudrate, self.hid_license_map, self.provision_state,
+                                 on_log=self.__on_provision_log,
+                                 on_status=self.__on_provision_status,
+                                 on_statistics=self.__refresh_statistics_license,
+                                 on_finished=lambda: self.__on_provision_finished(engine),
+                                 max_wait_time=self.MAX_WAIT_TIME,
+                                 board_options={'rtscts': self.stream_controller == 'RTS/CTS'})
+        self.provision_engine = engine
+        engine.start()
+
+    def __on_provision_log(self, port, content, tag=None):
+        self.__do_log_shower_insert(f'[{port}] {content}', tag=tag)
+
+    def __on_provision_status(self, port, status):
+        self.port_status[port] = status
+        self.__refresh_statistic_log_shower(status)
+        self.__refresh_statistics_license()
+
+    def __on_provision_finished(self, engine):
+        """所有串口均已停止写license"""
+        if engine is not self.provision_engine:  # 已经开始了新一轮流程
             return
-        logger.info(f'get response: {resp}')
-        if resp is not None:
-            try:
-                board_protocol = parse_protocol(resp)
-            except Exception as e:
-                logger.exception(e)
-                return
-            payload_data = board_protocol.payload_data
-            if check_payload(payload_data, 'license_put_response'):
-                logger.info('license写入成功')
-                self.__do_log_shower_insert('license写入成功\n', tag='confirm')
-                return True
-            else:
-                error_type = Error_Data_Map.get(payload_data.data)
-                if error_type is not None:
-                    logger.info(f'license写入失败，指令{payload_data.command}，')
-                    self.__do_log_shower_insert(f'license写入错误, '
-                                                f'指令{payload_data.command} 错误类型{error_type}\n')
-                else:
-                    logger.info(f'license写入失败，指令{payload_data.command}，')
-                    self.__do_log_shower_insert(f'license写入错误, '
-                                                f'指令{payload_data.command}数据{payload_data.data}\n')
-        else:  # 没有正确获取到返回
-            self.__do_log_shower_insert('license写入失败\n', tag='error')
+        self.if_keep_reading = False
+        self.ui_queue.post(self.__reset_start_btn)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""界面更新队列：工作线程不直接操作控件，由Tk主线程定时批量处理"""
+import queue
+import tkinter as tk
+from threading import Lock
+
+from log import logger
+
+UI_REFRESH_INTERVAL = 50  # 主线程处理界面更新的间隔(毫秒)
+UI_MAX_BATCH = 2000  # 每次最多处理的更新条数，剩余的留到下一次
+_CALL = 'call'
+_INSERT = 'insert'
+
+
+class UiQueue:
+    """
+    线程安全的界面更新队列
+        post: 按顺序执行的界面操作
+        post_insert: 向Text控件末尾插入文本，连续的插入合并为一次insert调用
+        post_latest: 同一个key只保留最后一次，每次刷新最多执行一次(如统计栏重绘)
+    """
+
+    def __init__(self, root, interval=UI_REFRESH_INTERVAL, max_batch=UI_MAX_BATCH):
+        self.root = root
+        self.interval = interval
+        self.max_batch = max_batch
+        self.__queue = queue.SimpleQueue()
+        self.__latest = dict()  # {key: (func, args)}
+        self.__lock = Lock()
+        self.__after_id = None
+
+    def post(self, func, *args, **kwargs):
+        self.__queue.put((_CALL, func, args, kwargs))
+
+    def post_insert(self, text_widget, content, tag=None, index=tk.END):
+        """向text_widget插入文本"""
+        self.__queue.put((_INSERT, text_widget, index, (content, tag)))
+
+    def post_latest(self, key, func, *args):
+        with self.__lock:
+            self.__latest[key] = (func, args)
+
+    def start(self):
+        if self.__after_id is None:
+            self.__after_id = self.root.after(self.interval, self.__drain)
+
+    def stop(self):
+        if self.__after_id is not None:
+            self.root.after_cancel(self.__after_id)
+            self.__after_id = None
+
+    def drain(self):
+        """在主线程中处理已投递的界面更新"""
+        batch = []
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.__queue.get_nowait())
+            except queue.Empty:
+                break
+        idx = 0
+        while idx < len(batch):
+            kind, target, *params = batch[idx]
+            if kind == _INSERT:  # 合并同一控件末尾的连续插入
+                index = params[0]
+                chars = []
+                while idx < len(batch) and batch[idx][:3] == (_INSERT, target, index):
+                    content, tag = batch[idx][3]
+                    chars.extend((content, tag or ()))
+                    idx += 1
+                    if index != tk.END:  # 非末尾插入时逐条插入，保持原有顺序
+                        break
+                self.__call(target.insert, index, *chars)
+            else:
+                args, kwargs = params
+                self.__call(target, *args, **kwargs)
+                idx += 1
+        with self.__lock:
+            latest, self.__latest = self.__latest, dict()
+        for func, args in latest.values():
+            self.__call(func, *args)
+
+    def __drain(self):
+        try:
+            self.drain()
+        finally:
+            self.__after_id = self.root.after(self.interval, self.__drain)
+
+    @staticmethod
+    def __call(func, *args, **kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            logger.exception(e)
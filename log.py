@@ -1,27 +1,85 @@
 # -*- coding; utf-8 -*-
 
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from collections import deque
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
 from pathlib import Path
 
 FILE_NAME = 'license management tool.log'
+BACKUP_COUNT = 5  # 日志文件轮转个数
 FORMAT = '%(asctime)s %(thread)d %(threadName)s %(filename)s[line:%(lineno)d] %(levelname)s %(message)s'
+LOG_QUEUE_SIZE = 10000  # 日志队列最多缓存的记录数
+# 日志队列已满时的处理方式
+OVERFLOW_DROP_OLD = 'drop_old'  # 丢弃最早的记录
+OVERFLOW_DROP_NEW = 'drop_new'  # 丢弃当前记录
+OVERFLOW_BLOCK = 'block'  # 等待写入线程处理
+LOG_OVERFLOW_POLICY = OVERFLOW_DROP_OLD
+LOG_DIR_ENV = 'LICENSE_TOOL_LOG_DIR'  # 日志目录环境变量，未设置时为程序目录下的log
 
 
 def init_log():
-    log_dir = Path(Path(__file__).parent, 'log')
+    log_dir = Path(os.environ.get(LOG_DIR_ENV) or Path(Path(__file__).parent, 'log'))
     if not log_dir.exists():
-        os.mkdir(log_dir)
+        os.makedirs(log_dir)
     return Path(log_dir, FILE_NAME)
 
 
+class BoundedQueueHandler(QueueHandler):
+    """
+    有容量上限的日志队列，调用线程只负责入队，由QueueListener线程格式化并写文件
+    队列已满时按overflow处理，WARNING及以上级别的记录总是等待入队，不会被丢弃
+    """
+
+    def __init__(self, queue_size=LOG_QUEUE_SIZE, overflow=LOG_OVERFLOW_POLICY):
+        if overflow not in (OVERFLOW_DROP_OLD, OVERFLOW_DROP_NEW, OVERFLOW_BLOCK):
+            raise ValueError(f'unexpected overflow policy {overflow}')
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.overflow = overflow
+        self.dropped = 0  # 队列已满时丢弃的记录数
+
+    def prepare(self, record):
+        """同一进程内传递，不在调用线程中格式化消息，由写入线程格式化"""
+        return record
+
+    def enqueue(self, record):
+        if self.overflow == OVERFLOW_BLOCK or record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == OVERFLOW_DROP_OLD:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+
 class Logger:
+    """
+    程序日志，写文件在单独的线程中进行，调用logger的线程(如串口工作线程)不会阻塞在磁盘IO和日志轮转上
+    """
 
-    def __init__(self, format=FORMAT, level=logging.INFO):
+    def __init__(self, format=FORMAT, level=logging.INFO, queue_size=LOG_QUEUE_SIZE, overflow=LOG_OVERFLOW_POLICY):
         file_name = init_log()
         self.logger = logging.getLogger()
-        self.logger.addHandler(self.__get_filehandler(file_name, format))
+        self.queue_handler = BoundedQueueHandler(queue_size, overflow)
+        self.listener = QueueListener(self.queue_handler.queue, self.__get_filehandler(file_name, format),
+                                      respect_handler_level=True)
+        self.listener.start()
+        self.__if_running = True
+        atexit.register(self.stop)
+        self.logger.addHandler(self.queue_handler)
         self.logger.setLevel(level)
 
     @staticmethod
@@ -29,12 +87,22 @@ class Logger:
         handler_ = RotatingFileHandler(filename=file_name,
                                        mode='a',
                                        maxBytes=5 * 1024 * 1024,
-                                       backupCount=5,
+                                       backupCount=BACKUP_COUNT,
                                        encoding='utf-8')
         formatter = logging.Formatter(format)
         handler_.setFormatter(formatter)
         return handler_
 
+    def add_handler(self, handler_: logging.Handler):
+        """添加由写入线程处理的handler"""
+        self.listener.handlers = self.listener.handlers + (handler_,)
+
+    def stop(self):
+        """处理完队列中剩余的记录后停止写入线程"""
+        if self.__if_running:
+            self.__if_running = False
+            self.listener.stop()
+
     def __call__(self, *args, **kwargs):
         return self.logger
 
@@ -52,8 +120,34 @@ class OperateLogger():
                                        encoding='utf-8')
         formatter = logging.Formatter(FORMAT)
         handler_.setFormatter(formatter)
-        self.logger.addHandler(handler_)
+        log_manager.add_handler(handler_)  # 与程序日志共用写入线程
         self.logger.setLevel(logging.INFO)
 
 
-logger = Logger()()
+def log_files(file_name=None, backup_count=BACKUP_COUNT) -> list:
+    """日志文件及其轮转文件，按时间从旧到新排序"""
+    file_name = Path(file_name or init_log())
+    files = [Path(f'{file_name}.{i}') for i in range(backup_count, 0, -1)] + [file_name]
+    return [i for i in files if i.exists()]
+
+
+def search_log(keyword: str, file_name=None, limit=1000) -> list:
+    """
+    在日志文件(包括轮转文件)中逐行查找包含keyword的记录
+    Args:
+        keyword: 关键字
+        file_name: 日志文件，默认为程序日志文件
+        limit: 最多返回的条数，超出时保留最新的记录
+
+    Returns:
+        [日志行, ...]，按时间从旧到新排序
+    """
+    matched = deque(maxlen=limit)
+    for file_path in log_files(file_name):
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            matched.extend(line.rstrip('\n') for line in f if keyword in line)
+    return list(matched)
+
+
+log_manager = Logger()
+logger = log_manager()
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+基于asyncio的串口，接口与ConSerial对应(open/read/write/close)
+在事件循环中监听串口文件描述符(loop.add_reader)，一个事件循环即可同时服务几十个串口，不需要每个串口一个线程
+仅支持POSIX(Linux/macOS)，Windows上继续使用ConSerial
+用法:
+    con = AsyncConSerial()
+    await con.open('/dev/ttyUSB0', 115200)
+    await con.write(HID_REQUEST_FRAME)
+    frame = await con.read_frame(time.monotonic() + 2)
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+from serial import Serial
+from serial.serialutil import SerialException, SerialTimeoutException
+
+from log import logger
+from serial_.conserial import OPEN_RETRY_POLICY, OUT_WAITING_LIMIT, OUT_WAITING_TIMEOUT, OUT_WAITING_POLL
+from serial_.pyboard import READ_FRAME_TIMEOUT
+from utils.metrics import metrics
+from utils.protocol_utils import FrameDecoder
+
+READ_SIZE = 4096  # 每次从串口读取的最大字节数
+
+
+@OPEN_RETRY_POLICY
+def open_serial(port, baudrate, rtscts=False) -> Serial:
+    """以非阻塞方式打开串口"""
+    logger.info(f'async connect to {port} {baudrate} rtscts={rtscts}')
+    con = Serial(baudrate=baudrate, timeout=0, write_timeout=0, rtscts=rtscts)
+    con.port = port
+    con.open()
+    try:
+        con.fileno()
+    except (AttributeError, NotImplementedError):
+        con.close()
+        raise SerialException('异步串口仅支持POSIX系统')
+    return con
+
+
+class AsyncConSerial:
+    """
+    异步串口，收到的数据先进入缓冲区，read读取原始字节，read_frame读取完整且校验通过的一帧
+    同一串口同一时间只能有一个协程读取
+    """
+
+    def __init__(self):
+        self.port = ''
+        self.baudrate = 0
+        self.con = None
+        self.is_open = False
+        self.decoder = FrameDecoder()  # 串口数据流解析
+        self.__loop = None
+        self.__fd = None
+        self.__buffer = bytearray()  # 已收到但尚未读取的数据
+        self.__frames = deque()  # 已解析但尚未读取的帧
+        self.__data_event = asyncio.Event()  # 收到新数据或串口关闭
+        self.__error = None  # 读取时发生的串口异常
+
+    async def open(self, port, baudrate, rtscts=False):
+        self.__loop = asyncio.get_running_loop()
+        self.port = port
+        self.baudrate = baudrate
+        with metrics.timer('port_open'):
+            self.con = await self.__loop.run_in_executor(None, open_serial, port, baudrate, rtscts)  # 重试时会等待
+        self.__fd = self.con.fileno()
+        self.__error = None
+        self.clear_frames()
+        self.__loop.add_reader(self.__fd, self.__on_readable)
+        self.is_open = True
+
+    def close(self):
+        if self.is_open:
+            self.__loop.remove_reader(self.__fd)
+            self.con.close()
+            self.is_open = False
+            self.__data_event.set()  # 唤醒正在等待的读取
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __on_readable(self):
+        try:
+            data = os.read(self.__fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:  # 串口被拔出等
+            data, self.__error = b'', SerialException(f'{self.port} 读取失败: {e}')
+        if not data:
+            self.__error = self.__error or SerialException(f'{self.port} 串口已断开')
+            logger.warning(f'{self.__error}')
+            self.close()
+            return
+        logger.debug('read data < %r', data)
+        metrics.inc('bytes_read', len(data))
+        self.__buffer.extend(data)
+        self.__data_event.set()
+
+    def __check_open(self):
+        if self.__error is not None:
+            raise self.__error
+        if not self.is_open:
+            raise SerialException(f'{self.port} 串口未打开')
+
+    async def __wait_data(self, deadline) -> bool:
+        """等待新数据，deadline(time.monotonic())前没有数据时返回False"""
+        self.__data_event.clear()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            await asyncio.wait_for(self.__data_event.wait(), remaining)
+        except asyncio.TimeoutError:
+            return False
+        self.__check_open()
+        return True
+
+    def inWaiting(self):
+        if self.is_open:
+            return len(self.__buffer)
+
+    async def read(self, size, deadline=None) -> bytes:
+        """读取最多size字节，没有数据时等待到deadline，超时返回b''"""
+        deadline = time.monotonic() + READ_FRAME_TIMEOUT if deadline is None else deadline
+        self.__check_open()
+        while not self.__buffer:
+            if not await self.__wait_data(deadline):
+                return b''
+        data = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        return data
+
+    async def read_frame(self, deadline=None):
+        """
+        读取一帧完整且校验通过的协议数据，收到完整一帧立即返回
+        Args:
+            deadline: 截止时间(time.monotonic())，None为READ_FRAME_TIMEOUT秒后
+
+        Returns:
+            bytes, 一帧数据；截止时间前没有读到完整一帧时返回None
+        """
+        deadline = time.monotonic() + READ_FRAME_TIMEOUT if deadline is None else deadline
+        self.__check_open()
+        while True:
+            if self.__buffer:
+                self.__frames.extend(self.decoder.feed_raw(self.__buffer))
+                self.__buffer.clear()
+            if self.__frames:
+                return self.__frames.popleft()
+            if not await self.__wait_data(deadline):
+                logger.warning(f'{self.port} 截止时间前没有获取到完整数据')
+                return None
+
+    def clear_frames(self):
+        """丢弃已收到但尚未读取的数据"""
+        self.decoder.clear()
+        self.__buffer.clear()
+        self.__frames.clear()
+
+    async def write(self, data: bytes):
+        """写入全部数据，串口输出缓冲区满时等待可写"""
+        self.__check_open()
+        logger.debug('write > %r', data)
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self.__fd, view)
+            except BlockingIOError:
+                written = 0
+            except OSError as e:
+                raise SerialException(f'{self.port} 写入失败: {e}')
+            view = view[written:]
+            if view:
+                await self.__wait_writable()
+        metrics.inc('bytes_written', len(data))
+
+    async def __wait_writable(self):
+        writable = self.__loop.create_future()
+        self.__loop.add_writer(self.__fd, lambda: writable.done() or writable.set_result(None))
+        try:
+            await writable
+        finally:
+            self.__loop.remove_writer(self.__fd)
+
+    async def write_chunked(self, data: bytes, chunk_size: int, interval: float = 0, drain: bool = False,
+                            max_out_waiting: int = OUT_WAITING_LIMIT):
+        """
+        分批写入，参数同ConSerial.write_chunked，批次之间的等待不阻塞事件循环
+        """
+        if chunk_size <= 0:
+            chunk_size = len(data)
+        view = memoryview(data)
+        for start in range(0, len(view), chunk_size):
+            if start and interval:
+                await asyncio.sleep(interval)
+            chunk = view[start:start + chunk_size]
+            if max_out_waiting > 0 and not drain:
+                await self.__wait_out_waiting(max(max_out_waiting - len(chunk), 0))
+            await self.write(chunk)
+            if drain:
+                await self.__loop.run_in_executor(None, self.con.flush)
+
+    async def __wait_out_waiting(self, limit: int):
+        """等待输出缓冲区积压不超过limit字节，同ConSerial"""
+        deadline = time.monotonic() + OUT_WAITING_TIMEOUT
+        while True:
+            try:
+                pending = self.con.out_waiting
+            except (AttributeError, NotImplementedError):
+                return
+            if pending <= limit:
+                return
+            if time.monotonic() >= deadline:
+                raise SerialTimeoutException(f'{self.port} 输出缓冲区{pending}字节超过{OUT_WAITING_TIMEOUT}秒未发送')
+            await asyncio.sleep(OUT_WAITING_POLL)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# 串口连接管理：整个流程中保持串口打开
+from serial.serialutil import SerialException
+
+from log import logger
+from serial_.pyboard import PyBoard
+
+
+class BoardConnection:
+    """
+    流程期间保持串口打开，不再每台设备打开/关闭一次
+    只有发生SerialException(串口被拔出、无法访问等)时才关闭，下次open时重新打开
+    通过协议判断设备更换：读到不同的HID，或者设备无响应之后再次响应
+    """
+
+    def __init__(self, port: str, baudrate: int, **board_options):
+        self.port = port
+        self.baudrate = baudrate
+        self.board_options = board_options  # PyBoard参数，如rtscts、chunk_size
+        self.board = None  # PyBoard
+        self.last_hid = None  # 最近一次读到的HID
+        self.if_lost = False  # 最近一次读取HID后设备是否无响应过
+
+    @property
+    def is_open(self) -> bool:
+        return self.board is not None and self.board.is_open
+
+    def open(self) -> PyBoard:
+        """返回已打开的串口连接，串口未打开时重新打开"""
+        if not self.is_open:
+            self.board = PyBoard(self.port, self.baudrate, **self.board_options)
+            self.last_hid = None
+            self.if_lost = False
+        return self.board
+
+    def close(self):
+        if self.is_open:
+            self.board.close()
+        self.board = None
+
+    def on_error(self, e: Exception):
+        """通信异常，只有SerialException才关闭串口"""
+        if isinstance(e, SerialException):
+            logger.warning(f'{self.port} 串口异常，关闭串口 {e}')
+            self.close()
+        else:
+            self.on_timeout()
+
+    def on_timeout(self):
+        """设备无响应，可能正在更换设备"""
+        self.if_lost = True
+
+    def is_new_board(self, hid: str) -> bool:
+        """根据读到的HID判断是否更换了设备，更换时丢弃串口中上一台设备残留的数据"""
+        if_new = hid != self.last_hid or self.if_lost
+        self.last_hid = hid
+        self.if_lost = False
+        if if_new and self.is_open:
+            self.board.clear_frames()
+        return if_new
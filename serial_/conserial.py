@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
+import logging
+import time
+
 from serial import Serial
+from serial.serialutil import SerialException, SerialTimeoutException
 
 from log import logger
-from utils.retry import retry
+from utils.metrics import metrics
+from utils.retry import RetryPolicy
+
+# 打开串口的重试策略：只重试串口异常，总时长不超过5秒
+OPEN_RETRY_POLICY = RetryPolicy(tries=3, delay=0.5, backoff=2, deadline=5, jitter=0.1,
+                                retry_on=(SerialException, OSError), logger=logger)
+OUT_WAITING_LIMIT = 256  # 分批写入时输出缓冲区最多积压的字节数，<=0时不检查
+OUT_WAITING_TIMEOUT = 2  # 等待输出缓冲区低于上限的最长时间(秒)
+OUT_WAITING_POLL = 0.001  # 查询输出缓冲区的间隔(秒)
 
 
 class ConSerial:
@@ -13,36 +25,96 @@ class ConSerial:
         self.con = None
         self.is_open = False
 
-    @retry(logger)
-    def __open(self, port, baudrate):
-        logger.info(f'connect to {port} {baudrate}')
-        con = Serial(baudrate=baudrate, interCharTimeout=1, timeout=2)
+    @OPEN_RETRY_POLICY
+    def __open(self, port, baudrate, rtscts):
+        logger.info(f'connect to {port} {baudrate} rtscts={rtscts}')
+        con = Serial(baudrate=baudrate, interCharTimeout=1, timeout=2, rtscts=rtscts)
         con.port = port
         con.open()
         return con
 
-    def open(self, port, baudrate):
+    def open(self, port, baudrate, rtscts=False):
         self.port = port
         self.baudrate = baudrate
-        self.con = self.__open(port, baudrate)
+        with metrics.timer('port_open'):
+            self.con = self.__open(port, baudrate, rtscts)
         self.is_open = True
 
     def close(self):
         if self.is_open:
             self.con.close()
+            self.is_open = False
 
     def inWaiting(self):
         if self.is_open:
             return self.con.inWaiting()
 
+    def set_timeout(self, timeout):
+        """设置读超时时间(秒)"""
+        if self.is_open:
+            self.con.timeout = timeout
+
     def read(self, size) -> bytes:
         if self.is_open:
-            logger.debug(f'read size {size}')
+            logger.debug('read size %s', size)
             data = self.con.read(size)
-            logger.debug(f'read data < {data}')
+            logger.debug('read data < %r', data)
+            metrics.inc('bytes_read', len(data))
             return data
 
     def write(self, data: bytes):
         if self.is_open:
-            logger.debug(f'write > {data}')
+            logger.debug('write > %r', data)
             self.con.write(data)
+            metrics.inc('bytes_written', len(data))
+
+    def write_chunked(self, data: bytes, chunk_size: int, interval: float = 0, drain: bool = False,
+                      max_out_waiting: int = OUT_WAITING_LIMIT):
+        """
+        分批写入，避免端侧串口接收缓冲区溢出
+        Args:
+            data: 待写入数据
+            chunk_size: 每批字节数，<=0时一次写入
+            interval: 批次之间的间隔(秒)
+            drain: 每批写入后等待输出缓冲区发送完毕再写下一批
+            max_out_waiting: 写入每批前等待输出缓冲区积压(out_waiting)加上该批不超过此字节数，<=0时不等待
+                开启RTS/CTS时端侧来不及接收会停止发送，积压增加，写入随之暂停
+        Raises:
+            SerialTimeoutException: 输出缓冲区超过OUT_WAITING_TIMEOUT秒没有低于上限
+        """
+        if not self.is_open:
+            return
+        if chunk_size <= 0:
+            chunk_size = len(data)
+        view = memoryview(data)
+        if_debug = logger.isEnabledFor(logging.DEBUG)
+        for start in range(0, len(view), chunk_size):
+            if start and interval:
+                time.sleep(interval)
+            chunk = view[start:start + chunk_size]
+            if max_out_waiting > 0 and not drain:
+                self.__wait_out_waiting(max(max_out_waiting - len(chunk), 0))
+            if if_debug:
+                logger.debug('write > %r', bytes(chunk))
+            self.con.write(chunk)
+            if drain:
+                self.con.flush()
+        metrics.inc('bytes_written', len(view))
+
+    def __wait_out_waiting(self, limit: int):
+        """等待输出缓冲区积压不超过limit字节，串口不支持out_waiting时直接返回"""
+        deadline = time.monotonic() + OUT_WAITING_TIMEOUT
+        if_waited = False
+        while True:
+            try:
+                pending = self.con.out_waiting
+            except (AttributeError, NotImplementedError):
+                return
+            if pending <= limit:
+                if if_waited:
+                    metrics.inc('write_backpressure')
+                return
+            if time.monotonic() >= deadline:
+                raise SerialTimeoutException(f'{self.port} 输出缓冲区{pending}字节超过{OUT_WAITING_TIMEOUT}秒未发送')
+            if_waited = True
+            time.sleep(OUT_WAITING_POLL)
@@ -1,14 +1,28 @@
 # -*- coding: utf-8 -*-
 # 串口操作类
 
-import serial.tools.list_ports
 import time
+from collections import deque
 
 from log import logger
-from serial_.conserial import ConSerial
+from serial.serialutil import SerialException
+
+from serial_.conserial import ConSerial, OPEN_RETRY_POLICY, OUT_WAITING_LIMIT
 from utils.convert_utils import strhextobytes, bytestostrhex
-from utils.retry import retry
-from utils.protocol_utils import parse_protocol, build_protocol
+from utils.metrics import metrics
+from utils.retry import RetryPolicy, retry_remaining
+from utils.protocol_utils import encode_frame, FrameDecoder
+
+
+READ_FRAME_TIMEOUT = 4  # 等待一帧完整响应的总时长(秒)
+HID_REQUEST_FRAME = encode_frame()  # 请求hid指令帧
+LICENSE_CHUNK_SIZE = 64  # license帧每批写入的字节数，<=0时一次写入
+LICENSE_CHUNK_INTERVAL = 0.005  # license帧批次之间的间隔(秒)
+LICENSE_CHUNK_DRAIN = False  # 每批写入后等待串口发送完毕，默认改为按输出缓冲区积压限流
+LICENSE_CHUNK_OUT_WAITING = OUT_WAITING_LIMIT  # 不等待发送完毕时，输出缓冲区最多积压的字节数
+# 串口通信的重试策略：read_frame本身已等待整帧，超时返回None不重试；只重试串口异常，总时长有上限
+BOARD_RETRY_POLICY = RetryPolicy(tries=2, delay=0.2, backoff=2, max_delay=1, deadline=READ_FRAME_TIMEOUT + 2,
+                                 jitter=0.1, retry_on=(SerialException, OSError), logger=logger)
 
 
 class PyBoardException(Exception):
@@ -17,9 +31,18 @@ class PyBoardException(Exception):
 
 class PyBoard:
 
-    @retry(logger)
-    def __init__(self, port: str, baudrate: int):
+    @OPEN_RETRY_POLICY
+    def __init__(self, port: str, baudrate: int, rtscts=False, chunk_size=LICENSE_CHUNK_SIZE,
+                 chunk_interval=LICENSE_CHUNK_INTERVAL, chunk_drain=LICENSE_CHUNK_DRAIN,
+                 chunk_out_waiting=LICENSE_CHUNK_OUT_WAITING):
+        self.rtscts = rtscts  # RTS/CTS硬件流控
+        self.chunk_size = chunk_size
+        self.chunk_interval = chunk_interval
+        self.chunk_drain = chunk_drain
+        self.chunk_out_waiting = chunk_out_waiting
         self.con_serial = ConSerial()
+        self.decoder = FrameDecoder()  # 串口数据流解析
+        self.__frames = deque()  # 已解析但尚未读取的帧
         print(f'连接到开发板: {port} {baudrate}')
         self.open(port, baudrate)
         print(f'连接到开发板完成')
@@ -30,7 +53,8 @@ class PyBoard:
         self.is_open = self.con_serial.is_open
 
     def open(self, port: str, baudrate: int):
-        self.con_serial.open(port, baudrate)
+        self.clear_frames()
+        self.con_serial.open(port, baudrate, self.rtscts)
         self.__update_state()
 
     def close(self):
@@ -38,54 +62,50 @@ class PyBoard:
         self.is_open = False
         self.__update_state()
 
-    @retry(logger)
+    @metrics.timed('get_hid')
+    @BOARD_RETRY_POLICY
     def get_HID(self) -> str:  # TODO 添加日志
         """
         从端侧获取设备HID
         Returns:
 
         """
-        hid_request = build_protocol('')
-        command = strhextobytes(hid_request)
-        self.con_serial.write(command)
-        time.sleep(1)
-        ret = None
-        times = 1
-        while not ret and times <= 4:
-            size = self.con_serial.inWaiting()
-            if size:
-                ret = self.con_serial.read(size)  # TODO 分段读取
-            else:
-                print(f'第{times}次没有获取到数据')
-                logger.warning(f'第{times}次没有获取到数据')
-                times += 1
-                time.sleep(1)
+        self.clear_frames()
+        self.con_serial.write(HID_REQUEST_FRAME)
+        ret = self.read_frame()
         if ret is not None:
             return bytestostrhex(ret)
         return ret
 
-    @retry(logger)
-    def send_license(self, license: str) -> None:  # TODO 添加日志
+    @metrics.timed('write_license')
+    @BOARD_RETRY_POLICY
+    def send_license(self, license) -> None:  # TODO 添加日志
         """
         将License发送到端侧
         Args:`
-            license:
+            license: bytes, 组装好的license帧；或其十六进制字符串
 
         Returns:
 
         """
         if license:
-            # if len(license) % 2 != 0:
-            #     raise PyBoardException('Odd-length string')
-            license_byte = strhextobytes(license)  # TODO 奇偶判断
-            self.con_serial.write(license_byte)  # 分批次写入
-
-    @retry(logger)
+            if isinstance(license, str):
+                # if len(license) % 2 != 0:
+                #     raise PyBoardException('Odd-length string')
+                license = strhextobytes(license)  # TODO 奇偶判断
+            start = time.perf_counter()
+            self.con_serial.write_chunked(license, self.chunk_size, self.chunk_interval, self.chunk_drain,
+                                          self.chunk_out_waiting)
+            cost = time.perf_counter() - start
+            logger.info(f'license写入{len(license)}字节，耗时{cost:.3f}s，'
+                        f'{len(license) / cost if cost else 0:.0f}B/s (分批{self.chunk_size}字节)')
+
+    @BOARD_RETRY_POLICY
     def confirm_license_correct(self) -> bool:  # TODO 添加日志
         """同端侧确认License校验是否成功"""  # TODO
         pass
 
-    @retry(logger)
+    @BOARD_RETRY_POLICY
     def __record_HID_activated(self):
         """如果端侧License校验成功，则对该设备HID进行本地存储"""  # TODO
         pass
@@ -93,23 +113,48 @@ class PyBoard:
     @classmethod
     def get_list(cls):
         """获取串口列表"""
+        import serial.tools.list_ports  # 延迟导入，加快程序启动
+
         port_list = serial.tools.list_ports.comports()
         port_list = [i.name for i in port_list]
         return port_list
 
-    @retry(logger)
+    @BOARD_RETRY_POLICY
     def read_response(self):
-        ret = None
-        times = 1
-        while not ret and times <= 4:
-            size = self.con_serial.inWaiting()
-            if size:
-                ret = self.con_serial.read(size)  # TODO 分段读取
-            else:
-                print(f'第{times}次没有获取到数据')
-                logger.warning(f'第{times}次没有获取到数据')
-                times += 1
-                time.sleep(1)
+        ret = self.read_frame()
         if ret is not None:
             return bytestostrhex(ret)
         return ret
+
+    @metrics.timed('read_frame')
+    def read_frame(self, timeout=READ_FRAME_TIMEOUT):
+        """
+        读取一帧完整且校验通过的协议数据，收到完整一帧立即返回，不做固定时长等待
+        分段到达的帧会被拼接，连续到达的多帧会依次返回，无效数据会被丢弃
+        Args:
+            timeout: 读取整帧的总时长(秒)
+
+        Returns:
+            bytes, 一帧数据；超时未读到完整一帧时返回None
+        """
+        remaining_budget = retry_remaining()  # 在重试中时不超过重试的截止时间
+        if remaining_budget is not None:
+            timeout = min(timeout, remaining_budget)
+        deadline = time.monotonic() + timeout
+        while not self.__frames:
+            if not self.con_serial.is_open:
+                raise PyBoardException('串口未打开')
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f'{timeout}秒内没有获取到完整数据')
+                return None
+            self.con_serial.set_timeout(remaining)
+            data = self.con_serial.read(max(self.con_serial.inWaiting() or 0, 1))
+            if data:
+                self.__frames.extend(self.decoder.feed_raw(data))
+        return self.__frames.popleft()
+
+    def clear_frames(self):
+        """丢弃已缓存但尚未读取的数据"""
+        self.decoder.clear()
+        self.__frames.clear()
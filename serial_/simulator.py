@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+虚拟开发板：基于Linux伪终端(pty)模拟端侧，用于无硬件时的测试和压测
+    hid_request -> hid_response
+    license_put_request -> license_put_response(DataError)
+    license_clean_request -> license_clean_response
+    其它指令 -> reset_response
+用法: python -m serial_.simulator --hids 35D9C0AE729DB9E0 35D9C0AE729DB9E1 --latency 0.01
+"""
+import argparse
+import os
+import pty
+import random
+import select
+import time
+import tty
+from collections import deque
+from threading import Thread, Lock
+
+from log import logger
+from utils.entities import ProtocolCommand, DataError
+from utils.protocol_utils import FrameDecoder, encode_frame
+
+HID_REQUEST = int(ProtocolCommand.hid_request.value, 16)
+HID_RESPONSE = int(ProtocolCommand.hid_response.value, 16)
+LICENSE_PUT_REQUEST = int(ProtocolCommand.license_put_request.value, 16)
+LICENSE_PUT_RESPONSE = int(ProtocolCommand.license_put_response.value, 16)
+LICENSE_CLEAN_REQUEST = int(ProtocolCommand.license_clean_request.value, 16)
+LICENSE_CLEAN_RESPONSE = int(ProtocolCommand.license_clean_response.value, 16)
+RESET_RESPONSE = int(ProtocolCommand.reset_response.value, 16)
+# 随机写入失败时返回的错误码
+RANDOM_ERRORS = (DataError.LICENSE_UART_RECV_TIMEOUT, DataError.LICENSE_UART_CHECK_SUM_FAIL,
+                 DataError.LICENSE_WRITE_FAIL)
+
+
+class BoardSimulator:
+    """
+    虚拟开发板，打开一对pty，port为供PyBoard连接的串口路径
+    Args:
+        hids: 设备HID池(十六进制字符串)，依次模拟插入的设备
+        latency: 收到请求到开始响应的延迟(秒)，期间不处理其它请求
+        transit_delay: 响应在线路上的传输延迟(秒)，期间可以继续处理请求
+        chunk_size: 响应分段发送的字节数，<=0时整帧发送
+        chunk_interval: 分段之间的间隔(秒)
+        corruption_rate: 响应中随机篡改一个字节的概率
+        error_rate: license写入随机失败的概率
+        error_codes: {组件id: DataError}，指定组件固定返回的错误码
+        auto_swap: 当前设备写入过license后，下一次hid_request时自动更换为HID池中的下一台设备
+        pipeline: 是否支持连续接收多个license帧，False时从收到license帧到发出响应期间收到的数据都会被丢弃
+        seed: 随机数种子
+    """
+
+    def __init__(self, hids, latency=0.0, transit_delay=0.0, chunk_size=0, chunk_interval=0.0, corruption_rate=0.0,
+                 error_rate=0.0, error_codes=None, auto_swap=True, pipeline=True, seed=None):
+        self.hids = list(hids)
+        self.latency = latency
+        self.transit_delay = transit_delay
+        self.chunk_size = chunk_size
+        self.chunk_interval = chunk_interval
+        self.corruption_rate = corruption_rate
+        self.error_rate = error_rate
+        self.error_codes = error_codes or dict()
+        self.auto_swap = auto_swap
+        self.pipeline = pipeline
+        self.random = random.Random(seed)
+        self.port = None  # 供PyBoard连接的串口路径
+        self.licenses = dict()  # 写入成功的license {HID: {组件id: license}}
+        self.requests = 0  # 收到的请求帧数
+        self.dropped = 0  # 不支持流水线时丢弃的数据次数
+        self.__lock = Lock()
+        self.__board_idx = 0
+        self.__if_written = False  # 当前设备是否写入过license
+        self.__master = None
+        self.__slave = None
+        self.__running = False
+        self.__thread = None
+        self.__decoder = FrameDecoder()
+        self.__outgoing = deque()  # 传输中的响应 [(送达时间, 响应帧), ...]
+
+    @property
+    def current_hid(self):
+        """当前插入的设备HID，HID池用完时为None(没有设备)"""
+        with self.__lock:
+            return self.hids[self.__board_idx] if self.__board_idx < len(self.hids) else None
+
+    def next_board(self):
+        """更换为HID池中的下一台设备"""
+        with self.__lock:
+            self.__board_idx += 1
+            self.__if_written = False
+
+    def start(self):
+        self.__master, self.__slave = pty.openpty()
+        tty.setraw(self.__slave)
+        self.port = os.ttyname(self.__slave)
+        self.__running = True
+        self.__thread = Thread(target=self.__run, name=f'simulator-{self.port}', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+        for fd in (self.__master, self.__slave):
+            if fd is not None:
+                os.close(fd)
+        self.__master = self.__slave = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __run(self):
+        while self.__running:
+            timeout = 0.05
+            if self.__outgoing:
+                timeout = min(max(self.__outgoing[0][0] - time.monotonic(), 0), timeout)
+            readable, _, _ = select.select([self.__master], [], [], timeout)
+            self.__deliver()
+            if not readable:
+                continue
+            try:
+                data = os.read(self.__master, 4096)
+            except OSError:
+                continue
+            if not self.pipeline and self.__outgoing:  # 上一个响应尚未发出，不接收新的数据
+                self.__drop()
+                continue
+            for frame in self.__decoder.feed(data):
+                self.requests += 1
+                response = self.handle(frame)
+                if response is not None:
+                    self.__send(response)
+                if not self.pipeline and frame.command == LICENSE_PUT_REQUEST:  # 同一批数据中其余的帧被丢弃
+                    self.__drop()
+                    break
+
+    def __drop(self):
+        """丢弃已收到和缓冲区中的数据"""
+        self.dropped += 1
+        self.__decoder.clear()
+        while select.select([self.__master], [], [], 0)[0]:
+            try:
+                os.read(self.__master, 4096)
+            except OSError:
+                break
+
+    def __deliver(self):
+        """发出已到送达时间的响应"""
+        while self.__outgoing and self.__outgoing[0][0] <= time.monotonic():
+            self.__write(self.__outgoing.popleft()[1])
+
+    def handle(self, frame):
+        """根据请求帧返回响应帧，没有设备时返回None"""
+        if frame.command == HID_REQUEST:
+            with self.__lock:
+                if self.auto_swap and self.__if_written:
+                    self.__board_idx += 1
+                    self.__if_written = False
+            hid = self.current_hid
+            if hid is None:
+                return None
+            return encode_frame(bytes.fromhex(hid), command=HID_RESPONSE)
+        hid = self.current_hid
+        if hid is None:
+            return None
+        if frame.command == LICENSE_PUT_REQUEST:
+            component_id = f'{frame.component_id:04X}'
+            error = self.error_codes.get(component_id)
+            if error is None and self.random.random() < self.error_rate:
+                error = self.random.choice(RANDOM_ERRORS)
+            if error is None:
+                error = DataError.LICENSE_PROCESS_OK
+                with self.__lock:
+                    self.licenses.setdefault(hid, dict())[component_id] = frame.data
+                    self.__if_written = True
+            return encode_frame(bytes.fromhex(error.value), frame.component_id, LICENSE_PUT_RESPONSE)
+        if frame.command == LICENSE_CLEAN_REQUEST:
+            with self.__lock:
+                self.licenses.get(hid, dict()).pop(f'{frame.component_id:04X}', None)
+            return encode_frame(bytes.fromhex(DataError.LICENSE_PROCESS_OK.value), frame.component_id,
+                                LICENSE_CLEAN_RESPONSE)
+        return encode_frame(bytes.fromhex(DataError.LICENSE_CMD_ERR.value), frame.component_id, RESET_RESPONSE)
+
+    def __send(self, response: bytes):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.transit_delay:
+            self.__outgoing.append((time.monotonic() + self.transit_delay, response))
+        else:
+            self.__write(response)
+
+    def __write(self, response: bytes):
+        if self.random.random() < self.corruption_rate:
+            response = bytearray(response)
+            response[self.random.randrange(len(response))] ^= 0xFF
+            logger.debug('simulator corrupt response %r', bytes(response))
+        chunk_size = self.chunk_size if self.chunk_size > 0 else len(response)
+        for start in range(0, len(response), chunk_size):
+            if start and self.chunk_interval:
+                time.sleep(self.chunk_interval)
+            os.write(self.__master, response[start:start + chunk_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hids', nargs='+', default=['35D9C0AE729DB9E0'])
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--transit-delay', type=float, default=0.0)
+    parser.add_argument('--chunk-size', type=int, default=0)
+    parser.add_argument('--chunk-interval', type=float, default=0.0)
+    parser.add_argument('--corruption-rate', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--no-pipeline', action='store_false', dest='pipeline', help='不支持连续接收多个license帧')
+    args = parser.parse_args()
+    with BoardSimulator(args.hids, latency=args.latency, transit_delay=args.transit_delay, chunk_size=args.chunk_size,
+                        chunk_interval=args.chunk_interval, corruption_rate=args.corruption_rate,
+                        error_rate=args.error_rate, pipeline=args.pipeline) as simulator:
+        print(f'虚拟开发板已启动: {simulator.port}  (Ctrl+C 退出)')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
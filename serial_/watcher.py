@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+串口热插拔监听：后台线程定期枚举串口，去抖后通知串口接入/移除
+Linux上先比较/sys/class/tty的设备列表，没有变化时不重新枚举；其它系统每次轮询都枚举
+界面和流程读取缓存的串口列表，不在界面线程中枚举串口
+"""
+import os
+from threading import Thread, Event, Lock
+
+from log import logger
+
+PORT_POLL_INTERVAL = 1  # 轮询间隔(秒)
+PORT_DEBOUNCE = 2  # 连续多少次轮询结果一致才认为串口接入/移除
+SYSFS_TTY = '/sys/class/tty'
+
+
+def sysfs_signature():
+    """
+    Linux下有硬件设备的tty列表，用于快速判断串口是否变化
+    Returns:
+        frozenset；不支持sysfs时返回None
+    """
+    try:
+        return frozenset(name for name in os.listdir(SYSFS_TTY)
+                         if os.path.exists(os.path.join(SYSFS_TTY, name, 'device')))
+    except OSError:
+        return None
+
+
+def list_ports() -> list:
+    """枚举串口，返回可直接打开的串口路径(Windows下为COM3等，Linux下为/dev/ttyUSB0等)"""
+    import serial.tools.list_ports  # 延迟导入，加快程序启动
+
+    return [i.device for i in serial.tools.list_ports.comports()]
+
+
+class PortWatcher(Thread):
+    """
+    串口热插拔监听
+    Args:
+        interval: 轮询间隔(秒)
+        debounce: 连续debounce次轮询都出现(或都消失)才通知接入(或移除)，避免插拔抖动
+        list_ports: 枚举串口的函数，返回串口名列表
+        use_sysfs: Linux下sysfs设备列表没有变化时复用上次的枚举结果
+        on_added: 串口接入回调 on_added(port)，在监听线程中调用
+        on_removed: 串口移除回调 on_removed(port)，在监听线程中调用
+        notify_initial: 第一次轮询时已有的串口是否通知接入，为False时只更新串口列表
+    """
+
+    def __init__(self, interval=PORT_POLL_INTERVAL, debounce=PORT_DEBOUNCE, list_ports=list_ports, use_sysfs=True,
+                 on_added=None, on_removed=None, notify_initial=True):
+        super().__init__(name='port-watcher', daemon=True)
+        self.interval = interval
+        self.debounce = max(debounce, 1)
+        self.list_ports = list_ports
+        self.use_sysfs = use_sysfs
+        self.notify_initial = notify_initial
+        self.enumerations = 0  # 实际枚举串口的次数
+        self.__listeners = []  # [(on_added, on_removed), ...]
+        self.__lock = Lock()
+        self.__ports = []  # 去抖后的串口列表
+        self.__seen = dict()  # 尚未确认的变化 {串口: 连续观察到的次数}
+        self.__last_ports = None  # 最近一次枚举结果
+        self.__signature = None  # 最近一次枚举时的sysfs设备列表
+        self.__stop_event = Event()
+        if on_added is not None or on_removed is not None:
+            self.subscribe(on_added, on_removed)
+
+    @property
+    def ports(self) -> list:
+        """当前串口列表(缓存)"""
+        with self.__lock:
+            return list(self.__ports)
+
+    def subscribe(self, on_added=None, on_removed=None):
+        with self.__lock:
+            self.__listeners.append((on_added, on_removed))
+
+    def unsubscribe(self, on_added=None, on_removed=None):
+        with self.__lock:
+            if (on_added, on_removed) in self.__listeners:
+                self.__listeners.remove((on_added, on_removed))
+
+    def run(self):
+        while True:
+            self.poll()
+            if self.__stop_event.wait(self.interval):
+                return
+
+    def stop(self):
+        self.__stop_event.set()
+
+    def poll(self) -> tuple:
+        """
+        轮询一次，通知去抖后的变化，第一次轮询时已有的串口直接确认(notify_initial为False时不通知)
+        Returns:
+            (本次确认接入的串口列表, 本次确认移除的串口列表)
+        """
+        if_first = self.__last_ports is None
+        current = self.__enumerate()
+        debounce = 1 if if_first else self.debounce
+        with self.__lock:
+            ports = set(self.__ports)
+            changed = (set(current) - ports) | (ports - set(current))
+            self.__seen = {port: self.__seen.get(port, 0) + 1 for port in changed}
+            added = [port for port in current if self.__seen.get(port, 0) >= debounce]
+            removed = [port for port in self.__ports if self.__seen.get(port, 0) >= debounce]
+            for port in added + removed:
+                del self.__seen[port]
+            self.__ports = [port for port in self.__ports if port not in removed] + added
+            listeners = list(self.__listeners) if self.notify_initial or not if_first else []
+        for port in added:
+            logger.info(f'检测到串口接入 {port}')
+            self.__notify(listeners, 0, port)
+        for port in removed:
+            logger.info(f'检测到串口移除 {port}')
+            self.__notify(listeners, 1, port)
+        return added, removed
+
+    def __enumerate(self) -> list:
+        signature = sysfs_signature() if self.use_sysfs else None
+        if signature is not None and signature == self.__signature and self.__last_ports is not None:
+            return self.__last_ports
+        try:
+            ports = list(self.list_ports())
+        except Exception as e:
+            logger.warning(f'枚举串口失败 {e}')
+            return self.__last_ports or []
+        self.enumerations += 1
+        self.__signature, self.__last_ports = signature, ports
+        return ports
+
+    @staticmethod
+    def __notify(listeners, idx, port):
+        for listener in listeners:
+            callback = listener[idx]
+            if callback is None:
+                continue
+            try:
+                callback(port)
+            except Exception as e:
+                logger.exception(e)
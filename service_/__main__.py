@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+命令行(无界面)读HID/写license，可在没有图形界面的工位上长时间运行
+用法:
+    python -m service_ hid --ports COM3,COM4 --out hids.xlsx
+    python -m service_ license --ports /dev/ttyUSB0,/dev/ttyUSB1 --map hid-license.xlsx --forever
+    python -m service_ license --watch --ports '/dev/ttyUSB*' --map hid-license.xlsx  # 串口接入时自动开始
+    python -m service_ report --ledger ledger.db --out report.xlsx  # 由台账生成报表
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+from threading import Event
+
+from dao import DaoException, STORAGE_MEMORY, STORAGE_DISK
+from log import logger
+from serial_.watcher import PortWatcher
+from service_.collect import HIDCollectEngine
+from service_.ledger import Ledger, LedgerException
+from service_.provision import ProvisionEngine, ProvisionState, split_ports
+from service_.validation import load_license_map
+from utils.file_utils import check_file_suffix
+
+BAUDRATE = 115200
+
+
+def print_log(port, content, tag=None):
+    prefix = f'[{tag}] ' if tag in ('error', 'warn') else ''
+    print(f'{time.strftime("%H:%M:%S")} [{port}] {prefix}{content}', end='' if content.endswith('\n') else '\n',
+          flush=True)
+
+
+def hid(args) -> int:
+    if not check_file_suffix(args.out):
+        print('HID记录文件需要为Excel文件(.xlsx/.xls)', file=sys.stderr)
+        return 2
+    try:
+        ledger = Ledger(args.ledger) if args.ledger else None
+    except LedgerException as e:
+        print(e, file=sys.stderr)
+        return 2
+    finished = Event()
+    engine = HIDCollectEngine([] if args.watch else split_ports(args.ports), args.baudrate, args.out,
+                              on_log=print_log, on_finished=finished.set, max_wait_time=args.max_wait_time,
+                              interval=args.interval, board_options={'rtscts': args.rtscts}, ledger=ledger)
+    wait(engine, finished, args)
+    if ledger is not None:
+        ledger.close()
+    counts = engine.statistics.counts()
+    print(f'新增HID{counts["new_add"]}个，成功{counts["new_success"]}个，失败{counts["new_failed"]}个')
+    print(f'导出{engine.export()}个HID到{args.out}，文件记录HID总共{counts["record"]}个')
+    return 0
+
+
+def license_(args) -> int:
+    try:
+        hid_license_map, report = load_license_map(args.map, args.storage, args.index)
+    except (DaoException, FileNotFoundError) as e:
+        print(f'导入license文件失败: {e}', file=sys.stderr)
+        return 2
+    print(f'导入license文件，共导入HID{hid_license_map.hids_counts}个, license{hid_license_map.licenses_counts}个')
+    print('\n'.join(report.summary()), file=sys.stdout if report.if_ok else sys.stderr)
+    try:
+        ledger = Ledger(args.ledger) if args.ledger else None
+    except LedgerException as e:
+        print(e, file=sys.stderr)
+        return 2
+    state = ProvisionState(ledger)
+    if ledger is not None:
+        print(f'台账{args.ledger}中已完成HID {state.ledger_counts["activated"]} 个')
+    finished = Event()
+    engine = ProvisionEngine([] if args.watch else split_ports(args.ports), args.baudrate, hid_license_map, state,
+                             on_log=print_log, on_finished=finished.set, max_wait_time=args.max_wait_time,
+                             interval=args.interval, board_options={'rtscts': args.rtscts},
+                             pipeline_window=args.window)
+    wait(engine, finished, args)
+    counts = state.counts()
+    print(f'完成HID {counts["activated"]} 个，成功license {counts["success_license"]} 个，'
+          f'失败license {counts["failed_license"]} 个')
+    if ledger is not None:
+        ledger.close()
+    hid_license_map.close()
+    return 0
+
+
+def report(args) -> int:
+    if not check_file_suffix(args.out):
+        print('报表文件需要为Excel文件(.xlsx/.xls)', file=sys.stderr)
+        return 2
+    if not Path(args.ledger).exists():
+        print(f'台账{args.ledger}不存在', file=sys.stderr)
+        return 2
+    with Ledger(args.ledger) as ledger:
+        counts = ledger.counts()
+        ledger.export_report(args.out)
+    print(f'导出HID {counts["hid"]} 个(已完成 {counts["activated"]} 个)到{args.out}')
+    return 0
+
+
+def wait(engine, finished: Event, args=None) -> None:
+    """
+    运行engine直到所有串口停止，Ctrl+C时等待各串口当前设备处理完成后停止
+    args.watch为True时监听串口热插拔，匹配--ports的串口接入时自动开始，一直运行直到Ctrl+C
+    """
+    watcher = None
+    if args is not None and args.watch:
+        watcher = PortWatcher()
+        watcher.poll()  # 先确认已接入的串口
+        watcher.start()
+        engine.watch(watcher, split_ports(args.ports))
+        print(f'监听串口 {args.ports}，已接入: {", ".join(watcher.ports) or "无"}', flush=True)
+    engine.start()
+    try:
+        while not finished.wait(1):
+            pass
+    except KeyboardInterrupt:
+        print('停止中...', flush=True)
+        engine.stop(wait=True)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m service_', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--ports', required=True, help='串口，多个串口用逗号分隔')
+    common.add_argument('--baudrate', type=int, default=BAUDRATE)
+    common.add_argument('--rtscts', action='store_true', help='开启RTS/CTS硬件流控')
+    common.add_argument('--interval', type=float, default=ProvisionEngine.INTERVAL,
+                        help='完成一台设备后的等待时间(秒)，用于更换设备')
+    common.add_argument('--max-wait-time', type=float, default=ProvisionEngine.MAX_WAIT_TIME,
+                        help='连续读到已完成设备的次数达到该值时自动停止该串口')
+    common.add_argument('--forever', action='store_const', const=float('inf'), dest='max_wait_time',
+                        help='不自动停止，直到Ctrl+C')
+    common.add_argument('--ledger', help='台账文件(SQLite)，记录每次写入结果，已完成的HID重启后不再写入')
+    common.add_argument('--watch', action='store_true',
+                        help='监听串口热插拔，--ports为串口匹配规则(如/dev/ttyUSB*、COM*)，接入时自动开始，直到Ctrl+C')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    hid_parser = subparsers.add_parser('hid', parents=[common], help='读HID')
+    hid_parser.add_argument('--out', required=True, help='HID记录文件(.xlsx)')
+    hid_parser.set_defaults(func=hid)
+    license_parser = subparsers.add_parser('license', parents=[common], help='写license')
+    license_parser.add_argument('--map', required=True, help='HID-license映射文件(.xlsx)')
+    license_parser.add_argument('--storage', choices=(STORAGE_MEMORY, STORAGE_DISK),
+                                help='license保存在内存中或磁盘索引中(按HID查询，适合很大的文件)，默认按文件大小选择')
+    license_parser.add_argument('--index', help='磁盘索引文件，与license文件一致时直接复用，默认使用临时文件')
+    license_parser.add_argument('--window', type=int, default=ProvisionEngine.PIPELINE_WINDOW,
+                                help='流水线写入时最多连续发送的license帧数，1为逐个写入并等待响应')
+    license_parser.set_defaults(func=license_)
+    report_parser = subparsers.add_parser('report', help='由台账生成Excel报表')
+    report_parser.add_argument('--ledger', required=True, help='台账文件(SQLite)')
+    report_parser.add_argument('--out', required=True, help='报表文件(.xlsx)')
+    report_parser.set_defaults(func=report)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logger.info(f'----------------------{args.command} start {getattr(args, "ports", "")}-----------------------')
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# 多串口读HID，与界面无关，界面和命令行共用
+from pathlib import Path
+
+from log import logger
+from service_.provision import PortWorker, ProvisionEngine
+from service_.statistics import HIDStatistics
+from utils.file_utils import record_HID_activated, export_HID, read_HID
+from utils.protocol_utils import parse_protocol
+
+
+class HIDCollectWorker(PortWorker):
+    """单个串口的读HID流程：读HID -> 未记录过的HID追加到记录文件"""
+
+    LINE_NAME = 'get hid'
+    LINE_DESC = '读HID'
+
+    def provision(self) -> bool:
+        """
+        读取当前连接设备的HID并记录
+        Returns:
+            True: 设备已处理(记录完成或此前已记录)，等待更换设备
+            False: 未能读取到设备HID或记录失败，稍后重试
+        """
+        engine = self.engine
+        self.status('reset')
+        self.log('开始读设备HID...\n')
+        try:
+            hid_response = self.conn.get_HID()
+        except Exception as e:
+            logger.warning(f'{self.port} 串口访问异常 {e}')
+            self.log('设备HID读取失败，稍后将重试或更换设备\n', tag='error')
+            self.status('fail')
+            self.connection.on_error(e)  # 串口异常时关闭，下次重新打开
+            return False
+        if hid_response is None:
+            self.log('设备HID读取失败，稍后将重试或更换设备\n', tag='error')
+            self.status('fail')
+            self.connection.on_timeout()
+            return False
+        try:
+            hid_value = parse_protocol(hid_response).payload_data.data
+        except Exception as e:
+            logger.warning(f'{self.port} 解析HID response失败 {e}')
+            self.log('解析及校验HID response失败\n', tag='error')
+            self.status('fail')
+            return False
+        if self.connection.is_new_board(hid_value):
+            self.on_new_board(hid_value)
+        self.log(f'设备HID读取成功, HID {hid_value}\n')
+
+        statistics = engine.statistics
+        if not statistics.try_add_recorded(hid_value):  # 已记录过，或其它串口正在记录
+            statistics.add_confirmed(hid_value)
+            engine.on_statistics()
+            self.wait_time += 1
+            self.log(f'设备{hid_value}已完成，请更换设备...\n', tag='warn')
+            self.status('confirm')
+            return True
+        self.wait_time = 0
+        logger.info(f'{self.port} 添加hid：{hid_value}')
+        self.log(f'记录设备{hid_value}到表格\n')
+        try:
+            record_HID_activated(hid_value, engine.hid_filepath)
+        except Exception as e:
+            logger.exception(e)
+            statistics.add_failed(hid_value)
+            engine.on_statistics()
+            self.log(f'设备{hid_value}HID存储失败\n', tag='error')
+            self.status('fail')
+            return False
+        if engine.ledger is not None:
+            try:
+                engine.ledger.record_hid(hid_value, self.port)
+            except Exception as e:  # 台账写入失败不影响读HID流程
+                logger.exception(e)
+        engine.on_statistics()
+        self.log(f'设备{hid_value}HID存储完成，请更换设备...\n', tag='confirm')
+        self.status('success')
+        return True
+
+
+class HIDCollectEngine(ProvisionEngine):
+    """
+    多串口并行读HID，每个串口一个工作线程，HID追加记录到hid_filepath，指定台账时同时记录到台账
+    回调与ProvisionEngine相同
+    """
+
+    WORKER_CLASS = HIDCollectWorker
+
+    def __init__(self, ports: list, baudrate: int, hid_filepath, statistics: HIDStatistics = None,
+                 on_log=None, on_status=None, on_statistics=None, on_finished=None,
+                 max_wait_time=ProvisionEngine.MAX_WAIT_TIME, interval=ProvisionEngine.INTERVAL, board_options=None,
+                 ledger=None):
+        super().__init__(ports, baudrate, None, on_log=on_log, on_status=on_status, on_statistics=on_statistics,
+                         on_finished=on_finished, max_wait_time=max_wait_time, interval=interval,
+                         board_options=board_options)
+        self.hid_filepath = Path(hid_filepath)
+        self.statistics = statistics if statistics is not None else HIDStatistics(read_HID(self.hid_filepath))
+        self.ledger = ledger  # Ledger
+
+    def export(self) -> int:
+        """将本轮记录的HID导出到记录文件，返回导出个数"""
+        return export_HID(self.hid_filepath)
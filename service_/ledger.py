@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+写license台账：本地SQLite数据库(WAL模式)，记录HID状态以及每个组件license的每次写入结果
+程序重启后已完成的HID不会被重复写入；启动时只读取统计数，不读取全部记录；Excel报表由台账生成
+"""
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+
+from log import logger
+
+LEDGER_FILE_NAME = 'ledger.db'  # 默认台账文件，位于日志目录
+# HID状态
+HID_RECORDED = 'recorded'  # 读HID流程已记录
+HID_ACTIVATED = 'activated'  # license全部写入成功
+HID_FAILED = 'failed'  # 最近一次写入有失败的license
+# 写入失败但没有端侧错误码时的错误类型
+ERROR_TIMEOUT = 'timeout'  # 没有收到响应
+ERROR_ENCODE = 'encode'  # license转码失败
+REPORT_HID_SHEET_NAME = 'Sheet1'  # 与HID记录文件相同，报表可作为HID记录文件使用
+REPORT_ATTEMPT_SHEET_NAME = '写入记录'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS hids (
+    hid TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    port TEXT,
+    cost REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hid TEXT NOT NULL,
+    component_id TEXT NOT NULL,
+    license TEXT,
+    if_success INTEGER NOT NULL,
+    error TEXT,
+    port TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hids_status ON hids (status);
+CREATE INDEX IF NOT EXISTS idx_attempts_hid ON attempts (hid, component_id);
+'''
+
+
+class LedgerException(Exception):
+    pass
+
+
+class Ledger:
+    """
+    写license台账，线程安全(多个串口共用一个连接)
+    Args:
+        db_path: 数据库文件路径，':memory:'为内存数据库
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        if self.db_path != ':memory:':
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.__lock = Lock()
+        try:
+            self.__conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self.__conn.execute('PRAGMA journal_mode=WAL')
+            self.__conn.execute('PRAGMA synchronous=NORMAL')  # WAL下每次提交不fsync，断电最多丢失最后几条
+            self.__conn.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            raise LedgerException(f'打开台账{self.db_path}失败: {e}')
+        logger.info(f'打开台账 {self.db_path}')
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __execute(self, sql, parameters=()):
+        with self.__lock:
+            return self.__conn.execute(sql, parameters).fetchall()
+
+    def is_activated(self, hid: str) -> bool:
+        """hid是否已经全部写入成功"""
+        return bool(self.__execute('SELECT 1 FROM hids WHERE hid = ? AND status = ?', (hid, HID_ACTIVATED)))
+
+    def status(self, hid: str):
+        """hid的状态，没有记录时返回None"""
+        rows = self.__execute('SELECT status FROM hids WHERE hid = ?', (hid,))
+        return rows[0][0] if rows else None
+
+    def record_hid(self, hid: str, port=None) -> None:
+        """读HID流程记录hid，已有记录时不修改状态"""
+        now = time.time()
+        self.__execute('INSERT INTO hids (hid, status, port, created_at, updated_at) VALUES (?, ?, ?, ?, ?) '
+                       'ON CONFLICT (hid) DO NOTHING', (hid, HID_RECORDED, port, now, now))
+
+    def record_device(self, hid: str, port, attempts: list, cost=None) -> None:
+        """
+        记录一台设备的写入结果，一个事务
+        Args:
+            hid: 设备HID
+            port: 串口
+            attempts: [(组件标志, license, 是否成功, 错误), ...]
+            cost: 写入耗时(秒)
+        """
+        now = time.time()
+        status = HID_ACTIVATED if attempts and all(if_success for _, _, if_success, _ in attempts) else HID_FAILED
+        with self.__lock:
+            try:
+                self.__conn.execute('BEGIN')
+                self.__conn.executemany(
+                    'INSERT INTO attempts (hid, component_id, license, if_success, error, port, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [(hid, component_id, license_, int(bool(if_success)), error, port, now)
+                     for component_id, license_, if_success, error in attempts])
+                self.__conn.execute(
+                    'INSERT INTO hids (hid, status, port, cost, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (hid) DO UPDATE SET status = excluded.status, port = excluded.port, '
+                    'cost = excluded.cost, updated_at = excluded.updated_at', (hid, status, port, cost, now, now))
+                self.__conn.execute('COMMIT')
+            except sqlite3.Error:
+                self.__conn.execute('ROLLBACK')
+                raise
+
+    def hids(self, status=None) -> list:
+        """按记录顺序返回HID，status为None时返回全部"""
+        if status is None:
+            rows = self.__execute('SELECT hid FROM hids ORDER BY created_at, rowid')
+        else:
+            rows = self.__execute('SELECT hid FROM hids WHERE status = ? ORDER BY created_at, rowid', (status,))
+        return [hid for hid, in rows]
+
+    def attempts(self, hid: str) -> list:
+        """hid的写入记录 [(组件标志, 是否成功, 错误, 串口, 时间), ...]"""
+        return [(component_id, bool(if_success), error, port, created_at) for component_id, if_success, error, port,
+                created_at in self.__execute('SELECT component_id, if_success, error, port, created_at FROM attempts '
+                                             'WHERE hid = ? ORDER BY id', (hid,))]
+
+    def counts(self) -> dict:
+        """
+        统计数
+        Returns:
+            {'hid': HID总数, 'activated': 已完成HID数, 'success_license': 成功license数, 'failed_license': 失败license数}
+            license按内容去重，与ProvisionState一致
+        """
+        hid_counts = dict(self.__execute('SELECT status, COUNT(*) FROM hids GROUP BY status'))
+        (success, failed), = self.__execute(
+            'SELECT COUNT(DISTINCT CASE WHEN if_success THEN license END), '
+            'COUNT(DISTINCT CASE WHEN NOT if_success THEN license END) FROM attempts')
+        return {'hid': sum(hid_counts.values()), 'activated': hid_counts.get(HID_ACTIVATED, 0),
+                'success_license': success, 'failed_license': failed}
+
+    def export_report(self, file_path) -> int:
+        """
+        生成Excel报表：Sheet1为HID及状态(可作为HID记录文件读取)，写入记录为每次写入的结果
+        Returns:
+            HID个数
+        """
+        import pandas as pd  # 延迟导入，加快程序启动
+
+        from utils.file_utils import HID_COLUMN_NAME
+
+        with self.__lock:
+            hids_df = pd.read_sql_query('SELECT hid, status, port, cost, created_at, updated_at FROM hids '
+                                        'ORDER BY created_at, rowid', self.__conn)
+            attempts_df = pd.read_sql_query('SELECT hid, component_id, if_success, error, port, created_at '
+                                            'FROM attempts ORDER BY id', self.__conn)
+        for df in (hids_df, attempts_df):
+            for column in ('created_at', 'updated_at'):
+                if column in df.columns:
+                    df[column] = df[column].map(lambda t: time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t)))
+        hids_df = hids_df.rename(columns={'hid': HID_COLUMN_NAME, 'status': '状态', 'port': '串口', 'cost': '耗时(秒)',
+                                          'created_at': '首次记录时间', 'updated_at': '更新时间'})
+        attempts_df['if_success'] = attempts_df['if_success'].astype(bool)
+        attempts_df = attempts_df.rename(columns={'hid': HID_COLUMN_NAME, 'component_id': '组件标志',
+                                                  'if_success': '是否成功', 'error': '错误', 'port': '串口',
+                                                  'created_at': '时间'})
+        file_path = Path(file_path)
+        tmp_path = file_path.with_name(f'~{file_path.name}')
+        with pd.ExcelWriter(tmp_path, mode='w', engine='openpyxl') as writer:
+            hids_df.to_excel(writer, index=False, sheet_name=REPORT_HID_SHEET_NAME)
+            attempts_df.to_excel(writer, index=False, sheet_name=REPORT_ATTEMPT_SHEET_NAME)
+        tmp_path.replace(file_path)
+        logger.info(f'导出台账报表{file_path}，HID{len(hids_df)}个，写入记录{len(attempts_df)}条')
+        return len(hids_df)
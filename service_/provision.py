@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+# 多串口并行写license
+import time
+from collections import deque
+from fnmatch import fnmatch
+from threading import Thread, Lock
+
+from log import logger
+from serial_.connection import BoardConnection
+from serial_.pyboard import READ_FRAME_TIMEOUT
+from service_.ledger import ERROR_TIMEOUT, ERROR_ENCODE
+from utils.entities import ProtocolCommand, DataError, Error_Data_Map
+from utils.metrics import metrics
+from utils.protocol_utils import parse_protocol, decode_frame, check_frame
+
+LICENSE_PUT_RESPONSE = int(ProtocolCommand.license_put_response.value, 16)
+# 流水线写入时，收到这些错误说明端侧无法连续接收多帧，改为停等方式
+PIPELINE_REJECT_ERRORS = {DataError.LICENSE_UART_NO_HEADER.value, DataError.LICENSE_UART_RECV_TIMEOUT.value,
+                          DataError.LICENSE_UART_CHECK_SUM_FAIL.value, DataError.LICENSE_CMD_ERR.value}
+
+
+def split_ports(ports: str) -> list:
+    """解析串口参数，多个串口用逗号分隔"""
+    return [port_.strip() for port_ in ports.replace('，', ',').split(',') if port_.strip()]
+
+
+class ProvisionState:
+    """
+    多个串口共享的写license状态，线程安全
+    同一个HID同一时刻只允许一个串口写入，写入成功后其它串口不再写入
+    指定台账时写入结果同时记录到台账，台账中已完成的HID(包括之前运行时完成的)不再写入
+    """
+
+    def __init__(self, ledger=None):
+        self.__lock = Lock()
+        self.ledger = ledger  # Ledger
+        self.activated_hids = set()  # 写入license成功的HID(本次运行)
+        self.processing_hids = set()  # 正在写入license的HID
+        self.success_license = set()  # 成功激活的license(本次运行)
+        self.failed_license = set()  # 激活失败的license(本次运行)
+        self.ledger_counts = ledger.counts() if ledger is not None else dict()  # 启动时台账中的统计数
+
+    def claim(self, hid: str) -> bool:
+        """
+        申请写入hid，hid已写入成功或正在被其它串口写入时返回False
+        Args:
+            hid: 设备HID
+
+        Returns:
+            True: 申请成功，写入完成后需要调用release
+            False: 申请失败
+        """
+        with self.__lock:
+            if hid in self.activated_hids or hid in self.processing_hids:
+                return False
+            if self.ledger is not None and self.ledger.is_activated(hid):  # 之前运行时已完成，已计入ledger_counts
+                return False
+            self.processing_hids.add(hid)
+            return True
+
+    def release(self, hid: str, if_success: bool) -> None:
+        """结束hid的写入"""
+        with self.__lock:
+            self.processing_hids.discard(hid)
+            if if_success:
+                self.activated_hids.add(hid)
+
+    def record_license(self, license_: str, if_success: bool) -> None:
+        """记录单个license的写入结果"""
+        with self.__lock:
+            if if_success:
+                self.success_license.add(license_)
+            else:
+                self.failed_license.add(license_)
+
+    def record_device(self, hid: str, port: str, attempts: list, cost: float) -> None:
+        """记录一台设备的写入结果到台账，attempts: [(组件标志, license, 是否成功, 错误), ...]"""
+        if self.ledger is None:
+            return
+        try:
+            self.ledger.record_device(hid, port, attempts, cost)
+        except Exception as e:  # 台账写入失败不影响写license流程
+            logger.exception(e)
+
+    def counts(self) -> dict:
+        """
+        统计数，包括台账中之前运行的结果
+        Returns:
+            {'activated': 完成HID数, 'success_license': 成功license数, 'failed_license': 失败license数}
+        """
+        with self.__lock:
+            current = {'activated': len(self.activated_hids), 'success_license': len(self.success_license),
+                       'failed_license': len(self.failed_license)}
+        return {key: value + self.ledger_counts.get(key, 0) for key, value in current.items()}
+
+
+class PortWorker(Thread):
+    """单个串口的写license流程：读HID -> 查找license -> 逐个写入license"""
+
+    LINE_NAME = 'write license'  # 流程名称，用于日志
+    LINE_DESC = '写license'  # 流程名称，用于界面
+
+    def __init__(self, engine, port: str):
+        super().__init__(name=f'{self.LINE_NAME.replace(" ", "-")}-{port}', daemon=True)
+        self.engine = engine
+        self.port = port
+        self.wait_time = 0  # 连续读到已完成设备的次数
+        self.if_pipeline = True  # 是否使用流水线写入，端侧不支持时改为False
+        self.if_stop = False  # 串口被移除等，只停止该串口
+        self.if_restart = False  # 停止后串口又重新接入，退出时由engine重新开始该串口的流程
+        self.license_errors = dict()  # 当前设备各组件写入失败时端侧返回的错误码 {组件id(int): 错误码}
+        self.connection = BoardConnection(port, engine.baudrate, **engine.board_options)  # 流程期间保持串口打开
+
+    @property
+    def conn(self):
+        return self.connection.board
+
+    def log(self, content, tag=None):
+        self.engine.on_log(self.port, content, tag)
+
+    def status(self, status):
+        self.engine.on_status(self.port, status)
+
+    def run(self):
+        logger.info(f'{self.port} {self.LINE_NAME} start')
+        self.log(f'开始{self.LINE_DESC}流程\n')
+        self.status('reset')
+        try:
+            while self.engine.is_running and not self.if_stop:
+                if self.wait_time >= self.engine.max_wait_time:
+                    self.log('连接未操作时间过长，自动停止\n', tag='warn')
+                    self.status('stop')
+                    return
+                if not self.connect():
+                    time.sleep(1)  # 可能有板子的插拔动作
+                    continue
+                if_handled = self.provision()
+                time.sleep(self.engine.interval if if_handled else 1)
+        finally:
+            self.disconnect()
+            self.engine.worker_finished(self)
+
+    def connect(self) -> bool:
+        """串口未打开时打开串口，已打开时直接复用"""
+        if self.connection.is_open:
+            return True
+        try:
+            self.connection.open()
+        except Exception as e:
+            logger.warning(f'{self.port} 连接失败 {e}')
+            self.log(f'串口{self.port}连接失败\n', tag='warn')
+            return False
+        self.log(f'串口{self.port}连接成功\n')
+        return self.connection.is_open
+
+    def disconnect(self):
+        self.connection.close()
+
+    def stop(self):
+        """停止该串口的流程，当前设备处理完成后退出"""
+        self.if_stop = True
+
+    def on_new_board(self, hid: str):
+        """检测到更换设备，有人在操作，重新计算未操作时间"""
+        logger.info(f'{self.port} 检测到设备 {hid}')
+        self.wait_time = 0
+
+    def provision(self) -> bool:
+        """
+        对当前连接的设备完成一次写license
+        Returns:
+            True: 设备已处理(写入完成或此前已写入)，等待更换设备
+            False: 未能读取到设备HID或没有对应license，稍后重试
+        """
+        try:
+            hid_response = self.conn.get_HID()
+        except Exception as e:
+            logger.warning(f'{self.port} 获取设备HID异常 {e}')
+            self.connection.on_error(e)
+            return False
+        if hid_response is None:
+            self.connection.on_timeout()
+            self.log('获取设备HID失败\n', tag='error')
+            self.status('fail')
+            return False
+        try:
+            board_protocol = parse_protocol(hid_response)
+        except Exception as e:
+            logger.warning(f'{self.port} 解析HID response失败 {e}')
+            return False
+        hid_value = board_protocol.payload_data.data
+        if self.connection.is_new_board(hid_value):
+            self.on_new_board(hid_value)
+        self.log(f'获取设备HID成功，HID {hid_value}\n')
+
+        state = self.engine.state
+        if not state.claim(hid_value):
+            self.wait_time += 1
+            self.status('confirm')
+            self.log(f'设备{hid_value}已经写入过license，请更换设备...\n', tag='warn')
+            return True
+        self.wait_time = 0
+        with metrics.timer('license_lookup'):
+            hid_licenses = self.engine.hid_license_map.get_license(hid_value)
+        if not hid_licenses:  # 该hid没有获取到相应的license
+            state.release(hid_value, False)
+            logger.warning(f'{hid_value} 没有获取到license')
+            self.log('license写入失败: license文件中没有找到该hid\n')
+            self.engine.on_statistics()
+            self.status('fail')
+            return False
+        if_success = False
+        try:
+            if_success = self.write_licenses(hid_value, hid_licenses)
+        finally:
+            state.release(hid_value, if_success)
+            self.engine.on_statistics()
+        if if_success:
+            self.log(f'设备{hid_value}写入license成功\n', tag='confirm')
+            self.status('success')
+        else:
+            self.log(f'设备{hid_value}写入license失败\n', tag='error')
+            self.status('fail')
+        return True
+
+    def write_licenses(self, hid_value, hid_licenses: dict) -> bool:
+        """写入hid对应的所有license，全部成功返回True"""
+        self.log(f'对设备{hid_value}，写入license\n')
+        start, sent_bytes = time.perf_counter(), 0
+        results = dict()  # {组件标志: 是否写入成功}
+        frames = []  # [(组件标志, license帧), ...]
+        self.license_errors.clear()
+        for component_id, license_ in hid_licenses.items():
+            try:
+                protocol = self.engine.hid_license_map.get_frame(hid_value, component_id)  # 导入时已生成或有缓存
+            except Exception as e:
+                logger.error(f'license {license_}转码错误 {e}')
+                self.log(f'{component_id}写入license{str(license_)[:20]}...失败，license转码错误\n', tag='warn')
+                results[component_id] = False
+                continue
+            frames.append((component_id, protocol))
+            sent_bytes += len(protocol)
+        if self.engine.pipeline_window > 1 and self.if_pipeline and len(frames) > 1:
+            results.update(self.send_licenses_pipelined(frames))
+        else:
+            for component_id, protocol in frames:
+                results[component_id] = self.send_license(protocol, int(component_id, 16))
+        attempts = []  # 台账记录 [(组件标志, license, 是否成功, 错误), ...]
+        sent_components = dict(frames)
+        for component_id, license_ in hid_licenses.items():
+            error = None
+            if results[component_id]:
+                self.log(f'{component_id}写入license{license_}成功\n', tag='warn')
+            elif component_id in sent_components:
+                self.log(f'{component_id}写入license{license_[:20]}...失败\n', tag='warn')
+                error = self.license_errors.get(int(component_id, 16), ERROR_TIMEOUT)
+            else:
+                error = ERROR_ENCODE
+            attempts.append((component_id, license_, results[component_id], error))
+            self.engine.state.record_license(license_, results[component_id])
+            self.engine.on_statistics()
+        failed_counts = list(results.values()).count(False)
+        cost = time.perf_counter() - start
+        metrics.observe('device', cost)
+        self.engine.state.record_device(hid_value, self.port, attempts, cost)
+        logger.info(f'{self.port} 设备{hid_value}写入license{len(hid_licenses)}个，失败{failed_counts}个，'
+                    f'失败率{failed_counts / len(hid_licenses):.0%}，发送{sent_bytes}字节，耗时{cost:.3f}s，'
+                    f'{sent_bytes / cost if cost else 0:.0f}B/s')
+        return not failed_counts
+
+    def send_license(self, protocol, component_id=None) -> bool:
+        """发送一条license帧并校验端侧的响应(停等方式)，component_id不为None时忽略其它组件的响应"""
+        logger.info(f'{self.port} send license start')
+        try:
+            self.conn.send_license(protocol)
+        except Exception as e:
+            logger.exception(e)
+            self.connection.on_error(e)
+            self.log('写入license失败\n')
+            return False
+        while True:
+            frame = self.read_license_response()
+            if frame is None:
+                return False
+            if component_id is None or frame.component_id == component_id or frame.command != LICENSE_PUT_RESPONSE:
+                return self.check_license_response(frame)
+            logger.warning(f'{self.port} 忽略组件{frame.component_id:04X}的响应')  # 之前超时的响应
+
+    def send_licenses_pipelined(self, frames: list) -> dict:
+        """
+        流水线方式写入多个license：最多连续发送pipeline_window帧后再读取响应，按响应中的组件id对应请求
+        端侧不支持(响应超时、组件id无法对应、返回串口接收错误)时，剩余的license改为停等方式写入，并且该串口之后不再使用流水线
+        Args:
+            frames: [(组件标志, license帧), ...]
+
+        Returns:
+            {组件标志: 是否写入成功}
+        """
+        window = self.engine.pipeline_window
+        results = dict()
+        todo = deque(frames)
+        pending = dict()  # 已发送未收到响应 {组件id(int): (组件标志, license帧)}
+        if_fallback = False
+        while todo or pending:
+            while todo and len(pending) < window:
+                component_id, protocol = todo.popleft()
+                try:
+                    self.conn.send_license(protocol)
+                except Exception as e:
+                    logger.exception(e)
+                    self.connection.on_error(e)
+                    self.log('写入license失败\n')
+                    results.update({i: False for i, _ in list(pending.values()) + list(todo) + [(component_id, None)]})
+                    return results
+                pending[int(component_id, 16)] = (component_id, protocol)
+            frame = self.read_license_response(if_report_timeout=False)
+            if frame is None:
+                if not self.connection.is_open:  # 串口异常
+                    results.update({i: False for i, _ in list(pending.values()) + list(todo)})
+                    return results
+                if_fallback = True
+                break
+            item = pending.get(frame.component_id)
+            if item is None or frame.command != LICENSE_PUT_RESPONSE or \
+                    frame.data.hex().upper() in PIPELINE_REJECT_ERRORS:
+                if_fallback = True
+                break
+            del pending[frame.component_id]
+            results[item[0]] = self.check_license_response(frame)
+        if if_fallback:
+            logger.warning(f'{self.port} 端侧不支持流水线写入，改为停等方式')
+            self.log('端侧不支持流水线写入，改为逐个写入\n', tag='warn')
+            self.if_pipeline = False
+            self.conn.clear_frames()
+            for component_id, protocol in frames:  # 按原顺序重新写入尚未确认的license
+                if component_id not in results:
+                    results[component_id] = self.send_license(protocol, int(component_id, 16))
+        return results
+
+    def read_license_response(self, if_report_timeout=True):
+        """读取并解析一帧响应，超时或异常时返回None"""
+        try:
+            resp = self.conn.read_frame(self.engine.response_timeout)
+        except Exception as e:
+            logger.exception(e)
+            self.connection.on_error(e)
+            self.log('获取license写入结果失败\n')
+            return None
+        logger.info('%s get response: %s', self.port, resp)
+        if resp is None:  # 没有正确获取到返回
+            if if_report_timeout:
+                self.connection.on_timeout()
+                self.log('license写入失败\n', tag='error')
+            return None
+        try:
+            with metrics.timer('parse_response'):
+                return decode_frame(resp)
+        except Exception as e:
+            logger.exception(e)
+            return None
+
+    def check_license_response(self, frame) -> bool:
+        """校验license写入响应，失败时输出错误类型"""
+        if check_frame(frame, 'license_put_response'):
+            logger.info(f'{self.port} license写入成功')
+            self.log('license写入成功\n', tag='confirm')
+            return True
+        command, data = f'{frame.command:04X}', frame.data.hex().upper()
+        self.license_errors[frame.component_id] = data
+        error_type = Error_Data_Map.get(data)
+        logger.info(f'{self.port} license写入失败，指令{command}，')
+        if error_type is not None:
+            self.log(f'license写入错误, 指令{command} 错误类型{error_type}\n')
+        else:
+            self.log(f'license写入错误, 指令{command}数据{data}\n')
+        return False
+
+
+class ProvisionEngine:
+    """
+    多串口并行写license，每个串口一个工作线程，共享ProvisionState
+    回调在工作线程中执行:
+        on_log(port, content, tag): 输出操作信息
+        on_status(port, status): 串口状态变化 reset/success/fail/confirm/stop
+        on_statistics(): 统计数据变化
+        on_finished(): 所有串口均已停止
+    """
+
+    MAX_WAIT_TIME = 3  # 连续读到已完成设备的次数达到该值时，自动停止该串口
+    INTERVAL = 3  # 完成一台设备后的等待时间(秒)，用于更换设备
+    WORKER_CLASS = PortWorker  # 每个串口的工作线程
+    PIPELINE_WINDOW = 1  # 流水线写入时最多连续发送的license帧数，1为停等方式(发送一帧后等待响应)
+
+    def __init__(self, ports: list, baudrate: int, hid_license_map, state: ProvisionState = None,
+                 on_log=None, on_status=None, on_statistics=None, on_finished=None,
+                 max_wait_time=MAX_WAIT_TIME, interval=INTERVAL, board_options=None,
+                 pipeline_window=PIPELINE_WINDOW, response_timeout=READ_FRAME_TIMEOUT):
+        self.ports = list(dict.fromkeys(ports))  # 去重并保持顺序
+        self.baudrate = baudrate
+        self.hid_license_map = hid_license_map
+        self.state = state if state is not None else ProvisionState()
+        self.max_wait_time = max_wait_time
+        self.interval = interval
+        self.board_options = board_options or dict()  # PyBoard参数，如rtscts、chunk_size、chunk_interval
+        self.pipeline_window = pipeline_window
+        self.response_timeout = response_timeout  # 等待一帧license写入响应的时长(秒)
+        self.__on_log = on_log
+        self.__on_status = on_status
+        self.__on_statistics = on_statistics
+        self.__on_finished = on_finished
+        self.__lock = Lock()
+        self.workers = dict()  # {port: PortWorker}
+        self.is_running = False
+        self.watcher = None  # PortWatcher，监听串口热插拔时不为None
+        self.port_patterns = ()  # 监听时自动开始流程的串口名匹配规则，如ttyUSB*
+        self.__removed_ports = set()  # 流程中被移除、等待重新接入的串口
+        self.__if_finished = False
+
+    def start(self):
+        self.is_running = True
+        self.__if_finished = False
+        ports = list(self.ports)
+        if self.watcher is not None:
+            ports.extend(port for port in self.watcher.ports if self.__if_match(port))
+            self.watcher.subscribe(self.add_port, self.remove_port)
+        for port in ports:
+            self.add_port(port)
+
+    def stop(self, wait=False):
+        self.is_running = False
+        if self.watcher is not None:
+            self.watcher.unsubscribe(self.add_port, self.remove_port)
+        with self.__lock:
+            self.__removed_ports.clear()
+            if_all_finished = not self.workers
+        if if_all_finished:  # 监听或串口被移除时可能没有正在运行的串口
+            self.__finished()
+        if wait:
+            for worker in list(self.workers.values()):
+                worker.join()
+
+    def watch(self, watcher, patterns=('*',)):
+        """
+        监听串口热插拔(在start之前调用)：匹配patterns的串口接入时开始该串口的流程，移除时停止
+        监听时所有串口都停止后engine仍继续运行，直到调用stop
+        Args:
+            watcher: PortWatcher
+            patterns: 串口名匹配规则(fnmatch)
+        """
+        self.watcher = watcher
+        self.port_patterns = tuple(patterns)
+
+    def __if_match(self, port) -> bool:
+        return any(fnmatch(port, pattern) for pattern in self.port_patterns)
+
+    def add_port(self, port):
+        """开始一个串口的流程，该串口已在运行时忽略"""
+        if not self.is_running or (port not in self.ports and not self.__if_match(port)):
+            return
+        with self.__lock:
+            self.__removed_ports.discard(port)
+            if port in self.workers:
+                if self.workers[port].if_stop:  # 移除后很快又接入，旧流程退出时重新开始
+                    self.workers[port].if_restart = True
+                return
+            worker = self.WORKER_CLASS(self, port)
+            self.workers[port] = worker
+        worker.start()
+
+    def remove_port(self, port):
+        """串口被移除，停止该串口的流程，重新接入时由add_port重新开始"""
+        with self.__lock:
+            worker = self.workers.get(port)
+            if worker is not None:
+                self.__removed_ports.add(port)
+                worker.stop()
+                worker.if_restart = False
+        if worker is not None:
+            logger.info(f'{port} 串口已移除，停止{worker.LINE_NAME}')
+
+    def worker_finished(self, worker):
+        logger.info(f'{worker.port} {worker.LINE_NAME} stop')
+        new_worker = None
+        with self.__lock:
+            self.workers.pop(worker.port, None)
+            if worker.if_restart and self.is_running:  # 退出期间串口重新接入
+                new_worker = self.WORKER_CLASS(self, worker.port)
+                self.workers[worker.port] = new_worker
+            if_all_finished = not self.workers and not self.__removed_ports  # 等待被移除的串口重新接入
+        if new_worker is not None:
+            logger.info(f'{worker.port} 串口已重新接入，重新开始{worker.LINE_NAME}')
+            new_worker.start()
+        if if_all_finished and (self.watcher is None or not self.is_running):
+            self.__finished()
+
+    def __finished(self):
+        self.is_running = False
+        with self.__lock:
+            if self.__if_finished:
+                return
+            self.__if_finished = True
+        if self.__on_finished is not None:
+            self.__on_finished()
+
+    def on_log(self, port, content, tag=None):
+        if self.__on_log is not None:
+            self.__on_log(port, content, tag)
+
+    def on_status(self, port, status):
+        if self.__on_status is not None:
+            self.__on_status(port, status)
+
+    def on_statistics(self):
+        if self.__on_statistics is not None:
+            self.__on_statistics()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# 读HID流程的统计信息
+from threading import Lock
+
+
+class HIDStatistics:
+    """
+    读HID的统计信息，线程安全
+    HID均以集合存储，判重和统计个数均为O(1)，不随记录文件中HID数量增长
+        record_hids: 记录文件中已经存储过的HID
+        new_add_hids: 本轮流程中新增的HID
+        new_success_hids: 本轮流程中成功的HID(包括之前已记录过的)
+        new_failed_hids: 本轮流程中存储失败的HID
+    """
+
+    def __init__(self, record_hids=()):
+        self.__lock = Lock()
+        self.record_hids = set(record_hids)
+        self.new_add_hids = set()
+        self.new_success_hids = set()
+        self.new_failed_hids = set()
+
+    def load(self, record_hids) -> None:
+        """重新导入记录文件中的HID"""
+        with self.__lock:
+            self.record_hids = set(record_hids)
+
+    def is_recorded(self, hid: str) -> bool:
+        return hid in self.record_hids
+
+    def try_add_recorded(self, hid: str) -> bool:
+        """
+        hid未记录过时标记为已记录，检查和标记在同一次加锁中完成，多个串口同时读到同一HID时只有一个返回True
+        Args:
+            hid: 设备HID
+
+        Returns:
+            True: 标记成功，调用方需要存储该HID，存储失败时调用add_failed撤销标记
+            False: 已记录过
+        """
+        with self.__lock:
+            if hid in self.record_hids:
+                return False
+            self.record_hids.add(hid)
+            self.new_add_hids.add(hid)
+            self.new_success_hids.add(hid)
+            return True
+
+    def add_confirmed(self, hid: str) -> None:
+        """读到已经记录过的hid"""
+        with self.__lock:
+            self.new_success_hids.add(hid)
+
+    def add_failed(self, hid: str) -> None:
+        """hid存储失败，撤销try_add_recorded的标记，下次读到时重新存储"""
+        with self.__lock:
+            self.new_failed_hids.add(hid)
+            if hid in self.new_add_hids:
+                self.record_hids.discard(hid)
+                self.new_add_hids.discard(hid)
+                self.new_success_hids.discard(hid)
+
+    def reset_session(self) -> None:
+        """停止流程时清空本轮统计，保留记录文件中的HID"""
+        with self.__lock:
+            self.new_add_hids = set()
+            self.new_success_hids = set()
+            self.new_failed_hids = set()
+
+    def counts(self) -> dict:
+        """
+        Returns:
+            {'new_add': 新增个数, 'new_success': 成功个数, 'new_failed': 失败个数, 'record': 记录文件HID个数}
+        """
+        with self.__lock:
+            return {'new_add': len(self.new_add_hids),
+                    'new_success': len(self.new_success_hids),
+                    'new_failed': len(self.new_failed_hids),
+                    'record': len(self.record_hids)}
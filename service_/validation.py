@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+license文件导入前校验：HID格式、重复HID、组件列、license转码，以及每个组件的license个数
+导入时在HID_License_Map读取文件的同时逐批校验，文件只读取一次；行数较多时数据块交给进程池并行校验
+"""
+import base64
+import binascii
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from dao import HID_License_Map, HID_COLUMN_NAME, TIPS_COLUMNS_NAME, STORAGE_DISK, FRAME_CACHE_EAGER, \
+    FRAME_CACHE_LAZY, choose_storage, iter_license_rows
+from utils.entities import LicenseIssue
+
+VALIDATION_CHUNK_SIZE = 5000  # 每个子任务校验的行数
+PARALLEL_MIN_ROWS = 50000  # 行数达到该值且有多个CPU时使用进程池
+LICENSE_MAX_SIZE = 0xFFFF - 6  # 协议中单个license数据的最大字节数(payload长度为2字节)
+FIRST_ROW = 2  # 第一行数据在excel中的行号(第1行为表头)
+
+
+class ValidationReport:
+    """license文件校验结果"""
+
+    def __init__(self, file_path=None):
+        self.file_path = file_path
+        self.rows = 0  # 数据行数
+        self.hids_counts = 0  # 去重后的HID个数
+        self.column_errors = []  # 表头错误
+        self.duplicate_hids = dict()  # {HID: [excel行号, ...]}
+        self.issues = []  # [LicenseIssue, ...]
+        self.component_counts = dict()  # {组件标志: 可用license个数}
+        self.cost = 0.0  # 校验耗时(秒)
+
+    @property
+    def if_ok(self) -> bool:
+        return not (self.column_errors or self.duplicate_hids or self.issues)
+
+    def summary(self, max_issues=20) -> list:
+        """校验结果摘要，每项一行"""
+        lines = [f'license文件校验: {self.rows}行，HID{self.hids_counts}个，耗时{self.cost:.2f}s']
+        lines.extend(f'表头错误: {error}' for error in self.column_errors)
+        if self.component_counts:
+            lines.append('各组件license个数: ' + ', '.join(f'{component_id} {counts}'
+                                                     for component_id, counts in self.component_counts.items()))
+        if self.duplicate_hids:
+            lines.append(f'重复HID {len(self.duplicate_hids)}个(以第一行为准): ' +
+                         ', '.join(f'{hid} 行{rows}' for hid, rows in list(self.duplicate_hids.items())[:max_issues]))
+        if self.issues:
+            lines.append(f'错误{len(self.issues)}处:')
+            lines.extend(f'  行{issue.row} {issue.hid} {issue.component_id or ""} {issue.error}'
+                         for issue in self.issues[:max_issues])
+            if len(self.issues) > max_issues:
+                lines.append(f'  ...其余{len(self.issues) - max_issues}处省略')
+        if self.if_ok:
+            lines.append('未发现错误')
+        return lines
+
+
+def check_hid(hid) -> str:
+    """校验HID，返回错误信息，正确时返回空字符串"""
+    if not isinstance(hid, str) or not hid.strip():
+        return 'HID为空'
+    if len(hid) % 2 != 0:
+        return 'HID为奇数长度'
+    try:
+        bytes.fromhex(hid)
+    except ValueError:
+        return 'HID不是十六进制'
+    return ''
+
+
+def check_license(license_: str) -> str:
+    """校验license能否转码为协议数据，返回错误信息，正确时返回空字符串"""
+    try:
+        data = base64.b64decode(license_)
+    except (binascii.Error, ValueError) as e:
+        return f'base64解码失败: {e}'
+    if not data:
+        return 'license为空'
+    if len(data) > LICENSE_MAX_SIZE:
+        return f'license长度{len(data)}超出协议范围'
+    return ''
+
+
+def validate_rows(rows: list, component_ids: list, check_licenses=True) -> tuple:
+    """
+    校验一块数据行，可在子进程中执行
+    Args:
+        rows: [(excel行号, HID, license1, license2, ...), ...]，license为None表示空单元格
+        component_ids: 与license顺序对应的组件标志
+        check_licenses: 是否转码校验license，为False时只统计非空license
+
+    Returns:
+        ([LicenseIssue, ...], {组件标志: 可用license个数})
+    """
+    issues = []
+    counts = dict.fromkeys(component_ids, 0)
+    for row, hid, *licenses in rows:
+        error = check_hid(hid)
+        if error:
+            issues.append(LicenseIssue(row, hid, None, error))
+        if_any = False
+        for component_id, license_ in zip(component_ids, licenses):
+            if license_ is None:
+                continue
+            if_any = True
+            error = check_license(license_) if check_licenses else ''
+            if error:
+                issues.append(LicenseIssue(row, hid, component_id, error))
+            else:
+                counts[component_id] += 1
+        if not if_any:
+            issues.append(LicenseIssue(row, hid, None, '没有license'))
+    return issues, counts
+
+
+def check_columns(columns) -> tuple:
+    """
+    校验表头
+    Returns:
+        ([(组件列名, 组件标志), ...], [表头错误, ...])
+    """
+    errors = []
+    components = []
+    if HID_COLUMN_NAME not in columns:
+        errors.append(f'缺少{HID_COLUMN_NAME}列')
+    for column in columns:
+        if column in (HID_COLUMN_NAME, TIPS_COLUMNS_NAME):
+            continue
+        if '/' not in str(column):
+            errors.append(f'组件列{column}中组件名和组件id需要用斜杠/分隔')
+            continue
+        component_id = str(column).split('/')[-1]
+        try:
+            if len(component_id) != 4:
+                raise ValueError()
+            int(component_id, 16)
+        except ValueError:
+            errors.append(f'组件列{column}的组件id需要为4位十六进制')
+            continue
+        components.append((column, component_id))
+    return components, errors
+
+
+def validate_dataframe(df, workers=None, chunk_size=VALIDATION_CHUNK_SIZE, parallel_min_rows=PARALLEL_MIN_ROWS,
+                       file_path=None) -> ValidationReport:
+    """
+    校验license文件内容
+    Args:
+        df: license文件DataFrame(dtype=str)
+        workers: 进程数，None为CPU个数，1为不使用进程池
+        chunk_size: 每个子任务的行数
+        parallel_min_rows: 行数达到该值时使用进程池
+        file_path: 文件路径，用于报告
+
+    Returns:
+        ValidationReport
+    """
+    start = time.perf_counter()
+    report = ValidationReport(file_path)
+    report.rows = len(df)
+    components, report.column_errors = check_columns(list(df.columns))
+    if HID_COLUMN_NAME not in df.columns:
+        report.cost = time.perf_counter() - start
+        return report
+    hids = df[HID_COLUMN_NAME]
+    report.hids_counts = int(hids.nunique())
+    duplicated = hids[hids.duplicated(keep=False) & hids.notnull()]
+    for row, hid in zip(duplicated.index, duplicated):
+        report.duplicate_hids.setdefault(hid, []).append(int(row) + FIRST_ROW)
+
+    columns = [column for column, _ in components]
+    component_ids = [component_id for _, component_id in components]
+    values = df[[HID_COLUMN_NAME] + columns].astype(object).where(df[[HID_COLUMN_NAME] + columns].notnull(), None)
+    rows = [(int(idx) + FIRST_ROW, *values_) for idx, *values_ in values.itertuples(index=True, name=None)]
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    results = None
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(rows) >= parallel_min_rows and len(chunks) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(validate_rows, chunks, [component_ids] * len(chunks)))
+        except Exception:  # 无法创建子进程时在当前进程中校验
+            results = None
+    if results is None:
+        results = [validate_rows(chunk, component_ids) for chunk in chunks]
+    report.component_counts = dict.fromkeys(component_ids, 0)
+    for issues, counts in results:
+        report.issues.extend(issues)
+        for component_id, counts_ in counts.items():
+            report.component_counts[component_id] += counts_
+    report.cost = time.perf_counter() - start
+    return report
+
+
+class RowValidator:
+    """
+    逐批校验数据行，作为HID_License_Map的on_rows在导入时调用，与导入共用一次读取
+    只保留HID及其第一次出现的行号用于判重；累计行数达到parallel_min_rows且有多个CPU时，之后的数据块交给进程池
+    Args:
+        file_path: 文件路径，用于报告
+        check_licenses: 是否转码校验license；HID_License_Map导入时已生成license帧(FRAME_CACHE_EAGER)时为False，
+            由finish合并其转码错误，不重复转码
+        workers: 进程数，None为CPU个数，1为不使用进程池
+        parallel_min_rows: 累计行数达到该值后使用进程池
+    """
+
+    def __init__(self, file_path=None, check_licenses=True, workers=None, parallel_min_rows=PARALLEL_MIN_ROWS):
+        self.report = ValidationReport(file_path)
+        self.check_licenses = check_licenses
+        self.workers = workers or os.cpu_count() or 1
+        self.parallel_min_rows = parallel_min_rows
+        self.if_started = False  # 是否已校验表头
+        self.__indexes = None  # HID列及各组件列的下标，缺少HID列时为None
+        self.__component_ids = []
+        self.__first_rows = dict()  # {HID: 第一次出现的excel行号}
+        self.__pending = deque()  # 进程池中尚未汇总的子任务
+        self.__executor = None
+
+    def __call__(self, columns, chunk, offset):
+        """
+        校验一批数据行
+        Args:
+            columns: 表头
+            chunk: [(单元格值, ...), ...]
+            offset: 该批第一行在数据行中的序号(从0开始)
+        """
+        start = time.perf_counter()
+        if not self.if_started:
+            self.__check_header(columns)
+        if self.__indexes is not None:
+            rows = []
+            for row_number, row in enumerate(chunk, offset + FIRST_ROW):
+                if not any(row):  # 跳过空行
+                    continue
+                values = [row[idx] if idx < len(row) else None for idx in self.__indexes]
+                rows.append((row_number, *values))
+                hid = values[0]
+                if hid is None:
+                    continue
+                if hid in self.__first_rows:
+                    self.report.duplicate_hids.setdefault(hid, [self.__first_rows[hid]]).append(row_number)
+                else:
+                    self.__first_rows[hid] = row_number
+            self.report.rows += len(rows)
+            if rows:
+                self.__submit(rows)
+        self.report.cost += time.perf_counter() - start
+
+    def __check_header(self, columns):
+        self.if_started = True
+        columns = [column for column in columns if column is not None]
+        components, self.report.column_errors = check_columns(columns)
+        self.__component_ids = [component_id for _, component_id in components]
+        self.report.component_counts = dict.fromkeys(self.__component_ids, 0)
+        if HID_COLUMN_NAME in columns:
+            self.__indexes = [columns.index(HID_COLUMN_NAME)] + [columns.index(column) for column, _ in components]
+
+    def __submit(self, rows):
+        if self.__executor is None and self.workers > 1 and self.report.rows >= self.parallel_min_rows:
+            self.__executor = ProcessPoolExecutor(max_workers=self.workers)
+        if self.__executor is not None and self.workers > 1:
+            try:
+                self.__pending.append(self.__executor.submit(validate_rows, rows, self.__component_ids,
+                                                             self.check_licenses))
+            except Exception:  # 无法创建子进程时在当前进程中校验
+                self.workers = 1
+            else:
+                while len(self.__pending) > self.workers * 2:  # 限制排队的数据块，内存不随文件大小增长
+                    self.__merge(self.__pending.popleft().result())
+                return
+        self.__merge(validate_rows(rows, self.__component_ids, self.check_licenses))
+
+    def __merge(self, result):
+        issues, counts = result
+        self.report.issues.extend(issues)
+        for component_id, counts_ in counts.items():
+            self.report.component_counts[component_id] += counts_
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(cancel_futures=True)
+            self.__executor = None
+
+    def finish(self, invalid_licenses=None) -> ValidationReport:
+        """
+        汇总校验结果
+        Args:
+            invalid_licenses: HID_License_Map.invalid_licenses {(HID, 组件标志): 错误信息}，check_licenses为False时合并
+
+        Returns:
+            ValidationReport
+        """
+        start = time.perf_counter()
+        try:
+            while self.__pending:
+                self.__merge(self.__pending.popleft().result())
+        finally:
+            self.close()
+        report = self.report
+        if invalid_licenses:
+            for (hid, component_id), error in invalid_licenses.items():
+                report.issues.append(LicenseIssue(self.__first_rows.get(hid, 0), hid, component_id,
+                                                  f'license转码失败: {error}'))
+                if component_id in report.component_counts:
+                    report.component_counts[component_id] -= 1
+            report.issues.sort(key=lambda issue: issue.row)
+        report.hids_counts = len(self.__first_rows)
+        report.cost += time.perf_counter() - start
+        return report
+
+
+def validate_stream(file_path, chunk_size=VALIDATION_CHUNK_SIZE, **options) -> ValidationReport:
+    """逐块读取并校验license文件，options同RowValidator"""
+    start = time.perf_counter()
+    validator = RowValidator(file_path, **options)
+    rows = iter_license_rows(file_path)
+    columns = next(rows, None) or ()
+    validator(columns, [], 0)  # 先校验表头，没有数据行时也能报告表头错误
+    offset = 0
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        validator(columns, chunk, offset)
+        offset += len(chunk)
+    report = validator.finish()
+    report.cost = time.perf_counter() - start
+    return report
+
+
+def validate_license_file(file_path, **options) -> ValidationReport:
+    """读取并校验license文件，不导入，参数同validate_stream"""
+    return validate_stream(file_path, **options)
+
+
+def load_license_map(file_path, storage=None, index_path=None, **options) -> tuple:
+    """
+    导入license文件，同时校验，文件只读取一次、license只转码一次
+    内存存储时导入时生成license帧(FRAME_CACHE_EAGER)，转码错误由HID_License_Map发现；
+    磁盘存储时按需生成license帧(FRAME_CACHE_LAZY)，转码错误由校验发现
+    Args:
+        file_path: license文件路径
+        storage: 存储方式，None时按文件大小选择
+        index_path: STORAGE_DISK时的索引文件
+        options: 同RowValidator
+
+    Returns:
+        (HID_License_Map, ValidationReport)
+
+    Raises:
+        DaoException, FileNotFoundError: 导入失败
+    """
+    storage = storage or choose_storage(file_path)
+    frame_cache = FRAME_CACHE_LAZY if storage == STORAGE_DISK else FRAME_CACHE_EAGER
+    validator = RowValidator(file_path, check_licenses=frame_cache != FRAME_CACHE_EAGER, **options)
+    try:
+        hid_license_map = HID_License_Map(file_path, frame_cache, storage=storage, index_path=index_path,
+                                          on_rows=validator)
+    except Exception:
+        validator.close()
+        raise
+    if not validator.if_started:  # 复用了磁盘索引，没有读取文件
+        return hid_license_map, validate_stream(file_path, **options)
+    return hid_license_map, validator.finish(hid_license_map.invalid_licenses)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# 测试运行时日志、台账等写到临时目录，不修改程序目录下的log
+import os
+import shutil
+import tempfile
+
+LOG_DIR_ENV = 'LICENSE_TOOL_LOG_DIR'  # 与log.LOG_DIR_ENV相同，导入log前设置，不能从log导入
+
+_log_dir = None
+
+
+def pytest_configure(config):
+    global _log_dir
+    if not os.environ.get(LOG_DIR_ENV):
+        _log_dir = tempfile.mkdtemp(prefix='license-tool-log-')
+        os.environ[LOG_DIR_ENV] = _log_dir
+
+
+def pytest_unconfigure(config):
+    if _log_dir is None:
+        return
+    from log import log_manager
+
+    log_manager.stop()  # 写完队列中的记录后再删除目录
+    shutil.rmtree(_log_dir, ignore_errors=True)
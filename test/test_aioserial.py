@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# serial_/aioserial相关测试，使用虚拟开发板
+import asyncio
+import time
+
+import pytest
+from serial.serialutil import SerialException
+
+from serial_.aioserial import AsyncConSerial
+from serial_.pyboard import HID_REQUEST_FRAME
+from utils.protocol_utils import decode_frame, encode_frame
+
+simulator = pytest.importorskip('serial_.simulator')
+
+HIDS = ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1']
+
+
+async def get_hid(port):
+    async with AsyncConSerial() as con:
+        await con.open(port, 115200)
+        await con.write(HID_REQUEST_FRAME)
+        frame = await con.read_frame(time.monotonic() + 2)
+        return decode_frame(frame).data.hex().upper()
+
+
+class TestAsyncConSerial:
+
+    def test_read_frame(self):
+        with simulator.BoardSimulator(HIDS, chunk_size=3, chunk_interval=0.001) as board_simulator:
+            assert asyncio.run(get_hid(board_simulator.port)) == HIDS[0]
+
+    def test_many_ports_one_loop(self):
+        simulators = [simulator.BoardSimulator([f'35D9C0AE729DB9{i:02X}'], latency=0.05).start() for i in range(8)]
+
+        async def main():
+            return await asyncio.gather(*(get_hid(i.port) for i in simulators))
+
+        try:
+            start = time.perf_counter()
+            hids = asyncio.run(main())
+            cost = time.perf_counter() - start
+        finally:
+            for i in simulators:
+                i.stop()
+        assert hids == [f'35D9C0AE729DB9{i:02X}' for i in range(8)]
+        assert cost < 8 * 0.05 + 1  # 各串口的等待相互重叠
+
+    def test_deadline_and_close(self):
+        async def main(port):
+            con = AsyncConSerial()
+            await con.open(port, 115200)
+            start = time.monotonic()
+            assert await con.read_frame(start + 0.1) is None  # 没有请求，截止时间到后返回None
+            assert time.monotonic() - start < 0.5
+            await con.write(encode_frame(b'\x01', 0x03E8, simulator.LICENSE_PUT_REQUEST)[:-1])  # 不完整的帧
+            assert await con.read_frame(time.monotonic() + 0.1) is None
+            await con.write_chunked(HID_REQUEST_FRAME, chunk_size=2, interval=0.001)
+            assert await con.read(1, time.monotonic() + 1)
+            reader = asyncio.ensure_future(con.read_frame(time.monotonic() + 5))
+            await asyncio.sleep(0.05)
+            con.close()
+            with pytest.raises(SerialException):
+                await reader
+
+        with simulator.BoardSimulator(HIDS) as board_simulator:
+            asyncio.run(main(board_simulator.port))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# service_/collect及命令行相关测试
+from threading import Event
+
+import pytest
+
+from service_.collect import HIDCollectEngine
+from service_.statistics import HIDStatistics
+from utils.file_utils import read_HID
+
+
+class TestHIDCollectEngine:
+
+    def test_parallel_ports(self, tmp_path):
+        simulator = pytest.importorskip('serial_.simulator')
+        hid_filepath = tmp_path / 'hids.xlsx'
+        simulators = [simulator.BoardSimulator([hid], auto_swap=False).start()
+                      for hid in ('35D9C0AE729DB9E0', '35D9C0AE729DB9E1')]
+        statistics = HIDStatistics(['35D9C0AE729DB9E1'])  # 已记录过的HID
+        finished = Event()
+        try:
+            engine = HIDCollectEngine([i.port for i in simulators], 115200, hid_filepath, statistics,
+                                      on_finished=finished.set, max_wait_time=2, interval=0.05)
+            engine.start()
+            assert finished.wait(timeout=30)
+        finally:
+            for i in simulators:
+                i.stop()
+        assert statistics.counts() == {'new_add': 1, 'new_success': 2, 'new_failed': 0, 'record': 2}
+        assert engine.export() == 1
+        assert read_HID(str(hid_filepath)) == ['35D9C0AE729DB9E0']
+
+
+class TestCommandLine:
+
+    def test_hid(self, tmp_path, capsys):
+        simulator = pytest.importorskip('serial_.simulator')
+        from service_.__main__ import main
+
+        hid_filepath = tmp_path / 'hids.xlsx'
+        with simulator.BoardSimulator(['35D9C0AE729DB9E0'], auto_swap=False) as board:
+            assert main(['hid', '--ports', board.port, '--out', str(hid_filepath), '--ledger',
+                         str(tmp_path / 'ledger.db'), '--max-wait-time', '1', '--interval', '0.05']) == 0
+        assert read_HID(str(hid_filepath)) == ['35D9C0AE729DB9E0']
+        assert '新增HID1个' in capsys.readouterr().out
+        # 由台账生成报表
+        assert main(['report', '--ledger', str(tmp_path / 'ledger.db'), '--out', str(tmp_path / 'report.xlsx')]) == 0
+        assert read_HID(str(tmp_path / 'report.xlsx')) == ['35D9C0AE729DB9E0']
+
+    def test_bad_out(self, tmp_path):
+        from service_.__main__ import main
+
+        assert main(['hid', '--ports', 'COM3', '--out', str(tmp_path / 'hids.db')]) == 2
+
+    def test_report_without_ledger(self, tmp_path):
+        from service_.__main__ import main
+
+        assert main(['report', '--ledger', str(tmp_path / 'ledger.db'), '--out', str(tmp_path / 'report.xlsx')]) == 2
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# serial_/connection相关测试，使用假的PyBoard
+from types import SimpleNamespace
+
+import pytest
+from serial.serialutil import SerialException
+
+import serial_.connection as connection
+from serial_.connection import BoardConnection
+from service_.provision import PortWorker, ProvisionState
+from utils.convert_utils import bytestostrhex
+from utils.entities import ProtocolCommand
+from utils.protocol_utils import encode_frame
+
+HIDS = ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1']
+
+
+class FakeBoard:
+
+    hids = []  # get_HID依次返回的HID
+
+    def __init__(self, port, baudrate, **board_options):
+        self.port = port
+        self.board_options = board_options
+        self.is_open = True
+        self.cleared = 0  # clear_frames调用次数
+
+    def get_HID(self):
+        frame = encode_frame(bytes.fromhex(self.hids.pop(0)), command=int(ProtocolCommand.hid_response.value, 16))
+        return bytestostrhex(frame)
+
+    def close(self):
+        self.is_open = False
+
+    def clear_frames(self):
+        self.cleared += 1
+
+
+@pytest.fixture
+def conn(monkeypatch):
+    monkeypatch.setattr(connection, 'PyBoard', FakeBoard)
+    return BoardConnection('/dev/ttyUSB0', 115200, rtscts=True)
+
+
+class TestBoardConnection:
+
+    def test_open_reuse(self, conn):
+        board = conn.open()
+        assert conn.is_open and board.board_options == {'rtscts': True}
+        assert conn.open() is board  # 已打开时复用
+
+    def test_on_error_closes(self, conn):
+        board = conn.open()
+        conn.on_error(SerialException('device disconnected'))
+        assert not board.is_open and not conn.is_open
+        assert conn.open() is not board  # 下次open时重新打开
+
+    def test_on_error_keeps_open(self, conn):
+        board = conn.open()
+        conn.is_new_board(HIDS[0])
+        conn.on_error(ValueError('bad response'))  # 非串口异常按无响应处理
+        assert board.is_open and conn.if_lost
+
+    def test_on_timeout_keeps_open(self, conn):
+        board = conn.open()
+        conn.is_new_board(HIDS[0])
+        conn.on_timeout()
+        assert board.is_open and conn.open() is board
+        assert conn.is_new_board(HIDS[0])  # 无响应后再次响应，视为更换了设备
+
+    def test_swap_detection(self, conn):
+        board = conn.open()
+        assert conn.is_new_board(HIDS[0])
+        assert board.cleared == 1
+        assert not conn.is_new_board(HIDS[0])
+        assert board.cleared == 1  # 同一台设备不丢弃数据
+        assert conn.is_new_board(HIDS[1])
+        assert board.cleared == 2
+
+    def test_reopen_resets_hid(self, conn):
+        conn.open()
+        conn.is_new_board(HIDS[0])
+        conn.on_error(SerialException('device disconnected'))
+        conn.open()
+        assert conn.is_new_board(HIDS[0])  # 重新打开后第一次读到的HID视为新设备
+
+
+class TestPortWorkerSwap:
+
+    def test_swap_resets_wait_time(self, monkeypatch):
+        monkeypatch.setattr(connection, 'PyBoard', FakeBoard)
+        monkeypatch.setattr(FakeBoard, 'hids', [HIDS[0], HIDS[0], HIDS[1]])
+        state = ProvisionState()
+        for hid in HIDS:  # 两台设备都已写入过license
+            state.claim(hid)
+            state.release(hid, True)
+        engine = SimpleNamespace(baudrate=115200, board_options={}, state=state, on_log=lambda *args: None,
+                                 on_status=lambda *args: None)
+        worker = PortWorker(engine, '/dev/ttyUSB0')
+        worker.connect()
+        assert worker.provision() and worker.wait_time == 1
+        assert worker.provision() and worker.wait_time == 2  # 同一台设备，未操作时间累计
+        assert worker.provision() and worker.wait_time == 1  # 更换了设备，重新计算
+        assert worker.conn.cleared == 2
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# serial_/conserial分批写入相关测试，使用记录每次写入的假串口
+import pytest
+from serial.serialutil import SerialTimeoutException
+
+import serial_.conserial as conserial
+from serial_.conserial import ConSerial
+
+
+class FakeSerial:
+    """记录write/flush调用；每查询一次out_waiting，积压减少drain_per_poll字节"""
+
+    def __init__(self, drain_per_poll=16):
+        self.drain_per_poll = drain_per_poll
+        self.events = []  # [('write', bytes, 写入前的积压) 或 ('flush',), ...]
+        self.pending = 0
+
+    @property
+    def out_waiting(self):
+        self.pending = max(self.pending - self.drain_per_poll, 0)
+        return self.pending
+
+    def write(self, data):
+        self.events.append(('write', bytes(data), self.pending))
+        self.pending += len(data)
+        return len(data)
+
+    def flush(self):
+        self.events.append(('flush',))
+        self.pending = 0
+
+    def writes(self):
+        return [event[1] for event in self.events if event[0] == 'write']
+
+
+class NoOutWaitingSerial(FakeSerial):
+    """不支持out_waiting的串口"""
+
+    @property
+    def out_waiting(self):
+        raise NotImplementedError
+
+
+def open_con(fake) -> ConSerial:
+    con_serial = ConSerial()
+    con_serial.con = fake
+    con_serial.is_open = True
+    return con_serial
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """记录time.sleep调用，不实际等待"""
+    calls = []
+    monkeypatch.setattr(conserial.time, 'sleep', calls.append)
+    return calls
+
+
+class TestWriteChunked:
+
+    DATA = bytes(range(150))
+
+    def test_chunk_boundaries(self, sleeps):
+        fake = FakeSerial()
+        open_con(fake).write_chunked(self.DATA, 64, max_out_waiting=0)
+        assert [len(i) for i in fake.writes()] == [64, 64, 22]
+        assert b''.join(fake.writes()) == self.DATA
+        fake = FakeSerial()
+        open_con(fake).write_chunked(self.DATA, 0, max_out_waiting=0)  # <=0时一次写入
+        assert fake.writes() == [self.DATA]
+        assert sleeps == []
+
+    def test_interval(self, sleeps):
+        fake = FakeSerial()
+        open_con(fake).write_chunked(self.DATA, 64, interval=0.005, max_out_waiting=0)
+        assert sleeps == [0.005, 0.005]  # 只在批次之间等待
+
+    def test_drain(self, sleeps):
+        fake = FakeSerial()
+        open_con(fake).write_chunked(self.DATA, 64, drain=True)
+        assert [event[0] for event in fake.events] == ['write', 'flush'] * 3
+        assert all(event[2] == 0 for event in fake.events if event[0] == 'write')
+
+    def test_out_waiting_backpressure(self, sleeps):
+        fake = FakeSerial(drain_per_poll=16)
+        open_con(fake).write_chunked(self.DATA, 32, max_out_waiting=48)
+        assert b''.join(fake.writes()) == self.DATA
+        for _, chunk, pending in fake.events:
+            assert pending + len(chunk) <= 48
+        assert sleeps  # 积压超过上限时等待过
+
+    def test_out_waiting_timeout(self, sleeps, monkeypatch):
+        monkeypatch.setattr(conserial, 'OUT_WAITING_TIMEOUT', 0)
+        fake = FakeSerial(drain_per_poll=0)  # 端侧不接收，积压不减少
+        with pytest.raises(SerialTimeoutException):
+            open_con(fake).write_chunked(self.DATA, 64, max_out_waiting=64)
+        assert [len(i) for i in fake.writes()] == [64]
+
+    def test_out_waiting_not_supported(self, sleeps):
+        fake = NoOutWaitingSerial()
+        open_con(fake).write_chunked(self.DATA, 64)
+        assert b''.join(fake.writes()) == self.DATA
+
+    def test_closed(self):
+        con_serial = ConSerial()
+        con_serial.write_chunked(self.DATA, 64)  # 未打开时不写入
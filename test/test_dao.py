@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 # dao.py相关测试
 
+import os
 
-from dao import HID_License_Map
+import pandas as pd
+import pytest
+
+from dao import HID_License_Map, DaoException, HID_COLUMN_NAME, TIPS_COLUMNS_NAME, LICENSE_FILE_SHEET_NAME, \
+    FRAME_CACHE_EAGER, FRAME_CACHE_LAZY, STORAGE_DISK, iter_license_rows
+from utils.protocol_utils import encode_frame
 
 
 hid_license_map_filepath = r'D:\Projects\python\LicenseManagementTool\input\hid-license.xlsx'
@@ -21,3 +27,118 @@ class TestDao:
         #     '03E8': '8jqXWK53tuik3NWhgjR2B5nEIUZzH/JLS+/QiMEiJxgKQYrRefZTQeugseljx04nnCqiHGgvVorDbnmXN0BW9RPYIvkdnQWrJpzDbnmXN0BW9RPYIvkdnQWrJpyR2dBQ',
         #     '03E9': '8jqXWK53tuik3NWhgjR2B5nEIUZzH/JLS+/QiMEiJxgKQYrRefZTQeugseljx04nnCqiHGgvVorDbnmXN0BW9RPYIvkdnQWrJpzDbnmXN0BW9RPYIvkdnQWrJpyR9dBQ'
         # }
+
+
+class TestHIDLicenseMapLoad:
+
+    def test_load_license_file(self, tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        df = pd.DataFrame({HID_COLUMN_NAME: ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1', '35D9C0AE729DB9E0'],
+                           TIPS_COLUMNS_NAME: ['', '', ''],
+                           'RTC/03E8': ['license_a', None, 'license_dup'],
+                           'POS/03E9': ['license_b', 'license_c', None]})
+        df.to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        hid_license_map = HID_License_Map(str(file_path))
+        assert hid_license_map.hid_license_map == {
+            '35D9C0AE729DB9E0': {'03E8': 'license_a', '03E9': 'license_b'},
+            '35D9C0AE729DB9E1': {'03E9': 'license_c'},
+        }
+        assert hid_license_map.licenses_counts == 4
+        assert hid_license_map.hids_counts == 2
+        assert hid_license_map.get_license('35D9C0AE729DB9E1') == {'03E9': 'license_c'}
+        assert hid_license_map.get_license('not exists') == {}
+
+    def test_component_column_without_slash(self, tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        df = pd.DataFrame({HID_COLUMN_NAME: ['35D9C0AE729DB9E0'], 'RTC': ['license_a']})
+        df.to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        with pytest.raises(DaoException):
+            HID_License_Map(str(file_path))
+
+
+class TestHIDLicenseMapFrames:
+
+    @staticmethod
+    def make_map(tmp_path, frame_cache):
+        file_path = tmp_path / 'hid-license.xlsx'
+        df = pd.DataFrame({HID_COLUMN_NAME: ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1'],
+                           'RTC/03E8': ['AQID', 'AQI'],  # 第二个license缺少填充，转码错误
+                           'POS/03E9': ['BAUG', None]})
+        df.to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        return HID_License_Map(str(file_path), frame_cache)
+
+    @pytest.mark.parametrize('frame_cache', [FRAME_CACHE_EAGER, FRAME_CACHE_LAZY])
+    def test_get_frame(self, tmp_path, frame_cache):
+        hid_license_map = self.make_map(tmp_path, frame_cache)
+        assert hid_license_map.get_frame('35D9C0AE729DB9E0', '03E8') == encode_frame(b'\x01\x02\x03', 0x03E8, 0x0002)
+        assert hid_license_map.get_frame('35D9C0AE729DB9E0', '03E9') == encode_frame(b'\x04\x05\x06', 0x03E9, 0x0002)
+        with pytest.raises(DaoException):
+            hid_license_map.get_frame('35D9C0AE729DB9E1', '03E8')
+        with pytest.raises(DaoException):
+            hid_license_map.get_frame('35D9C0AE729DB9E1', '03E9')
+
+    def test_invalid_licenses_at_import(self, tmp_path):
+        hid_license_map = self.make_map(tmp_path, FRAME_CACHE_EAGER)
+        assert list(hid_license_map.invalid_licenses) == [('35D9C0AE729DB9E1', '03E8')]
+        assert len(hid_license_map.frames) == 2
+
+
+class TestHIDLicenseMapStorage:
+
+    @staticmethod
+    def make_df():
+        return pd.DataFrame({HID_COLUMN_NAME: ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1', '35D9C0AE729DB9E0',
+                                               '1234567890123456'],
+                             'RTC/03E8': ['AQID', None, 'BAUG', 'AQI'],
+                             'POS/03E9': ['BAUG', 'BwgJ', None, None]})
+
+    def test_iter_license_rows(self, tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        pd.DataFrame({HID_COLUMN_NAME: [1234567890123456], 'RTC/03E8': ['']}) \
+            .to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        assert list(iter_license_rows(file_path)) == [(HID_COLUMN_NAME, 'RTC/03E8'), ('1234567890123456', None)]
+
+    @pytest.mark.parametrize('suffix', ['.xlsx', '.csv'])
+    def test_disk_storage(self, tmp_path, suffix):
+        file_path = tmp_path / f'hid-license{suffix}'
+        if suffix == '.csv':
+            self.make_df().to_csv(file_path, index=False)
+        else:
+            self.make_df().to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        memory_map = HID_License_Map(str(file_path), FRAME_CACHE_EAGER, chunk_size=2)
+        disk_map = HID_License_Map(str(file_path), FRAME_CACHE_EAGER, storage=STORAGE_DISK, chunk_size=2)
+        try:
+            assert disk_map.hids_counts == memory_map.hids_counts == 3
+            assert disk_map.licenses_counts == memory_map.licenses_counts == 5
+            for hid in memory_map.hid_license_map:
+                assert disk_map.get_license(hid) == memory_map.get_license(hid)
+            assert disk_map.get_license('35D9C0AE729DB9E0') == {'03E8': 'AQID', '03E9': 'BAUG'}  # 以第一行为准
+            assert disk_map.get_license('not exists') == {}
+            assert sorted(disk_map.iter_hids()) == sorted(memory_map.hid_license_map)
+            assert disk_map.invalid_licenses == memory_map.invalid_licenses
+            assert list(disk_map.invalid_licenses) == [('1234567890123456', '03E8')]
+            assert not disk_map.frames
+            assert disk_map.get_frame('35D9C0AE729DB9E1', '03E9') == memory_map.get_frame('35D9C0AE729DB9E1', '03E9')
+            with pytest.raises(DaoException):
+                disk_map.get_frame('1234567890123456', '03E8')
+        finally:
+            disk_map.close()
+        assert not os.path.exists(disk_map.license_index.index_path)  # 临时索引已删除
+
+    def test_reuse_index(self, tmp_path, monkeypatch):
+        file_path = tmp_path / 'hid-license.xlsx'
+        self.make_df().to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        index_path = tmp_path / 'hid-license.db'
+        HID_License_Map(str(file_path), storage=STORAGE_DISK, index_path=index_path).close()
+        monkeypatch.setattr('dao.iter_license_rows', lambda *args: pytest.fail('索引一致时不应重新读取文件'))
+        hid_license_map = HID_License_Map(str(file_path), storage=STORAGE_DISK, index_path=index_path)
+        assert hid_license_map.hids_counts == 3 and hid_license_map.licenses_counts == 5
+        assert hid_license_map.get_license('35D9C0AE729DB9E1') == {'03E9': 'BwgJ'}
+        hid_license_map.close()
+        assert index_path.exists()
+
+    def test_missing_hid_column(self, tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        pd.DataFrame({'RTC/03E8': ['AQID']}).to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        with pytest.raises(DaoException):
+            HID_License_Map(str(file_path))
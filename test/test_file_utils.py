@@ -2,7 +2,9 @@
 # utils/file_utils相关方法测试
 import os
 from pathlib import Path
-from utils.file_utils import record_HID_activated, store_HID, read_HID
+import pandas as pd
+
+from utils.file_utils import record_HID_activated, store_HID, read_HID, export_HID, HIDJournal, HID_COLUMN_NAME
 
 
 class TestFileUtils:
@@ -22,7 +24,24 @@ class TestFileUtils:
         file_path = Path(__file__).parent.parent / 'output' / 'test_hid.xlsx'
         if file_path.exists():
             os.remove(file_path)
+        if HIDJournal(file_path).journal_path.exists():
+            os.remove(HIDJournal(file_path).journal_path)
         hids = ['35D9C0AE729DB9E1', '35D9C0AE729DB9E2', '35D9C0AE729DB9E3', '35D9C0AE729DB9E4']
         store_HID(hids, file_path)
         record_hids = read_HID(file_path)
         assert hids == record_hids
+
+    def test_journal_export(self, tmp_path):
+        file_path = tmp_path / 'test_hid.xlsx'
+        pd.DataFrame(columns=[HID_COLUMN_NAME], data=['35D9C0AE729DB9E0']).to_excel(
+            file_path, index=False, sheet_name='Sheet1')
+        hids = ['35D9C0AE729DB9E1', '35D9C0AE729DB9E2']
+        for hid in hids:
+            record_HID_activated(hid, file_path)
+        store_HID(['35D9C0AE729DB9E3'], file_path)
+        expected = ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1', '35D9C0AE729DB9E2', '35D9C0AE729DB9E3']
+        assert read_HID(file_path) == expected
+        assert export_HID(file_path) == 3
+        assert not HIDJournal(file_path).journal_path.exists()
+        assert read_HID(file_path) == expected
+        assert export_HID(file_path) == 0
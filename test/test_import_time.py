@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# 启动耗时相关测试
+import pytest
+
+from benchmark.bench_import_time import measure_import_time, imported_modules, measure_first_window, has_display, \
+    IMPORT_TIME_BUDGET, FIRST_WINDOW_BUDGET
+
+
+class TestImportTime:
+
+    def test_heavy_modules_lazy(self):
+        assert imported_modules('main') == []
+
+    def test_import_time_budget(self):
+        cumulative = measure_import_time('main')
+        assert cumulative['main'] < IMPORT_TIME_BUDGET
+
+    @pytest.mark.skipif(not has_display(), reason='no display')
+    def test_first_window_budget(self):
+        assert measure_first_window() < FIRST_WINDOW_BUDGET
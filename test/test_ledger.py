@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+# service_/ledger相关测试
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from service_.ledger import Ledger, HID_ACTIVATED, HID_FAILED, HID_RECORDED, REPORT_ATTEMPT_SHEET_NAME
+from service_.provision import ProvisionState
+from utils.file_utils import read_HID
+
+HID = '35D9C0AE729DB9E0'
+
+
+class TestLedger:
+
+    def test_record_device(self, tmp_path):
+        with Ledger(tmp_path / 'ledger.db') as ledger:
+            ledger.record_device(HID, 'COM3', [('03E8', 'AQID', False, '16'), ('03E9', 'BAUG', True, None)], 0.5)
+            assert ledger.status(HID) == HID_FAILED
+            assert not ledger.is_activated(HID)
+            ledger.record_device(HID, 'COM4', [('03E8', 'AQID', True, None)], 0.2)
+            assert ledger.is_activated(HID)
+            assert [(component_id, if_success, error, port) for component_id, if_success, error, port, _ in
+                    ledger.attempts(HID)] == [('03E8', False, '16', 'COM3'), ('03E9', True, None, 'COM3'),
+                                              ('03E8', True, None, 'COM4')]
+            ledger.record_hid(HID)  # 已有记录时不修改状态
+            ledger.record_hid('35D9C0AE729DB9E1')
+            assert ledger.status('35D9C0AE729DB9E1') == HID_RECORDED
+            assert ledger.counts() == {'hid': 2, 'activated': 1, 'success_license': 2, 'failed_license': 1}
+        with Ledger(tmp_path / 'ledger.db') as ledger:  # 重新打开后记录仍在
+            assert ledger.hids(HID_ACTIVATED) == [HID]
+            assert ledger.hids() == [HID, '35D9C0AE729DB9E1']
+
+    def test_wal_and_threads(self, tmp_path):
+        with Ledger(tmp_path / 'ledger.db') as ledger:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda i: ledger.record_device(f'{i:016X}', f'COM{i % 4}',
+                                                                 [('03E8', f'license{i}', True, None)], 0.1),
+                                  range(100)))
+            assert ledger.counts()['activated'] == 100
+        with sqlite3.connect(tmp_path / 'ledger.db') as conn:
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    def test_export_report(self, tmp_path):
+        with Ledger(tmp_path / 'ledger.db') as ledger:
+            ledger.record_device(HID, 'COM3', [('03E8', 'AQID', True, None)], 0.5)
+            ledger.record_hid('35D9C0AE729DB9E1', 'COM4')
+            assert ledger.export_report(tmp_path / 'report.xlsx') == 2
+        assert read_HID(str(tmp_path / 'report.xlsx')) == [HID, '35D9C0AE729DB9E1']  # 报表可作为HID记录文件
+        attempts = pd.read_excel(tmp_path / 'report.xlsx', sheet_name=REPORT_ATTEMPT_SHEET_NAME, dtype=str)
+        assert attempts['组件标志'].tolist() == ['03E8']
+
+
+class TestProvisionStateLedger:
+
+    def test_restart(self, tmp_path):
+        with Ledger(tmp_path / 'ledger.db') as ledger:
+            state = ProvisionState(ledger)
+            assert state.claim(HID)
+            state.record_license('AQID', True)
+            state.record_device(HID, 'COM3', [('03E8', 'AQID', True, None)], 0.1)
+            state.release(HID, True)
+            assert state.counts() == {'activated': 1, 'success_license': 1, 'failed_license': 0}
+        with Ledger(tmp_path / 'ledger.db') as ledger:  # 重启后已完成的HID不再写入
+            state = ProvisionState(ledger)
+            assert not state.claim(HID)
+            assert state.counts() == {'activated': 1, 'success_license': 1, 'failed_license': 0}
+
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# log相关测试
+import logging
+from logging.handlers import QueueListener
+
+from log import log_files, search_log, BoundedQueueHandler, OVERFLOW_DROP_OLD, OVERFLOW_DROP_NEW
+
+
+class TestSearchLog:
+
+    def test_search_rotated_files(self, tmp_path):
+        file_name = tmp_path / 'tool.log'
+        file_name.write_text('HID 3 new\nother\n', encoding='utf-8')
+        (tmp_path / 'tool.log.1').write_text('HID 2\n', encoding='utf-8')
+        (tmp_path / 'tool.log.2').write_text('HID 1\n', encoding='utf-8')
+        assert log_files(file_name) == [tmp_path / 'tool.log.2', tmp_path / 'tool.log.1', file_name]
+        assert search_log('HID', file_name) == ['HID 1', 'HID 2', 'HID 3 new']
+        assert search_log('HID', file_name, limit=2) == ['HID 2', 'HID 3 new']
+
+
+class TestBoundedQueueHandler:
+
+    @staticmethod
+    def make_record(msg, level=logging.INFO):
+        return logging.LogRecord('test', level, __file__, 1, msg, None, None)
+
+    def test_drop_old(self):
+        handler = BoundedQueueHandler(queue_size=3, overflow=OVERFLOW_DROP_OLD)
+        for i in range(5):
+            handler.handle(self.make_record(f'msg {i}'))
+        assert handler.dropped == 2
+        assert [handler.queue.get_nowait().getMessage() for _ in range(3)] == ['msg 2', 'msg 3', 'msg 4']
+
+    def test_drop_new(self):
+        handler = BoundedQueueHandler(queue_size=3, overflow=OVERFLOW_DROP_NEW)
+        for i in range(5):
+            handler.handle(self.make_record(f'msg {i}'))
+        assert handler.dropped == 2
+        assert [handler.queue.get_nowait().getMessage() for _ in range(3)] == ['msg 0', 'msg 1', 'msg 2']
+
+    def test_lazy_format(self):
+        class Payload:
+            formatted = 0
+
+            def __repr__(self):
+                Payload.formatted += 1
+                return 'payload'
+
+        handler = BoundedQueueHandler()
+        record = logging.LogRecord('test', logging.DEBUG, __file__, 1, 'write > %r', (Payload(),), None)
+        handler.handle(record)
+        assert Payload.formatted == 0  # 调用线程中不格式化
+        assert handler.queue.get_nowait().getMessage() == 'write > payload'
+
+    def test_listener_writes_file(self, tmp_path):
+        handler = BoundedQueueHandler()
+        file_handler = logging.FileHandler(tmp_path / 'tool.log', encoding='utf-8')
+        listener = QueueListener(handler.queue, file_handler)
+        listener.start()
+        for i in range(100):
+            handler.handle(self.make_record(f'msg {i}'))
+        listener.stop()
+        file_handler.close()
+        assert (tmp_path / 'tool.log').read_text(encoding='utf-8').splitlines() == [f'msg {i}' for i in range(100)]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# gui_/log_view相关测试
+import tkinter as tk
+
+import pytest
+
+from gui_.log_view import LogBuffer, LogView
+
+
+class FakeText:
+    """按行保存内容，支持 '行.0' 格式索引的删除"""
+
+    def __init__(self):
+        self.content = ''
+
+    def insert(self, index, *chars):
+        assert index == tk.END
+        self.content += ''.join(chars[::2])
+
+    def delete(self, start, end=None):
+        if end == tk.END:
+            self.content = ''
+            return
+        line = int(end.split('.')[0])
+        self.content = '\n'.join(self.content.split('\n')[line - 1:])
+
+
+class TestLogBuffer:
+
+    def test_trim_in_batches(self):
+        buffer = LogBuffer(max_lines=100, trim_batch=10)
+        dropped = [buffer.append(f'line {i}\n') for i in range(1000)]
+        assert len(buffer) <= 110
+        assert sum(dropped) == buffer.dropped_lines == 1001 - len(buffer)
+        assert sum(1 for i in dropped if i) == (1001 - 100) // 11  # 每次删除一批，而不是每行都删除
+        assert buffer.lines()[-2] == 'line 999'
+
+    def test_partial_line(self):
+        buffer = LogBuffer()
+        buffer.append('检测到串口')
+        buffer.append(' COM1')
+        buffer.append('\n')
+        assert buffer.lines() == ['检测到串口 COM1', '']
+        assert buffer.search('COM1') == ['检测到串口 COM1']
+
+
+class TestLogView:
+
+    def test_view_follows_buffer(self):
+        text = FakeText()
+        view = LogView(text, max_lines=50, trim_batch=5)
+        for i in range(500):
+            view.insert(tk.END, f'line {i}\n', 'warn', 'x', None, '\n', ())
+        assert text.content.split('\n') == view.buffer.lines()
+        assert len(view.buffer) <= 55
+        view.clear()
+        assert text.content == '' and view.buffer.lines() == ['']
+
+    def test_insert_not_at_end(self):
+        text = FakeText()
+        view = LogView(text)
+        view.insert(tk.END, 'line 0\n')
+        for index in ('1.0', 1.0, 'insert'):
+            with pytest.raises(ValueError):
+                view.insert(index, 'line 1\n')
+        assert text.content == 'line 0\n' and view.buffer.lines() == ['line 0', '']
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# utils/metrics相关测试
+import json
+import time
+
+import pytest
+
+from utils.metrics import Histogram, Metrics
+
+
+class TestHistogram:
+
+    def test_quantile(self):
+        histogram = Histogram(buckets=(0.01, 0.1, 1))
+        for _ in range(90):
+            histogram.observe(0.005)
+        for _ in range(10):
+            histogram.observe(0.5)
+        assert histogram.count == 100
+        assert histogram.quantile(0.5) == 0.01  # 所在桶的上限
+        assert histogram.quantile(0.95) == 0.5  # 不超过最大值
+        assert histogram.bucket_counts == [90, 0, 10, 0]
+        histogram.observe(5)
+        assert histogram.quantile(1) == 5
+
+
+class TestMetrics:
+
+    def test_timer_and_decorator(self):
+        metrics = Metrics()
+
+        @metrics.timed('sleep')
+        def sleep():
+            time.sleep(0.01)
+
+        sleep()
+        with pytest.raises(ValueError):
+            with metrics.timer('error'):
+                raise ValueError()
+        metrics.inc('bytes_written', 10)
+        metrics.inc('bytes_written', 5)
+        snapshot = metrics.snapshot()
+        assert snapshot['phases']['sleep']['count'] == 1
+        assert snapshot['phases']['sleep']['sum'] >= 0.01
+        assert snapshot['phases']['error']['count'] == 1  # 异常时同样记录
+        assert snapshot['counters'] == {'bytes_written': 15}
+
+    def test_export(self, tmp_path):
+        metrics = Metrics(buckets=(0.01, 0.1))
+        metrics.observe('get_hid', 0.05)
+        metrics.inc('retries')
+        metrics.export(tmp_path / 'metrics.prom')
+        content = (tmp_path / 'metrics.prom').read_text(encoding='utf-8')
+        assert 'oneos_license_phase_seconds_bucket{phase="get_hid",le="0.01"} 0' in content
+        assert 'oneos_license_phase_seconds_bucket{phase="get_hid",le="+Inf"} 1' in content
+        assert 'oneos_license_retries_total 1' in content
+        metrics.export(tmp_path / 'metrics.json')
+        assert json.loads((tmp_path / 'metrics.json').read_text(encoding='utf-8'))['counters'] == {'retries': 1}
+        assert metrics.summary()[0].startswith('get_hid: 1次')
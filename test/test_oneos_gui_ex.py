@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# gui_/oneos_gui_ex相关测试，Tk控件使用MagicMock代替，不需要显示环境
+import base64
+from threading import Event, current_thread, main_thread
+import tkinter as tk
+import tkinter.messagebox
+from tkinter import ttk
+from unittest import mock
+
+import pytest
+
+import gui_.oneos_gui_ex as oneos_gui_ex
+import service_.validation as validation
+from dao import DaoException, FRAME_CACHE_EAGER, FRAME_CACHE_LAZY, STORAGE_DISK, STORAGE_MEMORY
+from gui_.log_view import LogView
+
+HIDS = ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1']
+
+
+def fake_module(module):
+    """控件类替换为MagicMock，保留tk.END等常量，每个StringVar是单独的对象"""
+    fake = mock.MagicMock()
+    fake.StringVar.side_effect = lambda *args, **kwargs: mock.MagicMock()
+    for name in dir(module):
+        if name.isupper():
+            setattr(fake, name, getattr(module, name))
+    return fake
+
+
+def write_license_file(tmp_path, bad_license='not base64!'):
+    """HIDS[1]的license无法转码"""
+    file_path = tmp_path / 'license.csv'
+    file_path.write_text(f'设备HID,RTC/03E8\n{HIDS[0]},{base64.b64encode(b"license").decode()}\n'
+                         f'{HIDS[1]},{bad_license}\n', encoding='utf-8')
+    return str(file_path)
+
+
+@pytest.fixture
+def gui(monkeypatch):
+    monkeypatch.setattr(oneos_gui_ex, 'tk', fake_module(tk))
+    monkeypatch.setattr(oneos_gui_ex, 'ttk', fake_module(ttk))
+    gui = oneos_gui_ex.OneOsGui()
+    yield gui
+    gui.ledger.close()
+
+
+class TestOneOsGui:
+
+    def test_init(self, gui):
+        assert isinstance(gui.log_view, LogView)
+        assert gui.work_type.set.call_args == mock.call('读HID')
+        assert not gui.port_watcher.is_alive()  # run()时才开始监听串口
+
+    def test_refresh_var(self, gui):
+        gui.log_view.insert(tk.END, '开始读HID流程\n')
+        gui.refresh_var(oneos_gui_ex.StatusEnum.License.value)
+        assert gui.work_type.set.call_args == mock.call('写license')
+        assert gui.log_view.buffer.lines() == ['']
+        with pytest.raises(oneos_gui_ex.StatusEnumException):
+            gui.refresh_var('unknown')
+
+    def test_port_hot_plug(self, gui):
+        assert not gui.port_watcher.notify_initial
+        gui.hid_engine = mock.MagicMock(is_running=True)
+        gui.provision_engine = mock.MagicMock(is_running=False)
+        gui._OneOsGui__on_port_removed('COM3')
+        assert gui.hid_engine.remove_port.call_args_list == [mock.call('COM3')]
+        assert not gui.provision_engine.remove_port.called  # 未运行的流程不处理
+        gui._OneOsGui__on_port_added('COM3')
+        assert gui.hid_engine.add_port.call_args_list == [mock.call('COM3')]
+        gui.ui_queue.drain()
+        assert gui.log_view.buffer.lines()[-3:-1] == ['串口COM3已移除', '串口COM3已接入']
+
+    def test_export_hid_record(self, gui, monkeypatch):
+        exported = Event()
+        threads = []
+
+        def export_hid(file_path):
+            threads.append(current_thread())
+            exported.set()
+            return 2
+
+        monkeypatch.setattr(oneos_gui_ex, 'export_HID', export_hid)
+        gui.export_hid_record()  # 未选择HID记录文件
+        gui.hid_filepath = 'hid.xlsx'
+        gui.export_hid_record()
+        assert exported.wait(timeout=5)
+        threads[0].join(timeout=5)
+        assert len(threads) == 1 and threads[0] is not main_thread()  # 不在界面线程中导出
+        gui.ui_queue.drain()
+        assert '导出2个HID到hid.xlsx' in gui.log_view.buffer.lines()
+
+
+class TestLoadLicenseFile:
+
+    @staticmethod
+    def log_lines(gui) -> list:
+        gui.ui_queue.drain()  # 导入结果中再次投递的日志
+        return gui.log_view.buffer.lines()
+
+    def test_memory(self, gui, tmp_path):
+        gui.license_filepath = write_license_file(tmp_path)
+        gui.load_license_file(gui.license_filepath)
+        assert gui.hid_license_map is None  # 在界面线程中替换
+        gui.ui_queue.drain()
+        hid_license_map = gui.hid_license_map
+        assert hid_license_map.storage == STORAGE_MEMORY and hid_license_map.frame_cache == FRAME_CACHE_EAGER
+        assert list(hid_license_map.invalid_licenses) == [(HIDS[1], '03E8')]
+        lines = self.log_lines(gui)
+        assert any(line.startswith('license文件校验: 2行，HID2个') for line in lines)
+        assert any(line.startswith(f'  行3 {HIDS[1]} 03E8 license转码失败') for line in lines)
+
+    def test_disk_lazy(self, gui, tmp_path, monkeypatch):
+        monkeypatch.setattr(validation, 'choose_storage', lambda file_path: STORAGE_DISK)
+        gui.license_filepath = write_license_file(tmp_path)
+        gui.load_license_file(gui.license_filepath)
+        gui.ui_queue.drain()
+        hid_license_map = gui.hid_license_map
+        try:
+            # 磁盘模式导入时不转码全部license，转码错误由校验报告
+            assert hid_license_map.storage == STORAGE_DISK and hid_license_map.frame_cache == FRAME_CACHE_LAZY
+            assert hid_license_map.invalid_licenses == {}
+            assert any(line.startswith(f'  行3 {HIDS[1]} 03E8 base64解码失败') for line in self.log_lines(gui))
+            with pytest.raises(DaoException):
+                hid_license_map.get_frame(HIDS[1], '03E8')
+        finally:
+            hid_license_map.close()
+
+    def test_replaced_while_loading(self, gui, tmp_path):
+        file_path = write_license_file(tmp_path)
+        gui.license_filepath = file_path
+        gui.load_license_file(file_path)
+        gui.license_filepath = str(tmp_path / 'other.xlsx')  # 导入期间又选择了其它文件
+        gui.ui_queue.drain()
+        assert gui.hid_license_map is None
+        assert not any(line.startswith('license文件校验') for line in self.log_lines(gui))
+
+    def test_failed(self, gui, tmp_path, monkeypatch):
+        errors = []
+        monkeypatch.setattr(tkinter.messagebox, 'showerror', lambda **kwargs: errors.append(kwargs['message']))
+        file_path = tmp_path / 'license.csv'
+        file_path.write_text('HID,RTC/03E8\n', encoding='utf-8')
+        gui.license_filepath = str(file_path)
+        gui.load_license_file(gui.license_filepath)
+        gui.ui_queue.drain()
+        assert gui.hid_license_map is None and len(errors) == 1
+        assert gui.record_filepath.set.call_args == mock.call('')
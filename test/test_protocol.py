@@ -4,7 +4,13 @@
 """
 
 
-from utils.protocol_utils import parse_protocol, build_protocol
+import random
+
+import pytest
+
+from utils.entities import ProtocolFrame
+from utils.protocol_utils import parse_protocol, build_protocol, encode_frame, decode_frame, FrameDecoder, \
+    ProtocolException, ProtocolHeadException, ProtocolSumException
 
 
 class TestProtocol:
@@ -61,4 +67,69 @@ class TestProtocol:
         print('payload_length', board_protocol.payload_length)
         print('check_sum', board_protocol.check_sum)
 
+    def test_encode_decode_frame(self):
+        frame = encode_frame(bytes.fromhex('540049001350564846323020'), command=0x0081)
+        assert frame == bytes.fromhex('5A00120081000E0000540049001350564846323020F5')
+        assert decode_frame(frame) == ProtocolFrame(0x0081, 0x0000, bytes.fromhex('540049001350564846323020'))
+        assert decode_frame(memoryview(encode_frame())) == ProtocolFrame(0x0001, 0x0000, b'')
+
+    def test_decode_frame_errors(self):
+        frame = encode_frame(b'\x00', component_id=0x03E8, command=0x0082)
+        with pytest.raises(ProtocolHeadException):
+            decode_frame(b'\x5b' + frame[1:])
+        with pytest.raises(ProtocolSumException):
+            decode_frame(frame[:-1] + bytes(((frame[-1] + 1) & 0xFF,)))
+        with pytest.raises(ProtocolException):
+            decode_frame(frame[:-2] + frame[-1:])
+
+    def test_build_parse_license(self):
+        license_ = bytes(range(256)).hex()
+        protocol = build_protocol(license_, component_id='03E8', command='0002')
+        payload_data = parse_protocol(protocol).payload_data
+        assert payload_data.command == '0002'
+        assert payload_data.component_id == '03E8'
+        assert payload_data.data == license_.upper()
+
+
+class TestFrameDecoder:
+
+    @staticmethod
+    def make_stream(rnd):
+        """生成包含有效帧、无效数据和校验错误帧的数据流，返回(数据流, 有效帧列表)"""
+        stream, expected = b'', []
+        for i in range(50):
+            frame = encode_frame(rnd.randbytes(rnd.randint(0, 300)), component_id=i, command=0x0082)
+            choice = rnd.random()
+            if choice < 0.2:
+                stream += rnd.randbytes(rnd.randint(1, 20))  # 无效数据
+            elif choice < 0.3:
+                stream += frame[:-1] + bytes(((frame[-1] + 1) & 0xFF,))  # 校验和错误
+                continue
+            stream += frame
+            expected.append(decode_frame(frame))
+        return stream, expected
+
+    @pytest.mark.parametrize('seed', range(20))
+    def test_random_chunks(self, seed):
+        rnd = random.Random(seed)
+        stream, expected = self.make_stream(rnd)
+        decoder = FrameDecoder()
+        frames, idx = [], 0
+        while idx < len(stream):
+            size = rnd.choice([1, 2, 3, rnd.randint(1, 64), rnd.randint(1, 1024)])
+            frames.extend(decoder.feed(stream[idx:idx + size]))
+            idx += size
+        assert frames == expected
+
+    def test_concatenated_frames(self):
+        frames = [encode_frame(b'\x00', component_id=i, command=0x0082) for i in range(3)]
+        decoder = FrameDecoder()
+        assert decoder.feed_raw(b''.join(frames)) == frames
+        assert decoder.feed_raw(b'') == []
 
+    def test_bounded_buffer(self):
+        decoder = FrameDecoder(max_frame_size=64)
+        frame = encode_frame(bytes(100))  # 超过max_frame_size，视为无效数据
+        small = encode_frame(b'\x01')
+        assert decoder.feed(frame + small) == [decode_frame(small)]
+        assert decoder.dropped_bytes == len(frame)
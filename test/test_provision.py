@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# service_/provision相关测试
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+import pytest
+
+from service_.ledger import Ledger, HID_FAILED
+from service_.provision import ProvisionState, ProvisionEngine
+from utils.entities import DataError
+from utils.protocol_utils import encode_frame
+
+
+class TestProvisionState:
+
+    def test_claim_once_across_threads(self):
+        state = ProvisionState()
+        hid = '35D9C0AE729DB9E0'
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            claimed = list(executor.map(lambda _: state.claim(hid), range(64)))
+        assert claimed.count(True) == 1
+
+    def test_release(self):
+        state = ProvisionState()
+        hid = '35D9C0AE729DB9E0'
+        assert state.claim(hid)
+        state.release(hid, False)  # 写入失败，允许重新写入
+        assert state.claim(hid)
+        state.release(hid, True)
+        assert not state.claim(hid)
+        assert state.activated_hids == {hid}
+
+
+class FakeLicenseMap:
+
+    def __init__(self, hid_license_map):
+        self.hid_license_map = hid_license_map
+
+    def get_license(self, hid):
+        return self.hid_license_map.get(hid, {})
+
+    def get_frame(self, hid, component_id):
+        return encode_frame(base64.b64decode(self.hid_license_map[hid][component_id]), int(component_id, 16), 0x0002)
+
+
+class FakeWorker:
+    """不打开串口的工作线程，由测试调用exit模拟流程退出"""
+
+    LINE_NAME = 'fake'
+
+    def __init__(self, engine, port):
+        self.engine = engine
+        self.port = port
+        self.if_stop = False
+        self.if_restart = False
+        self.started = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.if_stop = True
+
+    def exit(self):
+        self.engine.worker_finished(self)
+
+
+class FakeWorkerEngine(ProvisionEngine):
+
+    WORKER_CLASS = FakeWorker
+
+
+class TestProvisionEngine:
+
+    def test_replug(self):
+        finished = Event()
+        engine = FakeWorkerEngine(['COM3', 'COM4'], 115200, FakeLicenseMap({}), on_finished=finished.set)
+        engine.start()
+        engine.remove_port('COM3')
+        engine.workers['COM3'].exit()
+        assert list(engine.workers) == ['COM4']
+        engine.workers['COM4'].exit()
+        assert not finished.is_set()  # 等待被移除的串口重新接入
+        engine.add_port('COM3')
+        assert list(engine.workers) == ['COM3'] and engine.workers['COM3'].started
+        engine.add_port('COM5')  # 不在流程中的串口不开始
+        assert list(engine.workers) == ['COM3']
+        engine.workers['COM3'].exit()
+        assert finished.is_set()
+
+    def test_replug_while_exiting(self):
+        finished = Event()
+        engine = FakeWorkerEngine(['COM3'], 115200, FakeLicenseMap({}), on_finished=finished.set)
+        engine.start()
+        old_worker = engine.workers['COM3']
+        engine.remove_port('COM3')  # 流程已退出循环，尚未调用worker_finished
+        engine.add_port('COM3')
+        assert engine.workers['COM3'] is old_worker
+        old_worker.exit()
+        new_worker = engine.workers['COM3']
+        assert new_worker is not old_worker and new_worker.started and not new_worker.if_stop
+        assert not finished.is_set()
+        new_worker.exit()  # 正常退出时不再重新开始
+        assert not engine.workers and finished.is_set()
+
+    def test_stop_while_removed(self):
+        finished = Event()
+        engine = FakeWorkerEngine(['COM3'], 115200, FakeLicenseMap({}), on_finished=finished.set)
+        engine.start()
+        engine.remove_port('COM3')
+        engine.workers['COM3'].exit()
+        assert not engine.workers and not finished.is_set()
+        engine.stop()
+        assert finished.is_set()
+        engine.add_port('COM3')  # 停止后重新接入不再开始
+        assert not engine.workers
+
+    def test_parallel_ports(self):
+        simulator = pytest.importorskip('serial_.simulator')
+        hids = ['35D9C0AE729DB9E0', '35D9C0AE729DB9E0', '35D9C0AE729DB9E1']  # 前两个串口连接相同HID
+        license_map = FakeLicenseMap({hid: {'03E8': base64.b64encode(hid.encode()).decode(), '03E9': 'AQID'}
+                                      for hid in hids})
+        simulators = [simulator.BoardSimulator([hid], auto_swap=False).start() for hid in hids]
+        finished = Event()
+        try:
+            engine = ProvisionEngine([i.port for i in simulators], 115200, license_map,
+                                     on_finished=finished.set, max_wait_time=1, interval=0.05)
+            engine.start()
+            assert finished.wait(timeout=30)
+        finally:
+            for i in simulators:
+                i.stop()
+        assert engine.state.activated_hids == set(hids)
+        written = [hid for i in simulators for hid in i.licenses]
+        assert sorted(written) == sorted(set(hids))  # 同一HID只被写入一次
+        assert all(len(components) == 2 for i in simulators for components in i.licenses.values())
+
+    def run_pipelined(self, pipeline, components=4):
+        simulator = pytest.importorskip('serial_.simulator')
+        hid = '35D9C0AE729DB9E0'
+        license_map = FakeLicenseMap({hid: {f'{0x03E8 + i:04X}': base64.b64encode(bytes([i + 1] * 8)).decode()
+                                            for i in range(components)}})
+        board = simulator.BoardSimulator([hid], transit_delay=0.05, auto_swap=False, pipeline=pipeline).start()
+        finished = Event()
+        logs = []
+        try:
+            engine = ProvisionEngine([board.port], 115200, license_map, on_log=lambda port, content, tag=None:
+                                     logs.append(content), on_finished=finished.set, max_wait_time=1,
+                                     interval=0.05, pipeline_window=3, response_timeout=0.5)
+            engine.start()
+            assert finished.wait(timeout=30)
+        finally:
+            board.stop()
+        return engine, board, ''.join(logs)
+
+    def test_pipelined_window(self):
+        engine, board, logs = self.run_pipelined(True)
+        assert len(engine.state.success_license) == 4
+        assert not engine.state.failed_license
+        assert len(board.licenses['35D9C0AE729DB9E0']) == 4
+        assert '不支持流水线' not in logs
+
+    def test_pipelined_fallback(self):
+        engine, board, logs = self.run_pipelined(False)
+        assert len(engine.state.success_license) == 4  # 回退为停等方式后全部写入成功
+        assert not engine.state.failed_license
+        assert len(board.licenses['35D9C0AE729DB9E0']) == 4
+        assert board.dropped
+        assert logs.count('不支持流水线') == 1  # 回退后该串口不再尝试流水线
+
+    def test_ledger_errors(self, tmp_path):
+        simulator = pytest.importorskip('serial_.simulator')
+        hid = '35D9C0AE729DB9E0'
+        license_map = FakeLicenseMap({hid: {'03E8': 'AQID', '03E9': 'BAUG'}})
+        board = simulator.BoardSimulator([hid], auto_swap=False,
+                                         error_codes={'03E9': DataError.LICENSE_CPID_NOT_MATCH}).start()
+        with Ledger(tmp_path / 'ledger.db') as ledger:
+            try:
+                engine = ProvisionEngine([board.port], 115200, license_map, ProvisionState(ledger), interval=0.05)
+                engine.start()
+                deadline = time.monotonic() + 30
+                while ledger.status(hid) is None and time.monotonic() < deadline:  # 写入失败的设备会一直重试
+                    time.sleep(0.05)
+                engine.stop(wait=True)
+            finally:
+                board.stop()
+            assert ledger.status(hid) == HID_FAILED
+            attempts = [attempt[:3] for attempt in ledger.attempts(hid)]
+        assert attempts[:2] == [('03E8', True, None), ('03E9', False, DataError.LICENSE_CPID_NOT_MATCH.value)]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# serial_/pyboard相关测试，使用虚拟开发板
+import pytest
+
+from serial_.conserial import ConSerial, OUT_WAITING_LIMIT
+from serial_.pyboard import PyBoard, LICENSE_CHUNK_SIZE, LICENSE_CHUNK_INTERVAL
+from utils.entities import DataError
+from utils.protocol_utils import parse_protocol, encode_frame, decode_frame, check_frame
+
+simulator = pytest.importorskip('serial_.simulator')
+
+HIDS = ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1']
+
+
+def license_frame(component_id=0x03E8, license_=b'\x01\x02\x03'):
+    return encode_frame(license_, component_id, simulator.LICENSE_PUT_REQUEST)
+
+
+class TestPyBoard:
+
+    def test_get_hid(self):
+        with simulator.BoardSimulator(HIDS) as board_simulator:
+            board = PyBoard(board_simulator.port, 115200)
+            try:
+                assert parse_protocol(board.get_HID()).payload_data.data == HIDS[0]
+            finally:
+                board.close()
+
+    def test_send_license(self):
+        with simulator.BoardSimulator(HIDS, error_codes={'03E9': DataError.LICENSE_CPID_NOT_MATCH}) \
+                as board_simulator:
+            board = PyBoard(board_simulator.port, 115200)
+            try:
+                board.send_license(license_frame())
+                assert check_frame(decode_frame(board.read_frame()), 'license_put_response')
+                board.send_license(license_frame(component_id=0x03E9))
+                frame = decode_frame(board.read_frame())
+                assert frame.data == bytes.fromhex(DataError.LICENSE_CPID_NOT_MATCH.value)
+                assert board_simulator.licenses == {HIDS[0]: {'03E8': b'\x01\x02\x03'}}
+                # 写入过license后，下一次读HID时模拟更换设备
+                assert parse_protocol(board.get_HID()).payload_data.data == HIDS[1]
+            finally:
+                board.close()
+
+    def test_send_license_out_waiting(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(ConSerial, 'write_chunked', lambda self, *args: calls.append(args))
+        with simulator.BoardSimulator(HIDS) as board_simulator:
+            board = PyBoard(board_simulator.port, 115200)
+            try:
+                board.send_license(license_frame())
+            finally:
+                board.close()
+        # 默认不等待每批发送完毕，按输出缓冲区积压限流
+        assert calls == [(license_frame(), LICENSE_CHUNK_SIZE, LICENSE_CHUNK_INTERVAL, False, OUT_WAITING_LIMIT)]
+
+    def test_fragmented_and_corrupted_responses(self):
+        with simulator.BoardSimulator(HIDS, chunk_size=3, chunk_interval=0.001, seed=1) as board_simulator:
+            board = PyBoard(board_simulator.port, 115200)
+            try:
+                assert parse_protocol(board.get_HID()).payload_data.data == HIDS[0]
+                board_simulator.corruption_rate = 1
+                assert board.read_frame(timeout=0.1) is None
+                board.send_license(license_frame())
+                assert board.read_frame(timeout=0.5) is None  # 校验失败的帧被丢弃
+            finally:
+                board.close()
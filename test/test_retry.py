@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# utils/retry相关测试
+import time
+
+import pytest
+
+from utils.retry import RetryPolicy, retry, retry_remaining
+
+
+class Flaky:
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestRetryPolicy:
+
+    def test_retry_until_success(self):
+        func = Flaky([OSError(), OSError()])
+        assert RetryPolicy(tries=3, delay=0).call(func) == 'ok'
+        assert func.calls == 3
+
+    def test_exception_filter(self):
+        func = Flaky([ValueError()])
+        with pytest.raises(ValueError):
+            RetryPolicy(tries=3, delay=0, retry_on=(OSError,)).call(func)
+        assert func.calls == 1
+        func = Flaky([ConnectionError()])
+        with pytest.raises(ConnectionError):
+            RetryPolicy(tries=3, delay=0, retry_on=(OSError,), giveup_on=(ConnectionError,)).call(func)
+        assert func.calls == 1
+
+    def test_deadline(self):
+        func = Flaky([OSError()] * 10)
+        start = time.monotonic()
+        with pytest.raises(OSError):
+            RetryPolicy(tries=10, delay=0.1, backoff=1, deadline=0.25).call(func)
+        assert time.monotonic() - start < 0.3
+        assert func.calls <= 3
+
+    def test_jitter(self):
+        func = Flaky([OSError()] * 3)
+        start = time.monotonic()
+        RetryPolicy(tries=4, delay=0.02, backoff=1, jitter=0.5).call(func)
+        assert 0.03 <= time.monotonic() - start < 0.5
+
+    def test_nested_share_budget(self):
+        inner_func = Flaky([OSError()] * 10)
+        inner = RetryPolicy(tries=3, delay=0)(inner_func)
+        remaining = []
+
+        @RetryPolicy(tries=2, delay=0, deadline=5)
+        def outer():
+            remaining.append(retry_remaining())
+            return inner()
+
+        with pytest.raises(OSError):
+            outer()
+        assert inner_func.calls == 2  # 共用外层的次数，而不是 2 * 3
+        assert all(0 < i <= 5 for i in remaining)
+        assert retry_remaining() is None
+
+    def test_per_call_override(self):
+        func = Flaky([OSError()] * 2)
+        decorated = retry(tries=3, delay=0)(func)
+        with pytest.raises(OSError):
+            decorated(retry_policy=RetryPolicy(tries=1))
+        assert func.calls == 1
+        assert decorated() == 'ok'
+        policy = RetryPolicy(tries=3, delay=0.5).replace(tries=1)
+        assert policy.tries == 1 and policy.delay == 0.5
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# service_/statistics相关测试
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from service_.statistics import HIDStatistics
+
+
+class TestHIDStatistics:
+
+    def test_session(self):
+        statistics = HIDStatistics(['35D9C0AE729DB9E0', '35D9C0AE729DB9E0'])
+        assert statistics.is_recorded('35D9C0AE729DB9E0')
+        assert not statistics.is_recorded('35D9C0AE729DB9E1')
+        assert statistics.try_add_recorded('35D9C0AE729DB9E1')
+        assert not statistics.try_add_recorded('35D9C0AE729DB9E1')
+        statistics.add_confirmed('35D9C0AE729DB9E0')
+        statistics.add_confirmed('35D9C0AE729DB9E0')
+        statistics.add_failed('35D9C0AE729DB9E2')
+        statistics.add_failed('35D9C0AE729DB9E2')
+        assert statistics.is_recorded('35D9C0AE729DB9E1')
+        assert statistics.counts() == {'new_add': 1, 'new_success': 2, 'new_failed': 1, 'record': 2}
+        statistics.reset_session()
+        assert statistics.counts() == {'new_add': 0, 'new_success': 0, 'new_failed': 0, 'record': 2}
+
+    def test_add_recorded_once_across_threads(self):
+        statistics = HIDStatistics()
+        barrier = Barrier(8)
+
+        def add(_):
+            barrier.wait()
+            return statistics.try_add_recorded('35D9C0AE729DB9E0')
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(add, range(8)))
+        assert results.count(True) == 1
+        assert statistics.counts()['new_add'] == 1
+
+    def test_failed_reverts(self):
+        statistics = HIDStatistics(['35D9C0AE729DB9E0'])
+        assert statistics.try_add_recorded('35D9C0AE729DB9E1')
+        statistics.add_failed('35D9C0AE729DB9E1')
+        assert not statistics.is_recorded('35D9C0AE729DB9E1')
+        assert statistics.counts() == {'new_add': 0, 'new_success': 0, 'new_failed': 1, 'record': 1}
+        statistics.add_failed('35D9C0AE729DB9E0')  # 已记录过的HID不撤销
+        assert statistics.is_recorded('35D9C0AE729DB9E0')
+        assert statistics.try_add_recorded('35D9C0AE729DB9E1')  # 下次读到时重新存储
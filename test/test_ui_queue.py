@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# gui_/ui_queue相关测试
+import tkinter as tk
+from threading import Thread
+
+from gui_.ui_queue import UiQueue
+
+
+class FakeRoot:
+
+    def after(self, ms, func):
+        return 'after#1'
+
+    def after_cancel(self, after_id):
+        pass
+
+
+class FakeText:
+
+    def __init__(self):
+        self.calls = []
+
+    def insert(self, index, *chars):
+        self.calls.append((index, chars))
+
+
+class TestUiQueue:
+
+    def test_inserts_coalesced(self):
+        ui_queue = UiQueue(FakeRoot())
+        text = FakeText()
+        threads = [Thread(target=lambda: [ui_queue.post_insert(text, 'line\n') for _ in range(100)])
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        ui_queue.drain()
+        assert len(text.calls) == 1
+        index, chars = text.calls[0]
+        assert index == tk.END
+        assert chars.count('line\n') == 400
+
+    def test_order_and_latest(self):
+        ui_queue = UiQueue(FakeRoot())
+        text = FakeText()
+        calls = []
+        ui_queue.post_insert(text, 'a', 'warn')
+        ui_queue.post(calls.append, 'clear')
+        ui_queue.post_insert(text, 'b')
+        ui_queue.post_insert(text, 'c', index='1.0')
+        for i in range(10):
+            ui_queue.post_latest('statistics', calls.append, i)
+        ui_queue.drain()
+        assert text.calls == [(tk.END, ('a', 'warn')), (tk.END, ('b', ())), ('1.0', ('c', ()))]
+        assert calls == ['clear', 9]
+        ui_queue.drain()
+        assert calls == ['clear', 9]
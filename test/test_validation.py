@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# service_/validation相关测试
+import pandas as pd
+import pytest
+
+import dao
+import service_.validation as validation
+from dao import HID_COLUMN_NAME, TIPS_COLUMNS_NAME, LICENSE_FILE_SHEET_NAME, STORAGE_MEMORY, STORAGE_DISK, \
+    FRAME_CACHE_EAGER, FRAME_CACHE_LAZY
+from service_.validation import validate_dataframe, validate_license_file, validate_stream, load_license_map
+
+REPORT_ATTRIBUTES = ('rows', 'hids_counts', 'column_errors', 'duplicate_hids', 'component_counts')
+
+
+def make_df():
+    return pd.DataFrame({HID_COLUMN_NAME: ['35D9C0AE729DB9E0', '35D9C0AE729DB9E1', '35D9C0AE729DB9E0',
+                                           '35D9C0AE729DB9E', 'XYZ0', None],
+                         TIPS_COLUMNS_NAME: [None] * 6,
+                         'RTC/03E8': ['AQID', 'AQI', 'AQID', 'AQID', 'AQID', 'AQID'],
+                         'POS/03E9': ['BAUG', None, None, None, None, None],
+                         'NFC': [None] * 6})
+
+
+class TestValidation:
+
+    @pytest.mark.parametrize('options', [{'workers': 1},
+                                         {'workers': 2, 'chunk_size': 2, 'parallel_min_rows': 1}])
+    def test_report(self, options):
+        report = validate_dataframe(make_df(), **options)
+        assert not report.if_ok
+        assert report.rows == 6
+        assert report.column_errors == ['组件列NFC中组件名和组件id需要用斜杠/分隔']
+        assert report.duplicate_hids == {'35D9C0AE729DB9E0': [2, 4]}
+        assert report.component_counts == {'03E8': 5, '03E9': 1}
+        assert [(issue.row, issue.component_id, issue.error.split(':')[0]) for issue in report.issues] == [
+            (3, '03E8', 'base64解码失败'),
+            (5, None, 'HID为奇数长度'),
+            (6, None, 'HID不是十六进制'),
+            (7, None, 'HID为空'),
+        ]
+
+    def test_license_file(self, tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        make_df().iloc[:2].drop(columns=['NFC']).to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        report = validate_license_file(file_path)
+        assert report.hids_counts == 2
+        assert len(report.issues) == 1
+        assert report.summary()[0].startswith('license文件校验: 2行，HID2个')
+
+    def test_stream(self, tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        make_df().to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        expected = validate_dataframe(pd.read_excel(file_path, sheet_name=LICENSE_FILE_SHEET_NAME, dtype=str), workers=1)
+        report = validate_stream(file_path, chunk_size=2)
+        for attribute in REPORT_ATTRIBUTES + ('issues',):
+            assert getattr(report, attribute) == getattr(expected, attribute)
+
+
+class TestLoadLicenseMap:
+
+    @staticmethod
+    def write_file(tmp_path):
+        file_path = tmp_path / 'hid-license.xlsx'
+        make_df().drop(columns=['NFC']).to_excel(file_path, index=False, sheet_name=LICENSE_FILE_SHEET_NAME)
+        return file_path
+
+    @staticmethod
+    def issue_rows(report):
+        return [(issue.row, issue.component_id) for issue in report.issues]
+
+    @pytest.fixture
+    def reads(self, monkeypatch):
+        """记录读取license文件的次数"""
+        reads = []
+        origin = dao.iter_license_rows
+
+        def iter_license_rows(file_path, *args):
+            reads.append(file_path)
+            return origin(file_path, *args)
+
+        monkeypatch.setattr(dao, 'iter_license_rows', iter_license_rows)
+        monkeypatch.setattr(validation, 'iter_license_rows', iter_license_rows)
+        return reads
+
+    @pytest.mark.parametrize('storage, frame_cache', [(STORAGE_MEMORY, FRAME_CACHE_EAGER),
+                                                      (STORAGE_DISK, FRAME_CACHE_LAZY)])
+    def test_single_read(self, tmp_path, reads, storage, frame_cache):
+        file_path = self.write_file(tmp_path)
+        expected = validate_stream(file_path)
+        reads.clear()
+        hid_license_map, report = load_license_map(file_path, storage)
+        try:
+            assert reads == [file_path]  # 导入和校验共用一次读取
+            assert hid_license_map.frame_cache == frame_cache
+            for attribute in REPORT_ATTRIBUTES:
+                assert getattr(report, attribute) == getattr(expected, attribute)
+            assert self.issue_rows(report) == self.issue_rows(expected)
+        finally:
+            hid_license_map.close()
+
+    def test_license_decoded_once(self, tmp_path, monkeypatch):
+        decoded = []
+        monkeypatch.setattr(validation, 'check_license', lambda license_: decoded.append(license_) or '')
+        hid_license_map, report = load_license_map(self.write_file(tmp_path), STORAGE_MEMORY)
+        assert decoded == []  # 导入时已生成license帧，校验不再转码
+        assert [(issue.row, issue.error.split(':')[0]) for issue in report.issues if issue.component_id] == [
+            (3, 'license转码失败')]
+        assert report.component_counts == {'03E8': 5, '03E9': 1}
+
+    def test_parallel(self, tmp_path):
+        file_path = self.write_file(tmp_path)
+        expected = validate_stream(file_path, workers=1)
+        hid_license_map, report = load_license_map(file_path, STORAGE_DISK, workers=2, parallel_min_rows=1)
+        hid_license_map.close()
+        for attribute in REPORT_ATTRIBUTES + ('issues',):
+            assert getattr(report, attribute) == getattr(expected, attribute)
+
+    def test_reused_index(self, tmp_path, reads):
+        file_path = self.write_file(tmp_path)
+        index_path = tmp_path / 'license.db'
+        load_license_map(file_path, STORAGE_DISK, index_path)[0].close()
+        reads.clear()
+        hid_license_map, report = load_license_map(file_path, STORAGE_DISK, index_path)
+        hid_license_map.close()
+        assert reads == [file_path]  # 索引未读取文件，单独校验
+        assert report.rows == 6 and report.duplicate_hids
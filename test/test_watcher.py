@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# serial_/watcher相关测试
+import time
+from threading import Event
+
+import pytest
+
+from serial_.watcher import PortWatcher
+from service_.collect import HIDCollectEngine
+
+
+class FakePorts:
+    """可修改的串口列表，模拟插拔"""
+
+    def __init__(self, *ports):
+        self.ports = list(ports)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.ports)
+
+
+class TestPortWatcher:
+
+    def test_debounce(self):
+        fake_ports = FakePorts('COM3')
+        added, removed = [], []
+        watcher = PortWatcher(debounce=2, list_ports=fake_ports, use_sysfs=False,
+                              on_added=added.append, on_removed=removed.append)
+        assert watcher.poll() == (['COM3'], [])  # 第一次轮询时已有的串口直接确认
+        fake_ports.ports = ['COM3', 'COM4']
+        assert watcher.poll() == ([], [])
+        fake_ports.ports = ['COM3']  # 抖动，COM4未连续出现
+        assert watcher.poll() == ([], [])
+        fake_ports.ports = ['COM4']
+        watcher.poll()
+        assert watcher.poll() == (['COM4'], ['COM3'])
+        assert watcher.ports == ['COM4']
+        assert added == ['COM3', 'COM4'] and removed == ['COM3']
+
+    def test_not_notify_initial(self):
+        fake_ports = FakePorts('COM3')
+        added, removed = [], []
+        watcher = PortWatcher(debounce=1, list_ports=fake_ports, use_sysfs=False, on_added=added.append,
+                              on_removed=removed.append, notify_initial=False)
+        assert watcher.poll() == (['COM3'], [])
+        assert watcher.ports == ['COM3'] and added == []  # 启动时已有的串口不通知
+        fake_ports.ports = ['COM4']
+        watcher.poll()
+        assert added == ['COM4'] and removed == ['COM3']
+
+    def test_sysfs_cache(self, monkeypatch):
+        fake_ports = FakePorts('/dev/ttyUSB0')
+        signature = frozenset(['ttyUSB0'])
+        monkeypatch.setattr('serial_.watcher.sysfs_signature', lambda: signature)
+        watcher = PortWatcher(list_ports=fake_ports)
+        for _ in range(3):
+            watcher.poll()
+        assert fake_ports.calls == 1  # sysfs没有变化时不重新枚举
+        signature = frozenset(['ttyUSB0', 'ttyUSB1'])
+        watcher.poll()
+        assert fake_ports.calls == 2
+
+    def test_enumerate_error(self):
+        def list_ports():
+            raise OSError('busy')
+
+        watcher = PortWatcher(list_ports=list_ports, use_sysfs=False)
+        assert watcher.poll() == ([], [])
+        assert watcher.ports == []
+
+
+class TestEngineWatch:
+
+    def test_hot_plug(self, tmp_path):
+        simulator = pytest.importorskip('serial_.simulator')
+        boards = [simulator.BoardSimulator([hid], auto_swap=False).start()
+                  for hid in ('35D9C0AE729DB9E0', '35D9C0AE729DB9E1')]
+        fake_ports = FakePorts()
+        watcher = PortWatcher(interval=0.05, debounce=1, list_ports=fake_ports, use_sysfs=False)
+        finished = Event()
+        engine = HIDCollectEngine([], 115200, tmp_path / 'hids.xlsx', on_finished=finished.set,
+                                  max_wait_time=float('inf'), interval=0.05)
+        engine.watch(watcher, ['/dev/pts/*'])
+        watcher.start()
+        engine.start()
+        try:
+            fake_ports.ports = [boards[0].port, '/dev/ttyS0']  # 不匹配的串口不开始流程
+            deadline = time.monotonic() + 10
+            while engine.statistics.counts()['new_add'] < 1 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert list(engine.workers) == [boards[0].port]
+            fake_ports.ports = [boards[1].port]  # 更换治具
+            while engine.statistics.counts()['new_add'] < 2 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            while boards[0].port in engine.workers and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert list(engine.workers) == [boards[1].port]
+            assert not finished.is_set()  # 监听时没有串口也继续运行
+            engine.stop(wait=True)
+            assert finished.wait(timeout=5)
+        finally:
+            watcher.stop()
+            for board in boards:
+                board.stop()
+        assert engine.statistics.counts()['new_add'] == 2
@@ -14,8 +14,13 @@ DATA_LENGTH = slice(10, 14)  # 数据长度
 COMPONENT_ID = slice(14, 18)  # 组件id
 DATA = slice(18, -2)  # 数据
 CHECK_SUM = slice(-2, None, None)  # 校验和
+FRAME_HEAD = b'\x5a'  # 帧头字节
+FRAME_LENGTH_SIZE = 2  # payload长度字段字节数
+FRAME_CHECK_SUM_SIZE = 1  # 校验和字节数
 BoardProtocol = namedtuple('BoardProtocol', ['head', 'payload_length', 'payload_data', 'check_sum'])  # 上位机-开发板通信协议
 PayloadData = namedtuple('Payload', ['command', 'data_length', 'component_id', 'data'])  # payload组成
+ProtocolFrame = namedtuple('ProtocolFrame', ['command', 'component_id', 'data'])  # 字节形式的一帧: int, int, bytes
+LicenseIssue = namedtuple('LicenseIssue', ['row', 'hid', 'component_id', 'error'])  # license文件校验问题，row为excel行号
 
 
 class ProtocolCommand(Enum):
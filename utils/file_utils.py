@@ -1,51 +1,119 @@
 # -*- coding: utf-8 -*-
 import os
-import pandas as pd
 from pathlib import Path
+from threading import Lock
 
 from log import logger
+from utils.metrics import metrics
 
 
 HID_COLUMN_NAME = '设备HID'
 
 
-def store_HID(hids: list, file_path: Path):
-    """存储批量HID到本地"""
+JOURNAL_SUFFIX = '.journal'  # HID追加日志文件后缀，与记录文件同目录
+
 
-    hids_df = pd.DataFrame(columns=[HID_COLUMN_NAME], data=hids)
+class HIDJournal:
+    """
+    HID追加日志
+    每个HID追加一行并fsync，新增一条记录的开销与已记录数量无关；
+    需要时(如停止流程)再通过export合并到excel记录文件中
+    """
 
-    if file_path.exists():
-        df_ed = pd.read_excel(file_path, sheet_name='Sheet1')
-        hids_df = df_ed.append(hids_df)
-    with pd.ExcelWriter(file_path, mode='w', engine='openpyxl') as writer:
-        hids_df.to_excel(writer, index=False, sheet_name='Sheet1')
+    __locks = dict()  # 同一记录文件共用一把锁
+    __locks_guard = Lock()
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)  # excel记录文件
+        self.journal_path = Path(str(self.file_path) + JOURNAL_SUFFIX)
+        with self.__locks_guard:
+            self.__lock = self.__locks.setdefault(str(self.file_path.absolute()), Lock())
+
+    def append(self, hid: str) -> None:
+        """追加一个HID"""
+        self.extend([hid])
+
+    def extend(self, hids: list) -> None:
+        """追加一批HID，整批只做一次fsync"""
+        if not hids:
+            return
+        content = ''.join(f'{hid}\n' for hid in hids)
+        with self.__lock:
+            with open(self.journal_path, mode='a', encoding='utf-8') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self) -> list:
+        """读取追加日志中尚未导出的HID"""
+        if not self.journal_path.exists():
+            return []
+        with self.__lock:
+            with open(self.journal_path, mode='r', encoding='utf-8') as f:
+                return [line.strip() for line in f if line.strip()]
+
+    def export(self) -> int:
+        """
+        将追加日志合并到excel记录文件，合并成功后清空追加日志
+        Returns:
+            本次导出的HID个数
+        """
+        import pandas as pd  # 延迟导入，加快程序启动
+
+        with self.__lock:
+            if not self.journal_path.exists():
+                return 0
+            with open(self.journal_path, mode='r', encoding='utf-8') as f:
+                hids = [line.strip() for line in f if line.strip()]
+            if hids:
+                hids_df = pd.DataFrame(columns=[HID_COLUMN_NAME], data=hids)
+                if self.file_path.exists():
+                    df_ed = pd.read_excel(self.file_path, sheet_name='Sheet1', dtype=str)
+                    hids_df = pd.concat([df_ed, hids_df], ignore_index=True)
+                tmp_path = self.file_path.with_name(f'~{self.file_path.name}')
+                with pd.ExcelWriter(tmp_path, mode='w', engine='openpyxl') as writer:
+                    hids_df.to_excel(writer, index=False, sheet_name='Sheet1')
+                os.replace(tmp_path, self.file_path)
+            os.remove(self.journal_path)
+            logger.info(f'导出{len(hids)}个hid到{self.file_path}')
+            return len(hids)
 
 
-def record_HID_activated(hid: str, file_path: Path) -> None:  # TODO
+def store_HID(hids: list, file_path: Path):
+    """存储批量HID到本地"""
+    HIDJournal(file_path).extend(hids)
+
+
+@metrics.timed('record_hid')
+def record_HID_activated(hid: str, file_path: Path) -> None:
     """存储HID到指定本地文件"""
     logger.info(f'记录hid{hid}到{file_path}')
-    df = pd.DataFrame({HID_COLUMN_NAME: hid}, index=[0])
-    if file_path.exists():
-        df_ed = pd.read_excel(file_path, sheet_name='Sheet1')
-        df = df_ed.append(df)
-    with pd.ExcelWriter(file_path, mode='w', engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
+    HIDJournal(file_path).append(hid)
+
+
+@metrics.timed('export_hid')
+def export_HID(file_path: Path) -> int:
+    """将已记录但尚未写入excel的HID导出到file_path"""
+    return HIDJournal(file_path).export()
 
 
 def read_HID(file_path: str) -> list:
     """
-    读取file_path中的HID数据
+    读取file_path中的HID数据，包括尚未导出到excel的HID
     Args:
         file_path: str, hid.xlsx文件路径
 
     Returns:
 
     """
-    df_ed = pd.read_excel(file_path, sheet_name='Sheet1')
-    if HID_COLUMN_NAME in df_ed.columns:
-        hids = df_ed[HID_COLUMN_NAME].values.tolist()
-    else:
-        hids = []
+    import pandas as pd  # 延迟导入，加快程序启动
+
+    hids = []
+    if Path(file_path).exists():
+        df_ed = pd.read_excel(file_path, sheet_name='Sheet1', dtype=str)
+        if HID_COLUMN_NAME in df_ed.columns:
+            hids = df_ed[HID_COLUMN_NAME].values.tolist()
+    hids.extend(HIDJournal(file_path).read())
     return hids
 
 
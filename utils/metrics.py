@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+耗时统计：记录各阶段耗时(直方图)、重试次数和串口收发字节数，定期导出为Prometheus textfile或JSON
+用法:
+    with metrics.timer('get_hid'):
+        ...
+
+    @metrics.timed('record_hid')
+    def record_HID_activated(...):
+        ...
+"""
+import bisect
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from threading import Lock, Thread, Event
+
+# 直方图桶上限(秒)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_PREFIX = 'oneos_license'
+METRICS_EXPORT_INTERVAL = 10  # 定期导出间隔(秒)
+
+
+class Histogram:
+    """固定桶直方图，observe为O(log 桶数)，内存不随样本数增长"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)  # 最后一个为+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float):
+        """按桶估算分位数，返回所在桶的上限(超出最大桶时返回最大值)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for idx, counts in enumerate(self.bucket_counts):
+            cumulative += counts
+            if cumulative >= rank:
+                return min(self.buckets[idx], self.max) if idx < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                'mean': self.sum / self.count if self.count else None,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99),
+                'buckets': dict(zip([str(i) for i in self.buckets] + ['+Inf'], self.bucket_counts))}
+
+
+class Metrics:
+    """线程安全的指标记录"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.__lock = Lock()
+        self.__histograms = dict()  # {阶段: Histogram}
+        self.__counters = dict()  # {计数名: 值}
+
+    def observe(self, phase: str, seconds: float):
+        with self.__lock:
+            histogram = self.__histograms.get(phase)
+            if histogram is None:
+                histogram = self.__histograms[phase] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value=1):
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, phase: str):
+        """记录with块耗时，异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+
+    def timed(self, phase: str):
+        """记录函数耗时的装饰器"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(phase):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms = dict()
+            self.__counters = dict()
+
+    def snapshot(self) -> dict:
+        """
+        Returns:
+            {'phases': {阶段: {'count', 'sum', 'p50', ...}}, 'counters': {计数名: 值}}
+        """
+        with self.__lock:
+            return {'phases': {phase: histogram.to_dict() for phase, histogram in self.__histograms.items()},
+                    'counters': dict(self.__counters)}
+
+    def to_json(self) -> str:
+        snapshot = self.snapshot()
+        snapshot['time'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        return json.dumps(snapshot, indent=2, ensure_ascii=False)
+
+    def to_prometheus(self, prefix=METRICS_PREFIX) -> str:
+        """Prometheus textfile格式"""
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {prefix}_phase_seconds histogram']
+        for phase, histogram in snapshot['phases'].items():
+            cumulative = 0
+            for le, counts in histogram['buckets'].items():
+                cumulative += counts
+                lines.append(f'{prefix}_phase_seconds_bucket{{phase="{phase}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_phase_seconds_sum{{phase="{phase}"}} {histogram["sum"]}')
+            lines.append(f'{prefix}_phase_seconds_count{{phase="{phase}"}} {histogram["count"]}')
+        for name, value in snapshot['counters'].items():
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(f'{prefix}_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, file_path):
+        """导出到文件，.json后缀为JSON格式，否则为Prometheus textfile格式。先写临时文件再替换，避免读到不完整的内容"""
+        file_path = Path(file_path)
+        content = self.to_json() if file_path.suffix == '.json' else self.to_prometheus()
+        tmp_path = file_path.with_name(f'~{file_path.name}')
+        tmp_path.write_text(content, encoding='utf-8')
+        os.replace(tmp_path, file_path)
+
+    def summary(self, phases=None) -> list:
+        """各阶段耗时摘要，用于界面显示"""
+        snapshot = self.snapshot()
+        lines = []
+        for phase, histogram in snapshot['phases'].items():
+            if phases is not None and phase not in phases:
+                continue
+            lines.append(f'{phase}: {histogram["count"]}次 '
+                         f'p50 {histogram["p50"] * 1e3:.0f}ms p95 {histogram["p95"] * 1e3:.0f}ms')
+        counters = snapshot['counters']
+        if counters:
+            lines.append(' '.join(f'{name} {value}' for name, value in counters.items()))
+        return lines
+
+
+class MetricsExporter(Thread):
+    """定期将指标导出到文件"""
+
+    def __init__(self, metrics_: Metrics, file_path, interval=METRICS_EXPORT_INTERVAL):
+        super().__init__(name='metrics-exporter', daemon=True)
+        self.metrics = metrics_
+        self.file_path = file_path
+        self.interval = interval
+        self.__stop_event = Event()
+
+    def run(self):
+        while not self.__stop_event.wait(self.interval):
+            self.export()
+
+    def export(self):
+        try:
+            self.metrics.export(self.file_path)
+        except OSError:  # 文件被占用等，下次再导出
+            pass
+
+    def stop(self):
+        """停止并导出最后一次"""
+        self.__stop_event.set()
+        self.export()
+
+
+metrics = Metrics()
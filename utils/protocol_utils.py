@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*_
 # 同设备通信协议相关的解析方法和组装方法
 
+import struct
+
 from utils.entities import *
 from log import logger
+from utils.metrics import metrics
+
+
+FRAME_HEAD_STRUCT = struct.Struct('>BH')  # 帧头1 + payload长度2
+PAYLOAD_HEAD_STRUCT = struct.Struct('>HHH')  # 指令2 + 数据长度2 + 组件id2
+FRAME_MIN_SIZE = FRAME_HEAD_STRUCT.size + PAYLOAD_HEAD_STRUCT.size + FRAME_CHECK_SUM_SIZE  # 一帧最少10字节
+FRAME_HEAD_VALUE = FRAME_HEAD[0]
+FRAME_MAX_SIZE = FRAME_HEAD_STRUCT.size + 0xFFFF + FRAME_CHECK_SUM_SIZE  # payload长度为2字节
 
 
 class ProtocolHeadException(Exception):
@@ -48,6 +58,121 @@ def check_check_sum(payload_data, check_sum) -> bool:
     return True
 
 
+def encode_frame(data: bytes = b'', component_id: int = 0,
+                 command: int = int(ProtocolCommand.hid_request.value, 16)) -> bytes:
+    """
+    根据协议组装一帧字节数据
+    Args:
+        data: 需要传输的数据
+        component_id: 组件id eg: 0x03E8
+        command: 指令类型 eg: 0x0002
+
+    Returns:
+        帧头 + payload长度 + 指令 + 数据长度 + 组件id + 数据 + 校验和
+    """
+    try:
+        payload = PAYLOAD_HEAD_STRUCT.pack(command, len(data) + 2, component_id) + data
+        head = FRAME_HEAD_STRUCT.pack(FRAME_HEAD_VALUE, len(payload))
+    except struct.error as e:
+        raise ProtocolException(f'数据长度超出协议范围: {e}')
+    return head + payload + bytes((sum(payload) & 0xFF,))
+
+
+def decode_frame(buf) -> ProtocolFrame:
+    """
+    将一帧字节数据解析为ProtocolFrame，并校验帧头、长度和校验和
+    Args:
+        buf: bytes/bytearray/memoryview, 一帧完整数据
+
+    Returns:
+        ProtocolFrame
+    """
+    buf = memoryview(buf)
+    if len(buf) < FRAME_MIN_SIZE:
+        raise ProtocolException(f'信息长度小于{FRAME_MIN_SIZE}字节')
+    head, payload_length = FRAME_HEAD_STRUCT.unpack_from(buf)
+    if head != FRAME_HEAD_VALUE:
+        raise ProtocolHeadException(f'错误的帧头{head:02X}')
+    payload = buf[FRAME_HEAD_STRUCT.size:-FRAME_CHECK_SUM_SIZE]
+    if payload_length != len(payload):
+        raise ProtocolException('payload length校验不通过')
+    command, data_length, component_id = PAYLOAD_HEAD_STRUCT.unpack_from(payload)
+    if data_length != len(payload) - 4:  # 数据长度包含组件id的2个字节
+        raise ProtocolException('payload数据长度校验不通过')
+    if sum(payload) & 0xFF != buf[-1]:
+        raise ProtocolSumException('校验和校验不通过')
+    return ProtocolFrame(command, component_id, bytes(payload[PAYLOAD_HEAD_STRUCT.size:]))
+
+
+class FrameDecoder:
+    """
+    增量解析串口数据流：每次输入任意长度的数据，输出其中所有完整且校验通过的帧
+    遇到无效数据、长度或校验和错误时，从下一个0x5A帧头重新同步
+    缓冲区中最多保留一帧未收完的数据(不超过max_frame_size)
+    """
+
+    def __init__(self, max_frame_size=FRAME_MAX_SIZE):
+        self.max_frame_size = max_frame_size
+        self.dropped_bytes = 0  # 重新同步时丢弃的字节数
+        self.__buffer = bytearray()
+
+    def clear(self):
+        self.__buffer.clear()
+
+    def feed(self, data) -> list:
+        """
+        输入数据，返回解析出的ProtocolFrame列表
+        Args:
+            data: bytes/bytearray/memoryview
+
+        Returns:
+            [ProtocolFrame, ...]
+        """
+        return [frame for _, frame in self.__decode(data)]
+
+    def feed_raw(self, data) -> list:
+        """输入数据，返回解析出的完整帧原始字节列表"""
+        return [raw for raw, _ in self.__decode(data)]
+
+    def __drop(self, size):
+        del self.__buffer[:size]
+        self.dropped_bytes += size
+
+    def __decode(self, data) -> list:
+        buffer = self.__buffer
+        buffer += data
+        frames = []
+        while buffer:
+            idx = buffer.find(FRAME_HEAD_VALUE)
+            if idx < 0:
+                self.__drop(len(buffer))
+                break
+            if idx > 0:
+                self.__drop(idx)
+            if len(buffer) < FRAME_HEAD_STRUCT.size + 4:  # 帧头、payload长度、指令、数据长度
+                break
+            _, payload_length = FRAME_HEAD_STRUCT.unpack_from(buffer)
+            data_length = int.from_bytes(buffer[5:7], 'big')
+            frame_size = FRAME_HEAD_STRUCT.size + payload_length + FRAME_CHECK_SUM_SIZE
+            if data_length != payload_length - 4 or payload_length < PAYLOAD_HEAD_STRUCT.size \
+                    or frame_size > self.max_frame_size:
+                self.__drop(1)  # 不是真正的帧头
+                continue
+            if len(buffer) < frame_size:
+                break
+            raw = bytes(buffer[:frame_size])
+            try:
+                frame = decode_frame(raw)
+            except (ProtocolHeadException, ProtocolException, ProtocolSumException) as e:
+                logger.warning(f'丢弃无效帧 {raw.hex()}: {e}')
+                self.__drop(1)
+                continue
+            del buffer[:frame_size]
+            frames.append((raw, frame))
+        return frames
+
+
+@metrics.timed('parse_protocol')
 def parse_protocol(protocol_value: str):
     """
     将一条协议信息，解析为具体的帧头、长度、payload、校验和
@@ -57,69 +182,40 @@ def parse_protocol(protocol_value: str):
     Returns:
         board_protocol
     """
-    logger.info(f'parse protocol: {protocol_value}')
-    protocol_value = protocol_value.lower()
-    if protocol_value.startswith('0x'):
-        protocol_value = protocol_value.strip('0x')
-
-    # 一条信息长度最小为10字节(帧头1长度2指令2长度2组件id2数据0校验和1)
-    if len(protocol_value) < 20:
-        raise ProtocolException(f'信息长度小于10字节')
-    head = protocol_value[HEAD].upper()
-    payload_length = protocol_value[PAYLOAD_LENGTH].upper()
-    payload_data_ = protocol_value[PAYLOAD_DATA_].upper()
-    command = protocol_value[COMMAND].upper()
-    data_length = protocol_value[DATA_LENGTH].upper()
-    component_id = protocol_value[COMPONENT_ID].upper()
-    data = protocol_value[DATA].upper()
-    check_sum = protocol_value[CHECK_SUM].upper()
-
-    if not check_head(head):
-        raise ProtocolHeadException(f'错误的帧头{head}')
-    if not check_data_length(payload_length, payload_data_):
-        raise ProtocolException('payload length校验不通过')
-    if not check_data_length(data_length, component_id + data):
-        raise ProtocolException('payload数据长度校验不通过')
-    if not check_check_sum(payload_data_, check_sum):
-        print(payload_data_, check_sum)
-        raise ProtocolSumException('校验和校验不通过')
-    payload_data = PayloadData(command, data_length, component_id, data)
-    board_protocol = BoardProtocol(head, payload_length, payload_data, check_sum)
+    logger.info('parse protocol: %s', protocol_value)
+    if protocol_value[:2] in ('0x', '0X'):
+        protocol_value = protocol_value[2:]
+    try:
+        buf = bytes.fromhex(protocol_value)
+    except ValueError as e:
+        raise ProtocolException(f'非法的十六进制数据: {e}')
+    frame = decode_frame(buf)
+    payload_length = len(buf) - FRAME_HEAD_STRUCT.size - FRAME_CHECK_SUM_SIZE
+    payload_data = PayloadData(f'{frame.command:04X}', f'{len(frame.data) + 2:04X}',
+                               f'{frame.component_id:04X}', frame.data.hex().upper())
+    board_protocol = BoardProtocol(f'{buf[0]:02X}', f'{payload_length:04X}', payload_data, f'{buf[-1]:02X}')
     return board_protocol
 
 
 def assemble_fixedlength_data(data, length, padding='0'):
     """填充数据为指定长度"""
-    data = data.lstrip('0x')
-    if len(data) >= length:
-        return data
-    while len(data) < length:
-        data = padding + data
-    return data
+    return data.lstrip('0x').rjust(length, padding)
 
 
 def calc_check_sum(data: str) -> str:
     """
     计算校验和
     Args:
-        data:
+        data: 十六进制字符串
 
     Returns:
 
     """
-    res = 0
-    start_idx = 0
-    for i in range(2, len(data) + 1, 2):
-        res += int(data[start_idx:i], 16)
-        start_idx = i
-
-    temp_ret = hex(res)
-    ret = temp_ret[-2:].replace('x', '0')
-    return ret.upper()
+    return f'{sum(bytes.fromhex(data)) & 0xFF:02X}'
 
 
 def build_protocol(data, component_id='0000', command=ProtocolCommand.hid_request.value,
-                   head='5a') -> bytes:
+                   head='5a') -> str:
     """
     根据协议以及关键信息，组装一条数据包
     Args:
@@ -131,12 +227,10 @@ def build_protocol(data, component_id='0000', command=ProtocolCommand.hid_reques
     Returns:
         数据包
     """
-    data_length = assemble_fixedlength_data(hex(len(component_id+data) // 2), 4)  # 计算数据长度，组装为2个字节
-    payload_data = command + data_length + component_id + data
-    payload_data_length = assemble_fixedlength_data(hex(len(payload_data) // 2), 4)  # 负载长度，组装为2个字节
-    check_num = calc_check_sum(payload_data)
-    protocol_package = head + payload_data_length + command + data_length + component_id + data + check_num
-    return protocol_package
+    if int(head, 16) != FRAME_HEAD_VALUE:
+        raise ProtocolHeadException(f'错误的帧头{head}')
+    frame = encode_frame(bytes.fromhex(data), int(component_id, 16), int(command, 16))
+    return frame.hex()
 
 
 def check_payload(payload, command_type: str) -> bool:
@@ -159,3 +253,20 @@ def check_payload(payload, command_type: str) -> bool:
         return True
     else:
         return False
+
+
+def check_frame(frame: ProtocolFrame, command_type: str) -> bool:
+    """
+    验证字节形式的一帧是否为command_type的成功响应
+    Args:
+        frame: ProtocolFrame
+        command_type: ProtocolCommand.
+
+    Returns:
+
+    """
+    if not hasattr(ProtocolCommand, command_type):
+        raise ProtocolCommandException
+
+    excepted_command = int(getattr(ProtocolCommand, command_type).value, 16)
+    return frame.command == excepted_command and frame.data == bytes.fromhex(DataError.LICENSE_PROCESS_OK.value)
@@ -1,10 +1,111 @@
 # -*- coding: utf-8 -*-
 # 记录错误的装饰器
+import random
 import time
+from contextvars import ContextVar
 from functools import wraps
 
+from utils.metrics import metrics
 
-def retry(logger=None, tries=3, delay=2, backoff=2):
+# 当前线程中正在执行的最外层重试的截止时间(time.monotonic())，没有重试时为None
+# 嵌套的重试共用最外层的次数和截止时间，内层只执行一次，异常交给外层处理
+_active_deadline = ContextVar('retry_deadline', default=None)
+_NO_DEADLINE = float('inf')
+
+
+def retry_remaining():
+    """
+    当前重试剩余的时间(秒)，用于限制重试中的阻塞等待(如读串口超时)
+    Returns:
+        剩余秒数；不在重试中或没有设置截止时间时返回None
+    """
+    deadline = _active_deadline.get()
+    if deadline is None or deadline == _NO_DEADLINE:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
+class RetryPolicy:
+    """
+    重试策略
+    Args:
+        tries: 最多执行次数
+        delay: 第一次重试前的等待时间(秒)
+        backoff: 每次重试等待时间的倍数
+        max_delay: 单次等待时间上限(秒)，None为不限制
+        deadline: 从第一次执行开始的总时长上限(秒)，超过后不再重试，None为不限制
+        jitter: 等待时间的随机浮动比例，如0.1为±10%
+        retry_on: 需要重试的异常类型，其它异常直接抛出
+        giveup_on: 不重试的异常类型，优先于retry_on
+        logger: 记录重试过程的Logger
+    """
+
+    def __init__(self, tries=3, delay=2, backoff=2, max_delay=None, deadline=None, jitter=0.0,
+                 retry_on=(Exception,), giveup_on=(), logger=None):
+        self.tries = tries
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.jitter = jitter
+        self.retry_on = tuple(retry_on)
+        self.giveup_on = tuple(giveup_on)
+        self.logger = logger
+
+    def replace(self, **overrides):
+        """返回修改了部分参数的新策略"""
+        options = dict(vars(self))
+        options.update(overrides)
+        return RetryPolicy(**options)
+
+    def if_retryable(self, e: Exception) -> bool:
+        return isinstance(e, self.retry_on) and not isinstance(e, self.giveup_on)
+
+    def call(self, func, *args, **kwargs):
+        """按策略执行func"""
+        if _active_deadline.get() is not None:  # 已经在外层重试中，只执行一次
+            return func(*args, **kwargs)
+        deadline = _NO_DEADLINE if self.deadline is None else time.monotonic() + self.deadline
+        token = _active_deadline.set(deadline)
+        try:
+            mtries, mdelay = self.tries, self.delay
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    mtries -= 1
+                    wait = self.__wait_time(mdelay)
+                    if mtries <= 0 or not self.if_retryable(e) or time.monotonic() + wait >= deadline:
+                        if self.logger:
+                            self.logger.error(e)
+                        raise
+                    if self.logger:
+                        self.logger.warning(f'{e}, Retring in {wait:.2f} seconds...')
+                metrics.inc('retries')
+                time.sleep(wait)
+                mdelay *= self.backoff
+        finally:
+            _active_deadline.reset(token)
+
+    def __wait_time(self, delay):
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(delay, 0)
+
+    def __call__(self, func):
+        """
+        作为装饰器使用，调用时可以通过关键字参数retry_policy临时指定策略
+            board.get_HID(retry_policy=policy.replace(tries=1))
+        """
+        @wraps(func)
+        def wrapper(*args, retry_policy=None, **kwargs):
+            return (retry_policy or self).call(func, *args, **kwargs)
+        return wrapper
+
+
+def retry(logger=None, tries=3, delay=2, backoff=2, **options):
     """
     Decorator that catches exceptions and automatically retry
     Args:
@@ -12,30 +113,9 @@ def retry(logger=None, tries=3, delay=2, backoff=2):
         tries: max retry times
         delay: time interval of first retry
         backoff:
+        options: RetryPolicy的其它参数，如deadline、jitter、retry_on
 
     Returns:
 
     """
-
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            mtries, mdelay = tries, delay
-            while mtries > 0:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    msg = f'{e}, Retring in {mdelay} seconds...'
-                    if logger:
-                        if mtries > 1:
-                            logger.warning(msg)
-                        else:
-                            logger.error(e)
-                            raise e
-                    else:
-                        raise e
-                time.sleep(mdelay)
-                mtries -= 1
-                mdelay *= backoff
-        return wrapper
-    return decorator
\ No newline at end of file
+    return RetryPolicy(tries=tries, delay=delay, backoff=backoff, logger=logger, **options)